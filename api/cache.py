@@ -0,0 +1,48 @@
+import time
+from collections import OrderedDict
+from typing import Any, Hashable
+
+from api.metrics import Counter
+
+
+class TTLCache:
+    def __init__(self, name: str, maxsize: int, ttl: float):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._entries: OrderedDict[Hashable, tuple[float, Any]] = OrderedDict()
+        self.hits = Counter(f"{name}_cache_hits_total", f"{name} cache hits")
+        self.misses = Counter(f"{name}_cache_misses_total", f"{name} cache misses")
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        entry = self._entries.get(key)
+        if entry is None:
+            self.misses.inc()
+            return default
+
+        expires_at, value = entry
+        if expires_at <= time.monotonic():
+            del self._entries[key]
+            self.misses.inc()
+            return default
+
+        self._entries.move_to_end(key)
+        self.hits.inc()
+        return value
+
+    def set(self, key: Hashable, value: Any, ttl: float | None = None):
+        ttl = self.ttl if ttl is None else min(ttl, self.ttl)
+        if ttl <= 0 or self.maxsize <= 0:
+            return
+        self._entries[key] = (time.monotonic() + ttl, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+
+    def invalidate(self, key: Hashable):
+        self._entries.pop(key, None)
+
+    def clear(self):
+        self._entries.clear()
+
+    def __len__(self) -> int:
+        return len(self._entries)
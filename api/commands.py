@@ -0,0 +1,112 @@
+import argparse
+import asyncio
+import logging
+
+import sqlalchemy
+
+from api import statements
+from api.database import database, engine, like_table, post_table
+from api.logging_conf import (
+    configure_logging,
+    start_log_listener,
+    stop_log_listener,
+)
+from api.migrations import migrate
+from api.search import REBUILD_SEARCH_INDEX, SEARCH_TABLE
+from api.tasks import close_http_client, send_email_to_users
+
+logger = logging.getLogger(__name__)
+
+
+async def reconcile_like_counts() -> int:
+    actual_likes = (
+        sqlalchemy.select(sqlalchemy.func.count(like_table.c.id))
+        .where(like_table.c.post_id == post_table.c.id)
+        .scalar_subquery()
+    )
+    query = (
+        post_table.update()
+        .where(post_table.c.like_count != actual_likes)
+        .values(
+            like_count=actual_likes,
+            version=post_table.c.version + 1,
+            updated_at=statements.now
+        )
+        .returning(post_table.c.id)
+    )
+    fixed = await database.fetch_all(query)
+    if fixed:
+        # cached feeds and posts showing the old counts must revalidate
+        await database.execute(statements.bump_change_counter(name="likes"))
+    logger.info(f"Reconciled like counts for {len(fixed)} posts")
+    return len(fixed)
+
+
+async def rebuild_search_index() -> int:
+    # for an index that drifted, e.g. after rows were loaded with the
+    # triggers missing; migration 5 already indexes existing rows
+    async with database.transaction():
+        for statement in REBUILD_SEARCH_INDEX:
+            await database.execute(sqlalchemy.text(statement))
+    indexed = await database.fetch_val(sqlalchemy.text(f"SELECT count(*) FROM {SEARCH_TABLE}"))
+    logger.info(f"Rebuilt the search index with {indexed} posts and comments")
+    return indexed
+
+
+async def migrate_schema() -> int:
+    version = migrate(engine)
+    logger.info(f"Database schema is at version {version}")
+    return version
+
+
+async def email_users(subject: str, body: str) -> int:
+    # body and subject may use %recipient.id% and %recipient.email%
+    accepted = failed = 0
+    async for result in send_email_to_users(subject, body):
+        if result.accepted:
+            accepted += 1
+        else:
+            failed += 1
+    logger.info(f"Mailgun accepted the email for {accepted} users, {failed} failed")
+    return accepted
+
+
+COMMANDS = {
+    "email-users": email_users,
+    "migrate": migrate_schema,
+    "reconcile-likes": reconcile_like_counts,
+    "rebuild-search-index": rebuild_search_index,
+}
+
+
+async def run(command: str, **options):
+    await database.connect()
+    try:
+        await COMMANDS[command](**options)
+    finally:
+        await close_http_client()
+        await database.disconnect()
+
+
+def main(argv: list[str] | None = None):
+    parser = argparse.ArgumentParser(prog="python -m api.commands")
+    parser.add_argument("command", choices=sorted(COMMANDS))
+    parser.add_argument("--subject", help="subject line for email-users")
+    parser.add_argument("--body", help="message text for email-users")
+    args = parser.parse_args(argv)
+    options = {}
+    if args.command == "email-users":
+        if args.subject is None or args.body is None:
+            parser.error("email-users needs --subject and --body")
+        options = {"subject": args.subject, "body": args.body}
+
+    configure_logging()
+    start_log_listener()
+    try:
+        asyncio.run(run(args.command, **options))
+    finally:
+        stop_log_listener()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,56 @@
+from email.utils import formatdate, parsedate_to_datetime
+
+from fastapi.responses import Response
+from starlette.datastructures import Headers
+
+from api.config import config
+
+
+def make_etag(*parts) -> str:
+    return '"' + "-".join(str(part) for part in parts) + '"'
+
+
+def cache_control() -> str:
+    # browsers revalidate after max-age; a CDN or proxy can keep serving the
+    # response for s-maxage, then revalidates with If-None-Match, which costs
+    # us one primary key lookup
+    return (
+        f"public, max-age={config.HTTP_CACHE_MAX_AGE_SECONDS}, "
+        f"s-maxage={config.HTTP_CACHE_S_MAXAGE_SECONDS}"
+    )
+
+
+def cache_headers(etag: str, last_modified: float | None) -> dict[str, str]:
+    headers = {"ETag": etag, "Cache-Control": cache_control()}
+    if last_modified is not None:
+        headers["Last-Modified"] = formatdate(last_modified, usegmt=True)
+    return headers
+
+
+def etag_matches(if_none_match: str, etag: str) -> bool:
+    if if_none_match.strip() == "*":
+        return True
+    # weak comparison: W/"x" and "x" are the same representation for a GET
+    candidates = (candidate.strip().removeprefix("W/") for candidate in if_none_match.split(","))
+    return etag.removeprefix("W/") in candidates
+
+
+def is_not_modified(headers: Headers, etag: str, last_modified: float | None) -> bool:
+    if_none_match = headers.get("if-none-match")
+    if if_none_match is not None:
+        # when both are sent, If-Modified-Since is ignored (RFC 9110 13.1.3)
+        return etag_matches(if_none_match, etag)
+
+    if_modified_since = headers.get("if-modified-since")
+    if if_modified_since is None or last_modified is None:
+        return False
+    try:
+        since = parsedate_to_datetime(if_modified_since).timestamp()
+    except (TypeError, ValueError):
+        return False
+    # HTTP dates have whole-second resolution
+    return int(last_modified) <= since
+
+
+def not_modified_response(headers: dict[str, str]) -> Response:
+    return Response(status_code=304, headers=headers)
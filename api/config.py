@@ -18,6 +18,75 @@ class GlobalConfig(BaseConfig):
     DB_FORCE_ROLL_BACK: bool=False
     MAILGUN_API_KEY: Optional[str] = None
     MAILGUN_DOMAIN: Optional[str] = None
+    MAILGUN_API_URL: str = "https://api.mailgun.net/v3"
+    MAILGUN_TIMEOUT_SECONDS: float = 10
+    MAILGUN_MAX_CONNECTIONS: int = 20
+    MAILGUN_MAX_KEEPALIVE_CONNECTIONS: int = 10
+    # needs the h2 package (pip install httpx[http2])
+    MAILGUN_HTTP2: bool = False
+    EMAIL_OUTBOX_BATCH_SIZE: int = 50
+    EMAIL_OUTBOX_CONCURRENCY: int = 10
+    EMAIL_OUTBOX_POLL_INTERVAL_SECONDS: float = 1
+    EMAIL_OUTBOX_MAX_ATTEMPTS: int = 8
+    EMAIL_OUTBOX_BACKOFF_SECONDS: float = 5
+    EMAIL_OUTBOX_MAX_BACKOFF_SECONDS: float = 3600
+    # a row stuck in "sending" this long (worker crashed) is claimed again
+    EMAIL_OUTBOX_LEASE_SECONDS: float = 300
+    # the first scheme hashes new passwords, the rest are only verified and
+    # get upgraded on the next successful login
+    PASSWORD_HASH_SCHEMES: list[str] = ["bcrypt"]
+    BCRYPT_ROUNDS: int = 12
+    ARGON2_TIME_COST: int = 2
+    ARGON2_MEMORY_COST: int = 19456
+    ARGON2_PARALLELISM: int = 1
+    PASSWORD_HASH_WORKERS: int = 4
+    PASSWORD_HASH_MAX_PENDING: int = 64
+    USER_CACHE_SIZE: int = 10_000
+    USER_CACHE_TTL_SECONDS: float = 30
+    # "jose" (python-jose) or "pyjwt" (needs PyJWT installed)
+    JWT_BACKEND: str = "jose"
+    TOKEN_CACHE_SIZE: int = 10_000
+    # queries at least this slow are logged at WARNING on api.sql.slow
+    SLOW_QUERY_THRESHOLD_SECONDS: float = 0.5
+    # adds "Server-Timing: db;dur=..;desc=\"N queries\"" to every response
+    SERVER_TIMING_ENABLED: bool = True
+    # one statement running this many times in a request logs an N+1 warning
+    N_PLUS_ONE_THRESHOLD: int = 5
+    # Cache-Control on the post read endpoints; shared caches revalidate with
+    # the ETag once s-maxage is up
+    HTTP_CACHE_MAX_AGE_SECONDS: int = 0
+    HTTP_CACHE_S_MAXAGE_SECONDS: int = 5
+    # server-side cache of the first feed page per sort order and of posts;
+    # "memory" is per worker (other workers only notice a write once their
+    # copy expires), "redis" is shared and needs the redis package
+    RESPONSE_CACHE_BACKEND: str = "memory"
+    RESPONSE_CACHE_REDIS_URL: Optional[str] = None
+    RESPONSE_CACHE_SIZE: int = 10_000
+    # 0 disables the cache
+    RESPONSE_CACHE_TTL_SECONDS: float = 5
+    # how long an expired entry is still served while it is rebuilt
+    RESPONSE_CACHE_STALE_SECONDS: float = 30
+    # token buckets on /token and /register, per client IP and per email;
+    # "memory" is per worker, "redis" is shared and needs the redis package
+    RATE_LIMIT_ENABLED: bool = True
+    RATE_LIMIT_STORE: str = "memory"
+    RATE_LIMIT_REDIS_URL: Optional[str] = None
+    RATE_LIMIT_SIZE: int = 100_000
+    RATE_LIMIT_IP_BURST: int = 20
+    RATE_LIMIT_IP_PER_MINUTE: float = 20
+    RATE_LIMIT_EMAIL_BURST: int = 5
+    RATE_LIMIT_EMAIL_PER_MINUTE: float = 5
+    # with several uvicorn workers, point this at a directory shared by all of
+    # them (and emptied on deploy) so /metrics reports totals across workers
+    METRICS_DIR: Optional[str] = None
+    METRICS_FLUSH_INTERVAL_SECONDS: float = 5
+    EVENT_LOOP_LAG_INTERVAL_SECONDS: float = 0.5
+    # requests sending "X-Profile: <PROFILING_TOKEN>" are profiled; when
+    # disabled the middleware isn't installed at all
+    PROFILING_ENABLED: bool = False
+    PROFILING_TOKEN: Optional[str] = None
+    PROFILING_DIR: str = "profiles"
+    PROFILING_INTERVAL_SECONDS: float = 0.001
 
 class DevConfig(GlobalConfig):
     model_config = {
@@ -28,6 +97,11 @@ class DevConfig(GlobalConfig):
 class TestConfig(GlobalConfig):
     DATABASE_URL: Optional[str] = 'sqlite:///test.db' 
     DB_FORCE_ROLL_BACK: bool = True
+    BCRYPT_ROUNDS: int = 4
+    # tests write rows directly; opt in where the cache is under test
+    RESPONSE_CACHE_TTL_SECONDS: float = 0
+    # every test client shares one IP; opt in where the limiter is under test
+    RATE_LIMIT_ENABLED: bool = False
     model_config = {
         "env_prefix": "TEST_",
         
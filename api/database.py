@@ -1,7 +1,15 @@
+import logging
+import time
+from contextlib import asynccontextmanager
+
 import databases
 import sqlalchemy
 
 from api.config import config
+from api.query_logging import log_query
+from api.search import SearchIndexConnection
+
+logger = logging.getLogger(__name__)
 
 metadata = sqlalchemy.MetaData()
 
@@ -10,7 +18,19 @@ post_table = sqlalchemy.Table(
     metadata,
     sqlalchemy.Column('id', sqlalchemy.Integer, primary_key=True),
     sqlalchemy.Column('body', sqlalchemy.String),
-    sqlalchemy.Column('user_id', sqlalchemy.ForeignKey('users.id'), nullable=False)
+    sqlalchemy.Column('user_id', sqlalchemy.ForeignKey('users.id'), nullable=False),
+    sqlalchemy.Column(
+        'like_count', sqlalchemy.Integer, nullable=False, server_default='0'
+    ),
+    # bumped by every write that changes the post or its comments; with
+    # updated_at (unix time) it is what the read endpoints' ETags are made of
+    sqlalchemy.Column('version', sqlalchemy.Integer, nullable=False, server_default='0'),
+    sqlalchemy.Column('updated_at', sqlalchemy.Float),
+    # keyset index for the most_liked feed
+    sqlalchemy.Index('ix_posts_like_count_id', 'like_count', 'id'),
+    # per-user listings walk these newest first, from a cursor; the same
+    # shape on comments and likes
+    sqlalchemy.Index('ix_posts_user_id_id', 'user_id', sqlalchemy.desc('id'))
 )
 
 comment_table = sqlalchemy.Table(
@@ -19,7 +39,9 @@ comment_table = sqlalchemy.Table(
     sqlalchemy.Column('id', sqlalchemy.Integer, primary_key=True),
     sqlalchemy.Column('body', sqlalchemy.String),
     sqlalchemy.Column('post_id', sqlalchemy.ForeignKey('posts.id'), nullable=False),
-    sqlalchemy.Column('user_id', sqlalchemy.ForeignKey('users.id'), nullable=False)
+    sqlalchemy.Column('user_id', sqlalchemy.ForeignKey('users.id'), nullable=False),
+    sqlalchemy.Index('ix_comments_post_id', 'post_id'),
+    sqlalchemy.Index('ix_comments_user_id_id', 'user_id', sqlalchemy.desc('id'))
 )
 
 like_table = sqlalchemy.Table(
@@ -27,7 +49,10 @@ like_table = sqlalchemy.Table(
     metadata,
     sqlalchemy.Column('id', sqlalchemy.Integer, primary_key=True),
     sqlalchemy.Column('post_id', sqlalchemy.ForeignKey('posts.id'), nullable=False),
-    sqlalchemy.Column('user_id', sqlalchemy.ForeignKey('users.id'), nullable=False)
+    sqlalchemy.Column('user_id', sqlalchemy.ForeignKey('users.id'), nullable=False),
+    # a user can like a post once; also serves every lookup by post_id
+    sqlalchemy.Index('uq_likes_post_id_user_id', 'post_id', 'user_id', unique=True),
+    sqlalchemy.Index('ix_likes_user_id_id', 'user_id', sqlalchemy.desc('id'))
 )
 
 user_table = sqlalchemy.Table(
@@ -39,13 +64,109 @@ user_table = sqlalchemy.Table(
     sqlalchemy.Column('confirmed', sqlalchemy.Boolean, default=False)
 )
 
+# One row per listing-wide change signal ("posts": a post was added,
+# "likes": a like count changed), for the feed's ETag.
+change_counter_table = sqlalchemy.Table(
+    'change_counters',
+    metadata,
+    sqlalchemy.Column('name', sqlalchemy.String, primary_key=True),
+    sqlalchemy.Column('value', sqlalchemy.Integer, nullable=False, server_default='0'),
+    sqlalchemy.Column('changed_at', sqlalchemy.Float)
+)
+
+email_outbox_table = sqlalchemy.Table(
+    'email_outbox',
+    metadata,
+    sqlalchemy.Column('id', sqlalchemy.Integer, primary_key=True),
+    sqlalchemy.Column('recipient', sqlalchemy.String, nullable=False),
+    sqlalchemy.Column('subject', sqlalchemy.String, nullable=False),
+    sqlalchemy.Column('body', sqlalchemy.String, nullable=False),
+    # pending -> sending -> sent, or back to pending for a retry, or dead
+    sqlalchemy.Column('status', sqlalchemy.String, nullable=False, server_default='pending'),
+    sqlalchemy.Column('attempts', sqlalchemy.Integer, nullable=False, server_default='0'),
+    # unix timestamps
+    sqlalchemy.Column('next_attempt_at', sqlalchemy.Float, nullable=False),
+    sqlalchemy.Column('claimed_at', sqlalchemy.Float),
+    sqlalchemy.Column('created_at', sqlalchemy.Float, nullable=False),
+    sqlalchemy.Column('last_error', sqlalchemy.String),
+    sqlalchemy.Index('ix_email_outbox_status_next_attempt_at', 'status', 'next_attempt_at')
+)
+
 engine = sqlalchemy.create_engine(
    config.DATABASE_URL, 
    connect_args={'check_same_thread': False}
 )
 
-metadata.create_all(engine)
 
-database = databases.Database(
-    config.DATABASE_URL, force_rollback=config.DB_FORCE_ROLL_BACK
-)
\ No newline at end of file
+class ObservedDatabase(databases.Database):
+    # Every query run through the database is reported to the observers as
+    # observer(query, values, elapsed_seconds, error) once it finishes.
+
+    def __init__(self, url: str, **options):
+        super().__init__(url, **options)
+        self.query_observers = []
+
+    def add_query_observer(self, observer):
+        self.query_observers.append(observer)
+
+    def remove_query_observer(self, observer):
+        self.query_observers.remove(observer)
+
+    @asynccontextmanager
+    async def observe(self, query, values):
+        error = None
+        started = time.perf_counter()
+        try:
+            yield
+        except BaseException as e:
+            error = e
+            raise
+        finally:
+            elapsed = time.perf_counter() - started
+            for observer in self.query_observers:
+                try:
+                    observer(query, values, elapsed, error)
+                except Exception:
+                    logger.exception("Query observer failed")
+
+    async def fetch_all(self, query, values=None):
+        async with self.observe(query, values):
+            return await super().fetch_all(query, values)
+
+    async def fetch_one(self, query, values=None):
+        async with self.observe(query, values):
+            return await super().fetch_one(query, values)
+
+    async def fetch_val(self, query, values=None, column=0):
+        async with self.observe(query, values):
+            return await super().fetch_val(query, values, column=column)
+
+    async def execute(self, query, values=None):
+        async with self.observe(query, values):
+            return await super().execute(query, values)
+
+    async def execute_many(self, query, values):
+        async with self.observe(query, None):
+            return await super().execute_many(query, values)
+
+    async def iterate(self, query, values=None):
+        # the elapsed time covers the whole stream, including the consumer
+        async with self.observe(query, values):
+            async for record in super().iterate(query, values):
+                yield record
+
+
+def connection_options(url: str) -> dict:
+    # passed through to the driver's connect() for every connection; the
+    # factory is a sqlite3.Connection and other drivers would reject it
+    if sqlalchemy.engine.make_url(url).get_backend_name() == "sqlite":
+        return {"factory": SearchIndexConnection}
+    return {}
+
+
+database = ObservedDatabase(
+    config.DATABASE_URL,
+    force_rollback=config.DB_FORCE_ROLL_BACK,
+    **connection_options(config.DATABASE_URL)
+)
+database.add_query_observer(log_query)
\ No newline at end of file
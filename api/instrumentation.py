@@ -0,0 +1,142 @@
+import asyncio
+import logging
+import time
+
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from api.metrics import Counter, Gauge, Histogram, write_snapshot
+
+logger = logging.getLogger(__name__)
+
+RESPONSE_SIZE_BUCKETS = (100, 1_000, 10_000, 100_000, 1_000_000, 10_000_000)
+EVENT_LOOP_LAG_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0)
+
+http_requests_total = Counter(
+    "http_requests_total",
+    "HTTP requests by route and status code",
+    labelnames=("method", "route", "status")
+)
+http_request_duration_seconds = Histogram(
+    "http_request_duration_seconds",
+    "Time from receiving an HTTP request to sending the last response byte",
+    labelnames=("method", "route")
+)
+http_response_size_bytes = Histogram(
+    "http_response_size_bytes",
+    "HTTP response body sizes",
+    buckets=RESPONSE_SIZE_BUCKETS,
+    labelnames=("method", "route")
+)
+http_requests_in_progress = Gauge(
+    "http_requests_in_progress",
+    "HTTP requests currently being handled"
+)
+db_query_duration_seconds = Histogram(
+    "db_query_duration_seconds",
+    "Database query execution time"
+)
+db_query_errors_total = Counter(
+    "db_query_errors_total",
+    "Database queries that raised an error"
+)
+event_loop_lag_seconds = Histogram(
+    "event_loop_lag_seconds",
+    "How late the event loop woke up a sleeping task",
+    buckets=EVENT_LOOP_LAG_BUCKETS
+)
+
+
+def route_template(scope: Scope) -> str:
+    # the path template, never the raw path, so ids don't explode cardinality
+    route = scope.get("route")
+    if route is None:
+        return "unmatched"
+    # newer FastAPI keeps included routers nested, so the matched route only
+    # knows its own path; the effective route has the prefixed one
+    effective_route = scope.get("fastapi", {}).get("effective_route_context")
+    if effective_route is not None:
+        return effective_route.path
+    return getattr(route, "path_format", None) or getattr(route, "path", "unmatched")
+
+
+class MetricsMiddleware:
+    # plain ASGI instead of BaseHTTPMiddleware: no extra task per request and
+    # streaming responses pass straight through
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        status_code = 500
+        response_size = 0
+
+        async def send_wrapper(message: Message):
+            nonlocal status_code, response_size
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            elif message["type"] == "http.response.body":
+                response_size += len(message.get("body", b""))
+            await send(message)
+
+        http_requests_in_progress.inc()
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            elapsed = time.perf_counter() - started
+            http_requests_in_progress.dec()
+            method = scope["method"]
+            route = route_template(scope)
+            http_requests_total.labels(method, route, status_code).inc()
+            http_request_duration_seconds.labels(method, route).observe(elapsed)
+            http_response_size_bytes.labels(method, route).observe(response_size)
+
+
+def observe_query(query, values, elapsed: float, error: BaseException | None):
+    db_query_duration_seconds.observe(elapsed)
+    if error is not None:
+        db_query_errors_total.inc()
+
+
+class MetricsMonitor:
+    # Samples event loop lag and, with a metrics directory, writes this
+    # process's snapshot there for the other workers' /metrics to merge.
+    def __init__(self, interval: float, flush_interval: float, directory: str | None):
+        self.interval = interval
+        self.flush_interval = flush_interval
+        self.directory = directory
+        self._task: asyncio.Task | None = None
+
+    def start(self):
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is None:
+            return
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+        if self.directory is not None:
+            write_snapshot(self.directory, live=False)
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        last_flush = loop.time()
+        while True:
+            expected = loop.time() + self.interval
+            await asyncio.sleep(self.interval)
+            now = loop.time()
+            event_loop_lag_seconds.observe(max(0.0, now - expected))
+
+            if self.directory is not None and now - last_flush >= self.flush_interval:
+                last_flush = now
+                try:
+                    write_snapshot(self.directory)
+                except OSError:
+                    logger.exception("Failed to write metrics snapshot")
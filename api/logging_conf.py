@@ -1,5 +1,7 @@
 import logging
+import queue
 from logging.config import dictConfig
+from logging.handlers import QueueHandler, QueueListener
 
 from api.config import DevConfig, config
 
@@ -17,7 +19,48 @@ class EmailObfuscationFilter(logging.Filter):
         if 'email' in record.__dict__:
             record.email = obfuscated(record.email, self.obfuscated_length)
 
+# Loggers only enqueue records; the slow handlers (terminal rendering, file
+# writes and rotation) run on the listener thread, off the event loop.
+# The sink handlers hang off a private logger nothing logs to, because
+# dictConfig can't wire a QueueListener before Python 3.12.
+SINK_LOGGER = "api.logging_sink"
+
+log_queue: queue.SimpleQueue = queue.SimpleQueue()
+log_listener: QueueListener | None = None
+
+def start_log_listener()-> None:
+    global log_listener
+    if log_listener is not None:
+        return
+    log_listener = QueueListener(
+        log_queue, *logging.getLogger(SINK_LOGGER).handlers, respect_handler_level=True
+    )
+    log_listener.start()
+
+def stop_log_listener()-> None:
+    global log_listener
+    if log_listener is None:
+        return
+    # drains whatever is still queued before returning
+    log_listener.stop()
+    log_listener = None
+
+def console_handler()-> dict:
+    if isinstance(config, DevConfig):
+        return {
+            "class": "rich.logging.RichHandler",
+            "level": "DEBUG",
+            "formatter": "console"
+        }
+    return {
+        "class": "logging.StreamHandler",
+        "level": "DEBUG",
+        "formatter": "plain"
+    }
+
 def configure_logging()-> None:
+    # reconfiguring closes the sink handlers, so the old listener must go first
+    stop_log_listener()
     dictConfig(
         {
             "version": 1,
@@ -39,6 +82,11 @@ def configure_logging()-> None:
                     "datefmt": "%Y-%m-%dT%H:%M:%S",
                     "format": "(%(correlation_id)s)%(name)s:%(lineno)d - %(message)s"
                 },
+                "plain": {
+                    "class": "logging.Formatter",
+                    "datefmt": "%Y-%m-%dT%H:%M:%S",
+                    "format": "%(asctime)s %(levelname)-8s (%(correlation_id)s)%(name)s:%(lineno)d - %(message)s"
+                },
                 "file": {
                     "class": "pythonjsonlogger.jsonlogger.JsonFormatter",
                     "datefmt": "%Y-%m-%dT%H:%M:%S",
@@ -46,12 +94,14 @@ def configure_logging()-> None:
                 }
             },
             "handlers": {
-                "default": {
-                    "class": "rich.logging.RichHandler",
-                    "level": "DEBUG",
-                    "formatter": "console",
+                # the correlation id lives in a contextvar, so it has to be
+                # read here, on the logging thread, not on the listener
+                "queue": {
+                    "()": QueueHandler,
+                    "queue": log_queue,
                     "filters": ['correlation_id']
                 },
+                "default": console_handler(),
                 "rotating_file": {
                     "class": "logging.handlers.RotatingFileHandler",
                     "level": "DEBUG",
@@ -59,26 +109,29 @@ def configure_logging()-> None:
                     "filename": "api.log",
                     "maxBytes": 1024 * 1024, #5MB
                     "backupCount": 5,
-                    "encoding": "utf8",
-                    "filters": ['correlation_id'],
+                    "encoding": "utf8"
                 }
             },
             "loggers": {
+                SINK_LOGGER: {
+                    "handlers": ['default', 'rotating_file'],
+                    "propagate": False
+                },
                 "uvicorn": {
-                    "handlers": ['default', "rotating_file"],
+                    "handlers": ['queue'],
                     "level": "INFO"
                 },
                 "api": {
-                    "handlers": ['default', 'rotating_file'],
+                    "handlers": ['queue'],
                     "level": "DEBUG" if isinstance(config, DevConfig) else 'INFO',
                     "propagate": False
                 },
                 "databases": {
-                    "handlers": ['default'],
+                    "handlers": ['queue'],
                     "level": "WARNING"
                 },
                 "aiosqlite": {
-                    "handlers": ['default'],
+                    "handlers": ['queue'],
                     "level": "WARNING"
                 }
             }
@@ -5,26 +5,74 @@ from asgi_correlation_id import CorrelationIdMiddleware
 from fastapi import FastAPI, HTTPException
 from fastapi.exception_handlers import http_exception_handler
 
-from api.database import database
-from api.logging_conf import configure_logging
+from api.config import config
+from api.database import database, engine
+from api.instrumentation import MetricsMiddleware, MetricsMonitor, observe_query
+from api.logging_conf import (
+    configure_logging,
+    start_log_listener,
+    stop_log_listener,
+)
+from api.migrations import migrate
+from api.outbox import outbox_worker
+from api.profiling import ProfilingMiddleware, record_query
+from api.query_stats import QueryStatsMiddleware
+from api.query_stats import record_query as record_request_query
+from api.router.metrics import router as metrics_router
 from api.router.post import router as post_router
 from api.router.user import router as user_router
+from api.security import password_hasher
+from api.tasks import close_http_client, get_http_client
 
 logger = logging.getLogger(__name__)
 
+database.add_query_observer(observe_query)
+database.add_query_observer(record_request_query)
+metrics_monitor = MetricsMonitor(
+    interval=config.EVENT_LOOP_LAG_INTERVAL_SECONDS,
+    flush_interval=config.METRICS_FLUSH_INTERVAL_SECONDS,
+    directory=config.METRICS_DIR
+)
+
 @asynccontextmanager
 async def lifespan(app: FastAPI):
 
     configure_logging()
+    start_log_listener()
     logger.info("Hello world")
+    migrate(engine)
     await database.connect()
+    get_http_client()
+    outbox_worker.start()
+    metrics_monitor.start()
     yield
+    await metrics_monitor.stop()
+    await outbox_worker.stop()
+    await close_http_client()
     await database.disconnect()
+    password_hasher.shutdown()
+    stop_log_listener()
 
 app = FastAPI(lifespan=lifespan)
+if config.PROFILING_ENABLED and config.PROFILING_TOKEN:
+    # inside CorrelationIdMiddleware, so profiles are named after the request id
+    database.add_query_observer(record_query)
+    app.add_middleware(
+        ProfilingMiddleware,
+        token=config.PROFILING_TOKEN,
+        directory=config.PROFILING_DIR,
+        interval=config.PROFILING_INTERVAL_SECONDS
+    )
+app.add_middleware(
+    QueryStatsMiddleware,
+    server_timing=config.SERVER_TIMING_ENABLED,
+    n_plus_one_threshold=config.N_PLUS_ONE_THRESHOLD
+)
 app.add_middleware(CorrelationIdMiddleware)
+app.add_middleware(MetricsMiddleware)
 app.include_router(post_router, prefix='/post')
 app.include_router(user_router)
+app.include_router(metrics_router)
 
 @app.exception_handler(HTTPException)
 async def http_exception_handle_logging(request, exc):
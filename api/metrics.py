@@ -0,0 +1,302 @@
+import abc
+import glob
+import json
+import math
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+DEFAULT_BUCKETS = (
+    0.005, 0.01, 0.025, 0.05, 0.075, 0.1, 0.25, 0.5, 0.75, 1.0, 2.5, 5.0, 10.0
+)
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+class CounterValue:
+    def __init__(self):
+        self.value = 0
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1):
+        with self._lock:
+            self.value += amount
+
+    def state(self):
+        return self.value
+
+
+class GaugeValue(CounterValue):
+    def dec(self, amount: float = 1):
+        with self._lock:
+            self.value -= amount
+
+    def set(self, value: float):
+        self.value = value
+
+
+class HistogramValue:
+    def __init__(self, buckets: tuple):
+        self.buckets = buckets
+        self.bucket_counts = [0] * len(buckets)
+        self.count = 0
+        self.sum = 0.0
+        # observations also come from worker threads (e.g. password hashing)
+        self._lock = threading.Lock()
+
+    def observe(self, value: float):
+        with self._lock:
+            for i, upper_bound in enumerate(self.buckets):
+                if value <= upper_bound:
+                    self.bucket_counts[i] += 1
+                    break
+            self.count += 1
+            self.sum += value
+
+    @contextmanager
+    def time(self):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started)
+
+    def state(self):
+        return {"buckets": list(self.bucket_counts), "count": self.count, "sum": self.sum}
+
+
+class Metric(abc.ABC):
+    type = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: tuple = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._children = {}
+        self._lock = threading.Lock()
+        if not self.labelnames:
+            # exported as 0 before the first observation
+            self.labels()
+        REGISTRY[name] = self
+
+    def labels(self, *values):
+        key = tuple(str(value) for value in values)
+        child = self._children.get(key)
+        if child is None:
+            if len(key) != len(self.labelnames):
+                raise ValueError(f"{self.name} expects labels {self.labelnames}")
+            with self._lock:
+                child = self._children.setdefault(key, self.new_child())
+        return child
+
+    @abc.abstractmethod
+    def new_child(self):
+        ...
+
+    def snapshot(self) -> dict:
+        return {
+            "type": self.type,
+            "documentation": self.documentation,
+            "labelnames": list(self.labelnames),
+            "samples": [
+                [list(key), child.state()] for key, child in list(self._children.items())
+            ]
+        }
+
+
+class Counter(Metric):
+    type = "counter"
+
+    def new_child(self):
+        return CounterValue()
+
+    def inc(self, amount: float = 1):
+        self.labels().inc(amount)
+
+    @property
+    def value(self):
+        return self.labels().value
+
+
+class Gauge(Metric):
+    type = "gauge"
+
+    def __init__(
+        self, name: str, documentation: str, labelnames: tuple = (), aggregate: str = "sum"
+    ):
+        # how values from several worker processes are combined: "sum" or "max"
+        super().__init__(name, documentation, labelnames)
+        self.aggregate = aggregate
+
+    def new_child(self):
+        return GaugeValue()
+
+    def inc(self, amount: float = 1):
+        self.labels().inc(amount)
+
+    def dec(self, amount: float = 1):
+        self.labels().dec(amount)
+
+    def set(self, value: float):
+        self.labels().set(value)
+
+    @property
+    def value(self):
+        return self.labels().value
+
+    def snapshot(self) -> dict:
+        return {**super().snapshot(), "aggregate": self.aggregate}
+
+
+class Histogram(Metric):
+    type = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        buckets: tuple = DEFAULT_BUCKETS,
+        labelnames: tuple = ()
+    ):
+        self.buckets = tuple(sorted(buckets)) + (float("inf"),)
+        super().__init__(name, documentation, labelnames)
+
+    def new_child(self):
+        return HistogramValue(self.buckets)
+
+    def observe(self, value: float):
+        self.labels().observe(value)
+
+    def time(self):
+        return self.labels().time()
+
+    @property
+    def count(self):
+        return self.labels().count
+
+    @property
+    def sum(self):
+        return self.labels().sum
+
+    @property
+    def bucket_counts(self):
+        return self.labels().bucket_counts
+
+    def snapshot(self) -> dict:
+        return {**super().snapshot(), "bucket_bounds": list(self.buckets[:-1])}
+
+
+REGISTRY: dict[str, Metric] = {}
+
+
+def snapshot() -> dict:
+    return {name: metric.snapshot() for name, metric in list(REGISTRY.items())}
+
+
+# Multiple worker processes: each one periodically writes its own snapshot to
+# METRICS_DIR/metrics-<pid>.json and /metrics merges every file it finds, so
+# whichever worker serves the scrape reports totals for all of them.
+
+def snapshot_path(directory: str, pid: int | None = None) -> str:
+    return os.path.join(directory, f"metrics-{pid or os.getpid()}.json")
+
+
+def write_snapshot(directory: str, live: bool = True):
+    os.makedirs(directory, exist_ok=True)
+    path = snapshot_path(directory)
+    temporary = f"{path}.tmp"
+    with open(temporary, "w") as f:
+        json.dump({"live": live, "metrics": snapshot()}, f)
+    # readers only ever see complete files
+    os.replace(temporary, path)
+
+
+def read_snapshots(directory: str) -> list[dict]:
+    snapshots = []
+    for path in sorted(glob.glob(os.path.join(directory, "metrics-*.json"))):
+        try:
+            with open(path) as f:
+                snapshots.append(json.load(f))
+        except (OSError, ValueError):
+            continue
+    return snapshots
+
+
+def merge_state(metric_type: str, aggregate: str | None, current, state):
+    if current is None:
+        return state
+    if metric_type == "histogram":
+        return {
+            "buckets": [a + b for a, b in zip(current["buckets"], state["buckets"])],
+            "count": current["count"] + state["count"],
+            "sum": current["sum"] + state["sum"],
+        }
+    if aggregate == "max":
+        return max(current, state)
+    return current + state
+
+
+def merge(snapshots: list[dict]) -> dict:
+    merged = {}
+    for process in snapshots:
+        for name, metric in process["metrics"].items():
+            # a stopped worker's counters still count, its gauges don't
+            if metric["type"] == "gauge" and not process.get("live", True):
+                continue
+            target = merged.setdefault(name, {**metric, "samples": {}})
+            for labels, state in metric["samples"]:
+                key = tuple(labels)
+                target["samples"][key] = merge_state(
+                    metric["type"], metric.get("aggregate"), target["samples"].get(key), state
+                )
+    for metric in merged.values():
+        metric["samples"] = [[list(key), state] for key, state in metric["samples"].items()]
+    return merged
+
+
+def escape_label_value(value: str) -> str:
+    return value.replace("\\", r"\\").replace("\n", r"\n").replace('"', r'\"')
+
+
+def format_labels(labelnames, labels, extra: dict | None = None) -> str:
+    pairs = list(zip(labelnames, labels)) + list((extra or {}).items())
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{name}="{escape_label_value(value)}"' for name, value in pairs) + "}"
+
+
+def format_value(value: float) -> str:
+    if math.isinf(value):
+        return "+Inf" if value > 0 else "-Inf"
+    return repr(float(value))
+
+
+def render(metrics: dict) -> str:
+    lines = []
+    for name, metric in sorted(metrics.items()):
+        lines.append(f"# HELP {name} {metric['documentation']}")
+        lines.append(f"# TYPE {name} {metric['type']}")
+        labelnames = metric["labelnames"]
+        for labels, state in metric["samples"]:
+            if metric["type"] != "histogram":
+                lines.append(f"{name}{format_labels(labelnames, labels)} {format_value(state)}")
+                continue
+            cumulative = 0
+            bounds = metric["bucket_bounds"] + [float("inf")]
+            for upper_bound, bucket_count in zip(bounds, state["buckets"]):
+                cumulative += bucket_count
+                le = {"le": format_value(upper_bound)}
+                lines.append(
+                    f"{name}_bucket{format_labels(labelnames, labels, le)} {format_value(cumulative)}"
+                )
+            lines.append(f"{name}_sum{format_labels(labelnames, labels)} {format_value(state['sum'])}")
+            lines.append(f"{name}_count{format_labels(labelnames, labels)} {format_value(state['count'])}")
+    return "\n".join(lines) + "\n"
+
+
+def generate_latest(directory: str | None = None) -> str:
+    if directory is None:
+        return render(merge([{"metrics": snapshot()}]))
+    write_snapshot(directory)
+    return render(merge(read_snapshots(directory)))
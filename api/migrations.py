@@ -0,0 +1,166 @@
+import datetime
+import logging
+
+import sqlalchemy
+
+from api.database import (
+    change_counter_table,
+    comment_table,
+    email_outbox_table,
+    like_table,
+    metadata,
+    post_table,
+)
+from api.search import REBUILD_SEARCH_INDEX, SEARCH_INDEX_DDL
+
+logger = logging.getLogger(__name__)
+
+# kept out of `metadata` so create_all never touches the bookkeeping table
+schema_version_table = sqlalchemy.Table(
+    "schema_version",
+    sqlalchemy.MetaData(),
+    sqlalchemy.Column('version', sqlalchemy.Integer, primary_key=True),
+    sqlalchemy.Column('description', sqlalchemy.String, nullable=False),
+    sqlalchemy.Column('applied_at', sqlalchemy.DateTime, nullable=False)
+)
+
+# Every migration must be idempotent: a database created by create_all
+# already has the latest schema, and a pre-migration database may have
+# applied some of these changes by hand.
+
+
+def add_column_if_missing(connection, table: sqlalchemy.Table, column_name: str):
+    existing = {c['name'] for c in sqlalchemy.inspect(connection).get_columns(table.name)}
+    if column_name in existing:
+        return
+    column = table.c[column_name]
+    column_type = column.type.compile(dialect=connection.dialect)
+    ddl = f"ALTER TABLE {table.name} ADD COLUMN {column_name} {column_type}"
+    if not column.nullable:
+        ddl += " NOT NULL"
+    if column.server_default is not None:
+        ddl += f" DEFAULT {column.server_default.arg}"
+    connection.execute(sqlalchemy.text(ddl))
+
+
+def create_index_if_missing(connection, table: sqlalchemy.Table, index_name: str):
+    index = next(index for index in table.indexes if index.name == index_name)
+    index.create(connection, checkfirst=True)
+
+
+# indexes an earlier migration created that the table definitions no longer
+# have; a later migration drops them again
+RETIRED_INDEXES = {
+    'ix_posts_user_id': ('posts', 'user_id'),
+    'ix_likes_user_id': ('likes', 'user_id'),
+}
+
+
+def create_retired_index_if_missing(connection, index_name: str):
+    table_name, *columns = RETIRED_INDEXES[index_name]
+    connection.execute(sqlalchemy.text(
+        f"CREATE INDEX IF NOT EXISTS {index_name} ON {table_name} ({', '.join(columns)})"
+    ))
+
+
+def drop_index_if_exists(connection, index_name: str):
+    connection.execute(sqlalchemy.text(f"DROP INDEX IF EXISTS {index_name}"))
+
+
+def recount_likes(connection):
+    actual_likes = (
+        sqlalchemy.select(sqlalchemy.func.count(like_table.c.id))
+        .where(like_table.c.post_id == post_table.c.id)
+        .scalar_subquery()
+    )
+    connection.execute(post_table.update().values(like_count=actual_likes))
+
+
+def add_post_like_count(connection):
+    add_column_if_missing(connection, post_table, 'like_count')
+    create_index_if_missing(connection, post_table, 'ix_posts_like_count_id')
+    recount_likes(connection)
+
+
+def add_secondary_indexes(connection):
+    # duplicate likes would make the unique index fail to build
+    first_likes = (
+        sqlalchemy.select(sqlalchemy.func.min(like_table.c.id))
+        .group_by(like_table.c.post_id, like_table.c.user_id)
+    )
+    connection.execute(like_table.delete().where(like_table.c.id.not_in(first_likes)))
+    recount_likes(connection)
+
+    create_retired_index_if_missing(connection, 'ix_posts_user_id')
+    create_index_if_missing(connection, comment_table, 'ix_comments_post_id')
+    create_index_if_missing(connection, like_table, 'uq_likes_post_id_user_id')
+    create_retired_index_if_missing(connection, 'ix_likes_user_id')
+
+
+def add_email_outbox(connection):
+    email_outbox_table.create(connection, checkfirst=True)
+
+
+def add_change_tracking(connection):
+    add_column_if_missing(connection, post_table, 'version')
+    add_column_if_missing(connection, post_table, 'updated_at')
+    change_counter_table.create(connection, checkfirst=True)
+
+
+def add_post_search(connection):
+    for statement in SEARCH_INDEX_DDL + REBUILD_SEARCH_INDEX:
+        connection.exec_driver_sql(statement)
+
+
+def add_user_listing_indexes(connection):
+    create_index_if_missing(connection, post_table, 'ix_posts_user_id_id')
+    create_index_if_missing(connection, comment_table, 'ix_comments_user_id_id')
+    create_index_if_missing(connection, like_table, 'ix_likes_user_id_id')
+    # (user_id, id) serves every lookup the single-column ones did
+    drop_index_if_exists(connection, 'ix_posts_user_id')
+    drop_index_if_exists(connection, 'ix_likes_user_id')
+
+
+MIGRATIONS = [
+    (1, "add posts.like_count", add_post_like_count),
+    (2, "add secondary indexes and unique likes", add_secondary_indexes),
+    (3, "add email_outbox", add_email_outbox),
+    (4, "add post versions and change counters", add_change_tracking),
+    (5, "add full-text search over posts and comments", add_post_search),
+    (6, "replace user_id indexes with (user_id, id) for per-user listings", add_user_listing_indexes),
+]
+
+
+def current_version(connection) -> int:
+    version = connection.scalar(
+        sqlalchemy.select(sqlalchemy.func.max(schema_version_table.c.version))
+    )
+    return version or 0
+
+
+def migrate(engine: sqlalchemy.Engine) -> int:
+    with engine.connect() as connection:
+        # Take SQLite's write lock before reading the version: several workers
+        # starting at once then migrate one after another, and the later ones
+        # find nothing pending. Without an explicit BEGIN, pysqlite would also
+        # autocommit each DDL statement on its own.
+        connection.exec_driver_sql("BEGIN IMMEDIATE")
+        schema_version_table.create(connection, checkfirst=True)
+        version = current_version(connection)
+        pending = [m for m in MIGRATIONS if m[0] > version]
+        if not pending:
+            connection.commit()
+            return version
+
+        # creates only the tables that don't exist yet, with their indexes
+        metadata.create_all(connection)
+        for version, description, upgrade in pending:
+            logger.info(f"Applying schema migration {version}: {description}")
+            upgrade(connection)
+            connection.execute(schema_version_table.insert().values(
+                version=version,
+                description=description,
+                applied_at=datetime.datetime.now(datetime.timezone.utc)
+            ))
+        connection.commit()
+    return version
@@ -15,6 +15,15 @@ class UserPost(UserPostIn):
 
 class UserPostWithLikes(UserPost):
     likes: int
+
+class UserPostPage(BaseModel):
+    items: list[UserPost]
+    next_cursor: str | None = None
+
+class UserPostWithLikesPage(BaseModel):
+    items: list[UserPostWithLikes]
+    next_cursor: str | None = None
+
 class CommentIn(BaseModel):
     body: str
     post_id: int
@@ -27,10 +36,31 @@ class Comment(CommentIn):
     }
 
 
+class CommentPage(BaseModel):
+    items: list[Comment]
+    next_cursor: str | None = None
+
+class LikedPost(UserPostWithLikes):
+    like_id: int
+
+class LikedPostPage(BaseModel):
+    items: list[LikedPost]
+    next_cursor: str | None = None
 
 class UserPostWithComment(BaseModel):
     post: UserPostWithLikes
     comment: list[Comment]
+    next_comment_cursor: str | None = None
+
+class SearchHit(BaseModel):
+    post_id: int
+    # set when the match is one of the post's comments
+    comment_id: int | None = None
+    body: str | None
+
+class SearchPage(BaseModel):
+    items: list[SearchHit]
+    next_cursor: str | None = None
 
 class PostLikeIn(BaseModel):
     post_id: int
@@ -0,0 +1,161 @@
+import asyncio
+import logging
+import time
+
+import sqlalchemy
+
+from api.config import config
+from api.database import database, email_outbox_table
+from api.tasks import APIResponseError, registration_email, send_simple_email
+
+logger = logging.getLogger(__name__)
+
+
+async def enqueue_email(recipient: str, subject: str, body: str) -> int:
+    now = time.time()
+    query = email_outbox_table.insert().values(
+        recipient=recipient,
+        subject=subject,
+        body=body,
+        next_attempt_at=now,
+        created_at=now
+    )
+    return await database.execute(query)
+
+
+async def enqueue_registration_email(email: str, confirmation_url: str) -> int:
+    return await enqueue_email(email, *registration_email(email, confirmation_url))
+
+
+def is_permanent_failure(error: Exception) -> bool:
+    # Mailgun rejects bad recipients/requests with 4xx; retrying won't help,
+    # except for rate limiting
+    return (
+        isinstance(error, APIResponseError)
+        and 400 <= error.status_code < 500
+        and error.status_code != 429
+    )
+
+
+class EmailOutboxWorker:
+    def __init__(
+        self,
+        batch_size: int,
+        concurrency: int,
+        poll_interval: float,
+        max_attempts: int,
+        backoff: float,
+        max_backoff: float,
+        lease: float,
+        send=send_simple_email
+    ):
+        self.batch_size = batch_size
+        self.concurrency = concurrency
+        self.poll_interval = poll_interval
+        self.max_attempts = max_attempts
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.lease = lease
+        self.send = send
+        self._stopping = asyncio.Event()
+        self._task: asyncio.Task | None = None
+
+    def start(self):
+        # a fresh event per start: an Event is tied to the loop that first
+        # waits on it, and a later lifespan may run on another loop
+        self._stopping = asyncio.Event()
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is None:
+            return
+        self._stopping.set()
+        await self._task
+        self._task = None
+
+    async def _run(self):
+        logger.info("Email outbox worker started")
+        while not self._stopping.is_set():
+            try:
+                delivered = await self.process_batch()
+            except Exception:
+                logger.exception("Email outbox worker failed to process a batch")
+                delivered = 0
+            # a full batch means there is probably more waiting
+            if delivered < self.batch_size:
+                try:
+                    await asyncio.wait_for(self._stopping.wait(), self.poll_interval)
+                except asyncio.TimeoutError:
+                    pass
+        logger.info("Email outbox worker stopped")
+
+    async def claim_batch(self) -> list:
+        now = time.time()
+        outbox = email_outbox_table.c
+        due = (
+            sqlalchemy.select(outbox.id)
+            .where(
+                ((outbox.status == 'pending') & (outbox.next_attempt_at <= now)) |
+                ((outbox.status == 'sending') & (outbox.claimed_at <= now - self.lease))
+            )
+            .order_by(outbox.next_attempt_at)
+            .limit(self.batch_size)
+        )
+        # a single UPDATE ... RETURNING, so two workers never claim the same row
+        query = (
+            email_outbox_table.update()
+            .where(outbox.id.in_(due.scalar_subquery()))
+            .values(status='sending', claimed_at=now)
+            .returning(*email_outbox_table.c)
+        )
+        return await database.fetch_all(query)
+
+    async def process_batch(self) -> int:
+        rows = await self.claim_batch()
+        if not rows:
+            return 0
+
+        semaphore = asyncio.Semaphore(self.concurrency)
+
+        async def deliver_with_limit(row):
+            async with semaphore:
+                await self.deliver(row)
+
+        await asyncio.gather(*(deliver_with_limit(row) for row in rows))
+        return len(rows)
+
+    def retry_delay(self, attempts: int) -> float:
+        return min(self.max_backoff, self.backoff * 2 ** (attempts - 1))
+
+    async def deliver(self, row):
+        attempts = row.attempts + 1
+        outbox_row = email_outbox_table.update().where(email_outbox_table.c.id == row.id)
+        try:
+            await self.send(row.recipient, row.subject, row.body)
+        except Exception as e:
+            if is_permanent_failure(e) or attempts >= self.max_attempts:
+                logger.error(f"Dead-lettering email {row.id} after {attempts} attempts: {e}")
+                values = {"status": 'dead'}
+            else:
+                delay = self.retry_delay(attempts)
+                logger.warning(f"Email {row.id} failed, retrying in {delay:.0f}s: {e}")
+                values = {"status": 'pending', "next_attempt_at": time.time() + delay}
+            await database.execute(
+                outbox_row.values(attempts=attempts, last_error=str(e)[:1000], **values)
+            )
+            return
+
+        await database.execute(
+            outbox_row.values(status='sent', attempts=attempts, last_error=None)
+        )
+
+
+outbox_worker = EmailOutboxWorker(
+    batch_size=config.EMAIL_OUTBOX_BATCH_SIZE,
+    concurrency=config.EMAIL_OUTBOX_CONCURRENCY,
+    poll_interval=config.EMAIL_OUTBOX_POLL_INTERVAL_SECONDS,
+    max_attempts=config.EMAIL_OUTBOX_MAX_ATTEMPTS,
+    backoff=config.EMAIL_OUTBOX_BACKOFF_SECONDS,
+    max_backoff=config.EMAIL_OUTBOX_MAX_BACKOFF_SECONDS,
+    lease=config.EMAIL_OUTBOX_LEASE_SECONDS
+)
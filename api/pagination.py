@@ -0,0 +1,47 @@
+import base64
+import binascii
+import json
+
+from fastapi import HTTPException, status
+
+DEFAULT_PAGE_SIZE = 20
+MAX_PAGE_SIZE = 100
+
+
+def invalid_cursor_exception() -> HTTPException:
+    return HTTPException(
+        status_code=status.HTTP_400_BAD_REQUEST,
+        detail="Invalid cursor"
+    )
+
+
+def encode_cursor(values: dict) -> str:
+    raw = json.dumps(values, separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str, kind: str, *fields: str) -> tuple:
+    padded = cursor + "=" * (-len(cursor) % 4)
+    try:
+        values = json.loads(base64.urlsafe_b64decode(padded))
+    except (binascii.Error, ValueError) as e:
+        raise invalid_cursor_exception() from e
+
+    # a cursor is only valid for the listing (and sort order) that issued it
+    if not isinstance(values, dict) or values.get("k") != kind:
+        raise invalid_cursor_exception()
+
+    decoded = tuple(values.get(field) for field in fields)
+    for value in decoded:
+        if isinstance(value, bool) or not isinstance(value, (int, float)):
+            raise invalid_cursor_exception()
+    return decoded
+
+
+def paginate(rows: list, limit: int, cursor_for) -> tuple[list, str | None]:
+    # callers fetch limit + 1 rows so we know whether another page exists
+    # without a separate COUNT query
+    if len(rows) <= limit:
+        return rows, None
+    rows = rows[:limit]
+    return rows, encode_cursor(cursor_for(rows[-1]))
@@ -0,0 +1,284 @@
+import asyncio
+import contextvars
+import hmac
+import json
+import logging
+import os
+import re
+import sys
+import threading
+import time
+import uuid
+import weakref
+
+from asgi_correlation_id import correlation_id
+from starlette.datastructures import Headers
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+logger = logging.getLogger(__name__)
+
+PROFILE_HEADER = "x-profile"
+
+# Innermost match wins, so FastAPI validating a response_model inside
+# serialize_response counts as validation.
+VALIDATION_FUNCTIONS = {
+    "request_params_to_args",
+    "request_body_to_args",
+    "_validate_value_with_model_field",
+    "validate",
+    "validate_python",
+    "validate_json",
+    "model_validate",
+}
+SERIALIZATION_FUNCTIONS = {
+    "serialize_response",
+    "jsonable_encoder",
+    "json_response",
+    "dump",
+    "dump_many",
+    "model_dump",
+    "model_dump_json",
+    "render",
+}
+
+# where a task's stack starts when the event loop runs one of its steps
+HANDLE_RUN_CODE = asyncio.events.Handle._run.__code__
+
+
+class ProfileSession:
+    def __init__(self):
+        self.db_time = 0.0
+        # tasks spawned by the profiled request, see install_task_factory
+        self.tasks: weakref.WeakSet[asyncio.Task] = weakref.WeakSet()
+
+
+# Set for the profiled request. Tasks it spawns (e.g. a StreamingResponse
+# body) inherit the context.
+profile_session: contextvars.ContextVar[ProfileSession | None] = contextvars.ContextVar(
+    "profile_session", default=None
+)
+
+
+# per loop: the factory install_task_factory replaced and the number of
+# profiles running on it; the last one to finish puts the old factory back,
+# so tasks created while nothing is profiled aren't wrapped
+task_factories: dict[asyncio.AbstractEventLoop, list] = {}
+
+
+def install_task_factory(loop: asyncio.AbstractEventLoop):
+    # Task.get_context() only exists from Python 3.12, so the sampler can't
+    # ask a task for its session; instead every task is added to the session
+    # of the context it is created in. Wraps any factory already installed.
+    installed = task_factories.get(loop)
+    if installed is not None:
+        installed[1] += 1
+        return
+    previous = loop.get_task_factory()
+
+    def factory(loop, coro, **kwargs):
+        context = kwargs.get("context")
+        session = profile_session.get() if context is None else context.get(profile_session)
+        if previous is None:
+            task = asyncio.Task(coro, loop=loop, **kwargs)
+        else:
+            task = previous(loop, coro, **kwargs)
+        if session is not None:
+            session.tasks.add(task)
+        return task
+
+    task_factories[loop] = [previous, 1]
+    loop.set_task_factory(factory)
+
+
+def uninstall_task_factory(loop: asyncio.AbstractEventLoop):
+    installed = task_factories[loop]
+    installed[1] -= 1
+    if installed[1] == 0:
+        del task_factories[loop]
+        loop.set_task_factory(installed[0])
+
+
+def record_query(query, values, elapsed: float, error: BaseException | None):
+    session = profile_session.get()
+    if session is not None:
+        session.db_time += elapsed
+
+
+def classify(codes: list) -> str:
+    for code in reversed(codes):
+        if code.co_name in VALIDATION_FUNCTIONS:
+            return "validation"
+        if code.co_name in SERIALIZATION_FUNCTIONS:
+            return "serialization"
+    return "app"
+
+
+class Sampler(threading.Thread):
+    # Samples the event loop thread's stack every `interval` seconds. A sample
+    # belongs to the profiled request when the task the loop is running
+    # carries its session; otherwise the loop is idle, awaiting I/O or
+    # running some other request. Frames below `root` (the middleware's own
+    # frame) or below the task step are left out.
+    # The sampler needs the GIL to take a sample, and by default the loop
+    # thread only hands it over every 5ms; while any profile is running the
+    # switch interval is lowered to the sampling interval.
+    active = 0
+    active_lock = threading.Lock()
+    switch_interval = sys.getswitchinterval()
+
+    def __init__(self, session: ProfileSession, root, interval: float):
+        super().__init__(name="request-profiler", daemon=True)
+        self.session = session
+        self.task = asyncio.current_task()
+        self.loop = asyncio.get_running_loop()
+        self.thread_id = threading.get_ident()
+        self.root = root
+        self.interval = interval
+        self.samples: list[tuple[list, float]] = []
+        self._stopping = threading.Event()
+        self.created = time.perf_counter()
+
+    def start(self):
+        with Sampler.active_lock:
+            if Sampler.active == 0:
+                Sampler.switch_interval = sys.getswitchinterval()
+                sys.setswitchinterval(min(self.interval, Sampler.switch_interval))
+            Sampler.active += 1
+        super().start()
+
+    def is_profiled(self, task) -> bool:
+        if task is None:
+            return False
+        return task is self.task or task in self.session.tasks
+
+    def request_stack(self, frame) -> list:
+        if not self.is_profiled(asyncio.current_task(self.loop)):
+            return []
+        codes = []
+        while frame is not None and frame is not self.root and frame.f_code is not HANDLE_RUN_CODE:
+            codes.append(frame.f_code)
+            frame = frame.f_back
+        # root -> leaf; an empty stack means the request wasn't running
+        codes.reverse()
+        return codes
+
+    def run(self):
+        last = self.created
+        while not self._stopping.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            now = time.perf_counter()
+            self.samples.append((self.request_stack(frame), now - last))
+            last = now
+
+    def stop(self):
+        self._stopping.set()
+        self.join()
+        with Sampler.active_lock:
+            Sampler.active -= 1
+            if Sampler.active == 0:
+                sys.setswitchinterval(Sampler.switch_interval)
+
+
+def to_speedscope(name: str, samples: list[tuple[list, float]], wall_time: float) -> tuple[dict, dict]:
+    frames = []
+    frame_index = {}
+
+    def index(key, frame):
+        if key not in frame_index:
+            frame_index[key] = len(frames)
+            frames.append(frame)
+        return frame_index[key]
+
+    phases = {"validation": 0.0, "serialization": 0.0, "app": 0.0, "waiting": 0.0}
+    stacks = []
+    weights = []
+    for codes, weight in samples:
+        phase = classify(codes) if codes else "waiting"
+        phases[phase] += weight
+        stack = [index(phase, {"name": f"[{phase}]"})]
+        stack.extend(
+            index(code, {"name": code.co_qualname, "file": code.co_filename, "line": code.co_firstlineno})
+            for code in codes
+        )
+        stacks.append(stack)
+        weights.append(weight)
+
+    profile = {
+        "$schema": "https://www.speedscope.app/file-format-schema.json",
+        "name": name,
+        "exporter": "api.profiling",
+        "shared": {"frames": frames},
+        "profiles": [{
+            "type": "sampled",
+            "name": name,
+            "unit": "seconds",
+            "startValue": 0,
+            "endValue": sum(weights),
+            "samples": stacks,
+            "weights": weights,
+        }],
+    }
+    return profile, {**phases, "wall": wall_time}
+
+
+def write_profile(directory: str, filename: str, profile: dict):
+    os.makedirs(directory, exist_ok=True)
+    with open(os.path.join(directory, filename), "w") as f:
+        json.dump(profile, f)
+
+
+class ProfilingMiddleware:
+    # Only added when PROFILING_ENABLED is set. Requests without a valid
+    # X-Profile header cost one header lookup; with it, the request runs
+    # under a stack sampler and its speedscope profile is written to
+    # `directory` as <correlation id>.speedscope.json.
+    def __init__(self, app: ASGIApp, token: str, directory: str, interval: float):
+        self.app = app
+        self.token = token
+        self.directory = directory
+        self.interval = interval
+
+    def authorized(self, scope: Scope) -> bool:
+        supplied = Headers(scope=scope).get(PROFILE_HEADER)
+        return supplied is not None and hmac.compare_digest(supplied.encode(), self.token.encode())
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http" or not self.authorized(scope):
+            await self.app(scope, receive, send)
+            return
+
+        # the correlation id can come from the client, keep it filename-safe
+        profile_id = re.sub(r"[^A-Za-z0-9_-]", "", correlation_id.get() or "") or uuid.uuid4().hex
+        filename = f"{profile_id}.speedscope.json"
+
+        async def send_wrapper(message: Message):
+            if message["type"] == "http.response.start":
+                message["headers"] = [
+                    *message.get("headers", []), (b"x-profile-file", filename.encode())
+                ]
+            await send(message)
+
+        loop = asyncio.get_running_loop()
+        session = ProfileSession()
+        token = profile_session.set(session)
+        sampler = Sampler(session, sys._getframe(), self.interval)
+        started = time.perf_counter()
+        install_task_factory(loop)
+        sampler.start()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            sampler.stop()
+            uninstall_task_factory(loop)
+            wall_time = time.perf_counter() - started
+            profile_session.reset(token)
+
+            name = f"{scope['method']} {scope['path']} ({profile_id})"
+            profile, phases = to_speedscope(name, sampler.samples, wall_time)
+            phases["db"] = session.db_time
+            profile["phases"] = phases
+            await asyncio.to_thread(write_profile, self.directory, filename, profile)
+            logger.info(
+                f"Profiled {name}: " +
+                ", ".join(f"{phase}={seconds * 1000:.1f}ms" for phase, seconds in phases.items())
+            )
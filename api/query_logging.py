@@ -0,0 +1,67 @@
+import logging
+import re
+
+from sqlalchemy.sql import ClauseElement
+
+from api.config import config
+
+logger = logging.getLogger("api.sql")
+slow_logger = logging.getLogger("api.sql.slow")
+
+REDACTED = "***"
+# credentials, and what users wrote or who they are (the logging filters
+# already treat emails as personal data)
+SENSITIVE_PARAMETER = re.compile(
+    r"password|secret|token|api_key|email|recipient|body|subject|query", re.IGNORECASE
+)
+MAX_PARAMETER_LENGTH = 200
+
+
+def compile_query(query: ClauseElement | str, values: dict | None) -> tuple[str, dict]:
+    if isinstance(query, str):
+        return query, dict(values or {})
+    compiled = query.compile()
+    return str(compiled), {**compiled.params, **(values or {})}
+
+
+def redact_parameters(parameters: dict) -> dict:
+    redacted = {}
+    for name, value in parameters.items():
+        if SENSITIVE_PARAMETER.search(name):
+            value = REDACTED
+        elif isinstance(value, str) and len(value) > MAX_PARAMETER_LENGTH:
+            value = value[:MAX_PARAMETER_LENGTH] + "..."
+        redacted[name] = value
+    return redacted
+
+
+def describe_parameters(parameters: dict) -> dict:
+    return {name: type(value).__name__ for name, value in parameters.items()}
+
+
+def log_query(
+    query: ClauseElement | str,
+    values: dict | None,
+    elapsed: float,
+    error: BaseException | None
+):
+    slow = elapsed >= config.SLOW_QUERY_THRESHOLD_SECONDS
+    # compiling a statement to SQL is the expensive part, so only do it when
+    # the record is actually going to be emitted
+    if not (slow and slow_logger.isEnabledFor(logging.WARNING)) and not logger.isEnabledFor(logging.DEBUG):
+        return
+
+    sql, parameters = compile_query(query, values)
+    outcome = f"failed ({error!r})" if error is not None else "ok"
+    if slow:
+        # logged in production, so no values at all; names and types are
+        # enough to tell which call site it was
+        slow_logger.warning(
+            f"Slow query {elapsed * 1000:.1f}ms {outcome}: {sql} "
+            f"parameters={describe_parameters(parameters)}"
+        )
+    else:
+        logger.debug(
+            f"Query {elapsed * 1000:.1f}ms {outcome}: {sql} "
+            f"parameters={redact_parameters(parameters)}"
+        )
@@ -0,0 +1,121 @@
+import contextvars
+import logging
+import time
+from collections import Counter
+from contextlib import contextmanager
+
+from asgi_correlation_id import correlation_id
+from sqlalchemy.sql import ClauseElement
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from api.statements import STATEMENTS
+
+logger = logging.getLogger(__name__)
+
+STATEMENT_NAMES = {statement.sql: name for name, statement in STATEMENTS.items()}
+
+
+def statement_label(query: ClauseElement | str) -> str:
+    # a cheap, stable name for a statement; never compiles it
+    if isinstance(query, str):
+        return query[:80]
+    text = getattr(query, "text", None) or getattr(getattr(query, "element", None), "text", None)
+    if text is not None:
+        return STATEMENT_NAMES.get(text, text[:80])
+    table = getattr(query, "table", None)
+    if table is not None:
+        return f"{query.__visit_name__} {table.name}"
+    froms = getattr(query, "get_final_froms", None)
+    if froms is not None:
+        return f"select {','.join(getattr(f, 'name', '?') for f in froms())}"
+    return type(query).__name__
+
+
+class QueryStats:
+    def __init__(self, request_id: str | None = None, parent: "QueryStats | None" = None):
+        self.request_id = request_id
+        # an enclosing count_queries() (e.g. a test's query budget) sees the
+        # request's queries too
+        self.parent = parent
+        self.count = 0
+        self.total = 0.0
+        self.statements: list[tuple[str, float]] = []
+
+    def record(self, query, elapsed: float):
+        self.count += 1
+        self.total += elapsed
+        self.statements.append((statement_label(query), elapsed))
+
+    def repeated(self, threshold: int) -> list[tuple[str, int]]:
+        counts = Counter(label for label, _ in self.statements)
+        return [(label, count) for label, count in counts.most_common() if count >= threshold]
+
+    def __str__(self):
+        return "\n".join(
+            f"  {elapsed * 1000:7.2f}ms  {label}" for label, elapsed in self.statements
+        )
+
+
+# Set for the duration of a request by QueryStatsMiddleware; tasks spawned
+# by the request (e.g. a streaming body) inherit it.
+request_query_stats: contextvars.ContextVar[QueryStats | None] = contextvars.ContextVar(
+    "request_query_stats", default=None
+)
+
+
+def record_query(query, values, elapsed: float, error: BaseException | None):
+    stats = request_query_stats.get()
+    while stats is not None:
+        stats.record(query, elapsed)
+        stats = stats.parent
+
+
+@contextmanager
+def count_queries(request_id: str | None = None):
+    stats = QueryStats(request_id, parent=request_query_stats.get())
+    token = request_query_stats.set(stats)
+    try:
+        yield stats
+    finally:
+        request_query_stats.reset(token)
+
+
+class QueryStatsMiddleware:
+    # Counts the queries each request runs, adds a Server-Timing header and
+    # warns when one statement runs often enough to look like an N+1.
+    def __init__(self, app: ASGIApp, server_timing: bool, n_plus_one_threshold: int):
+        self.app = app
+        self.server_timing = server_timing
+        self.n_plus_one_threshold = n_plus_one_threshold
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        started = time.perf_counter()
+
+        async def send_wrapper(message: Message):
+            if message["type"] == "http.response.start" and self.server_timing:
+                # only what ran before the headers went out; a streaming
+                # body's queries are in the log line below
+                elapsed = time.perf_counter() - started
+                timing = (
+                    f'db;dur={stats.total * 1000:.2f};desc="{stats.count} queries", '
+                    f'app;dur={elapsed * 1000:.2f}'
+                )
+                message["headers"] = [
+                    *message.get("headers", []), (b"server-timing", timing.encode())
+                ]
+            await send(message)
+
+        with count_queries(correlation_id.get()) as stats:
+            await self.app(scope, receive, send_wrapper)
+
+        request = f"{scope['method']} {scope['path']} ({stats.request_id})"
+        for label, count in stats.repeated(self.n_plus_one_threshold):
+            logger.warning(f"Possible N+1 in {request}: '{label}' ran {count} times")
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug(
+                f"{request} ran {stats.count} queries in {stats.total * 1000:.2f}ms\n{stats}"
+            )
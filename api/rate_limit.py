@@ -0,0 +1,186 @@
+import heapq
+import logging
+import math
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+
+from fastapi import HTTPException, Request, status
+
+from api.config import config
+from api.metrics import Counter
+from api.models.user import UserIn
+
+logger = logging.getLogger(__name__)
+
+rate_limited_requests_total = Counter(
+    "rate_limited_requests_total",
+    "Requests rejected with 429, by endpoint and bucket (ip or email)",
+    labelnames=("endpoint", "bucket")
+)
+
+
+@dataclass(frozen=True)
+class Bucket:
+    # up to `capacity` requests at once, then `refill_per_second` on average
+    capacity: float
+    refill_per_second: float
+
+    @classmethod
+    def per_minute(cls, burst: int, per_minute: float) -> "Bucket":
+        return cls(capacity=burst, refill_per_second=per_minute / 60)
+
+
+class MemoryStore:
+    # One (tokens, updated_at, expires_at) tuple per active key. A bucket that
+    # has refilled completely is the same as no bucket, so it is dropped once
+    # it expires; a min-heap of expiry times finds those wherever they are,
+    # while the dict's order (last use) decides what goes past maxsize.
+    # Per process: with several workers each one allows the full rate.
+    def __init__(self, maxsize: int):
+        self.maxsize = maxsize
+        self._buckets: OrderedDict[str, tuple[float, float, float]] = OrderedDict()
+        self._expiries: list[tuple[float, str]] = []
+
+    async def take(self, key: str, bucket: Bucket) -> float:
+        # seconds until a token is available; 0 when one was taken
+        now = time.monotonic()
+        self._expire(now)
+
+        tokens, updated_at, _ = self._buckets.pop(key, (bucket.capacity, now, now))
+        tokens = min(bucket.capacity, tokens + (now - updated_at) * bucket.refill_per_second)
+        if tokens >= 1:
+            tokens -= 1
+            retry_after = 0.0
+        else:
+            retry_after = (1 - tokens) / bucket.refill_per_second
+
+        expires_at = now + (bucket.capacity - tokens) / bucket.refill_per_second
+        self._buckets[key] = (tokens, now, expires_at)
+        heapq.heappush(self._expiries, (expires_at, key))
+        # past maxsize the least recently used keys start over with a full bucket
+        while len(self._buckets) > self.maxsize:
+            self._buckets.popitem(last=False)
+        # every take pushes an expiry and supersedes the key's previous one;
+        # rebuild the heap before superseded entries outnumber the live ones
+        if len(self._expiries) > 2 * len(self._buckets) + 64:
+            self._expiries = [(entry[2], key) for key, entry in self._buckets.items()]
+            heapq.heapify(self._expiries)
+        return retry_after
+
+    def _expire(self, now: float):
+        while self._expiries and self._expiries[0][0] <= now:
+            expires_at, key = heapq.heappop(self._expiries)
+            entry = self._buckets.get(key)
+            # skip entries superseded by a later take or for evicted keys
+            if entry is not None and entry[2] == expires_at:
+                del self._buckets[key]
+
+    async def clear(self):
+        self._buckets.clear()
+        self._expiries.clear()
+
+    def __len__(self) -> int:
+        return len(self._buckets)
+
+
+# the same refill as MemoryStore, atomic on the Redis server and timed by its
+# clock; the key expires once the bucket would be full again
+TAKE_SCRIPT = """
+local capacity = tonumber(ARGV[1])
+local rate = tonumber(ARGV[2])
+local clock = redis.call('TIME')
+local now = tonumber(clock[1]) + tonumber(clock[2]) / 1000000
+local bucket = redis.call('HMGET', KEYS[1], 'tokens', 'updated_at')
+local tokens = tonumber(bucket[1]) or capacity
+local updated_at = tonumber(bucket[2]) or now
+tokens = math.min(capacity, tokens + (now - updated_at) * rate)
+local retry_after = 0
+if tokens >= 1 then
+    tokens = tokens - 1
+else
+    retry_after = (1 - tokens) / rate
+end
+redis.call('HSET', KEYS[1], 'tokens', tokens, 'updated_at', now)
+redis.call('PEXPIRE', KEYS[1], math.max(1, math.ceil((capacity - tokens) / rate * 1000)))
+return tostring(retry_after)
+"""
+
+
+class RedisStore:
+    # shared by every worker, so the limits hold across all of them
+    def __init__(self, url: str, prefix: str = "ratelimit:"):
+        import redis.asyncio
+
+        self.redis = redis.asyncio.Redis.from_url(url)
+        self.prefix = prefix
+        self._take = self.redis.register_script(TAKE_SCRIPT)
+
+    async def take(self, key: str, bucket: Bucket) -> float:
+        retry_after = await self._take(
+            keys=[self.prefix + key], args=[bucket.capacity, bucket.refill_per_second]
+        )
+        return float(retry_after)
+
+    async def clear(self):
+        async for key in self.redis.scan_iter(match=f"{self.prefix}*"):
+            await self.redis.delete(key)
+
+
+def build_store(name: str):
+    if name == "memory":
+        return MemoryStore(config.RATE_LIMIT_SIZE)
+    if name == "redis":
+        # needs the redis package (pip install redis)
+        return RedisStore(config.RATE_LIMIT_REDIS_URL)
+    raise ValueError(f"Unknown rate limit store {name!r}")
+
+
+class RateLimiter:
+    def __init__(self, store, ip_bucket: Bucket, email_bucket: Bucket, enabled: bool = True):
+        self.store = store
+        self.ip_bucket = ip_bucket
+        self.email_bucket = email_bucket
+        self.enabled = enabled
+
+    async def check(self, endpoint: str, ip: str, email: str):
+        if not self.enabled:
+            return
+        # the email bucket is only charged for requests the IP bucket let
+        # through, so one noisy client can't lock everybody out of an account
+        for name, key, bucket in (
+            ("ip", ip, self.ip_bucket),
+            ("email", email.strip().lower(), self.email_bucket),
+        ):
+            retry_after = await self.store.take(f"{endpoint}:{name}:{key}", bucket)
+            if retry_after > 0:
+                rate_limited_requests_total.labels(endpoint, name).inc()
+                # the email stays out of the message, it isn't obfuscated there
+                logger.warning(f"Rate limited {endpoint} from {ip} ({name} bucket)")
+                raise HTTPException(
+                    status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+                    detail="Too many requests",
+                    headers={"Retry-After": str(math.ceil(retry_after))}
+                )
+
+
+rate_limiter = RateLimiter(
+    build_store(config.RATE_LIMIT_STORE),
+    ip_bucket=Bucket.per_minute(config.RATE_LIMIT_IP_BURST, config.RATE_LIMIT_IP_PER_MINUTE),
+    email_bucket=Bucket.per_minute(
+        config.RATE_LIMIT_EMAIL_BURST, config.RATE_LIMIT_EMAIL_PER_MINUTE
+    ),
+    enabled=config.RATE_LIMIT_ENABLED
+)
+
+
+def rate_limit(endpoint: str):
+    # A route dependency: it runs before the endpoint body, so a rejected
+    # request never reaches the user lookup or the password hash. The body
+    # is parsed once and shared with the endpoint's own UserIn parameter.
+    async def dependency(request: Request, user: UserIn):
+        # behind a proxy, run uvicorn with --proxy-headers so this is the client
+        ip = request.client.host if request.client else "unknown"
+        await rate_limiter.check(endpoint, ip, user.email)
+
+    return dependency
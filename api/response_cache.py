@@ -0,0 +1,192 @@
+import asyncio
+import json
+import logging
+import time
+from collections import OrderedDict
+from dataclasses import asdict, dataclass
+from typing import Awaitable, Callable
+
+from fastapi import Request
+from fastapi.responses import Response
+
+from api.conditional import cache_headers, is_not_modified, not_modified_response
+from api.config import config
+from api.metrics import Counter
+
+logger = logging.getLogger(__name__)
+
+response_cache_requests_total = Counter(
+    "response_cache_requests_total",
+    "Cacheable responses by outcome: hit, stale (served while refreshing) or miss",
+    labelnames=("result",)
+)
+
+
+@dataclass
+class CachedResponse:
+    body: bytes
+    etag: str
+    last_modified: float | None
+    stored_at: float = 0.0
+
+
+class MemoryBackend:
+    # per process: with several workers, a write only invalidates the worker
+    # that handled it and the others serve their copy until it expires
+    def __init__(self, maxsize: int):
+        self.maxsize = maxsize
+        self._entries: OrderedDict[str, tuple[float, CachedResponse]] = OrderedDict()
+
+    async def get(self, key: str) -> CachedResponse | None:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        expires_at, response = entry
+        if expires_at <= time.time():
+            del self._entries[key]
+            return None
+        self._entries.move_to_end(key)
+        return response
+
+    async def set(self, key: str, response: CachedResponse, ttl: float):
+        if self.maxsize <= 0:
+            return
+        self._entries[key] = (time.time() + ttl, response)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+
+    async def delete(self, *keys: str):
+        for key in keys:
+            self._entries.pop(key, None)
+
+    async def clear(self):
+        self._entries.clear()
+
+
+class RedisBackend:
+    # shared by every worker, so invalidation reaches all of them
+    def __init__(self, url: str, prefix: str = "response:"):
+        import redis.asyncio
+
+        self.redis = redis.asyncio.Redis.from_url(url)
+        self.prefix = prefix
+
+    async def get(self, key: str) -> CachedResponse | None:
+        raw = await self.redis.get(self.prefix + key)
+        if raw is None:
+            return None
+        data = json.loads(raw)
+        return CachedResponse(**{**data, "body": data["body"].encode()})
+
+    async def set(self, key: str, response: CachedResponse, ttl: float):
+        data = {**asdict(response), "body": response.body.decode()}
+        await self.redis.set(self.prefix + key, json.dumps(data), px=max(1, int(ttl * 1000)))
+
+    async def delete(self, *keys: str):
+        if keys:
+            await self.redis.delete(*(self.prefix + key for key in keys))
+
+    async def clear(self):
+        async for key in self.redis.scan_iter(match=f"{self.prefix}*"):
+            await self.redis.delete(key)
+
+
+class ResponseCache:
+    # An entry is fresh for `ttl` seconds and is then served stale for up to
+    # `stale_ttl` more while one background task rebuilds it. Builds are
+    # single-flight per process: concurrent misses for a key wait on the same
+    # build instead of each running the queries. A ttl of 0 disables caching.
+    def __init__(self, backend, ttl: float, stale_ttl: float):
+        self.backend = backend
+        self.ttl = ttl
+        self.stale_ttl = stale_ttl
+        self._builds: dict[str, asyncio.Task] = {}
+        # builds that were running when their key was invalidated: they may
+        # have read the data from before the write, so they must not store it
+        self._invalidated_builds: set[asyncio.Task] = set()
+
+    @property
+    def enabled(self) -> bool:
+        return self.ttl > 0
+
+    async def get_or_build(
+        self, key: str, build: Callable[[], Awaitable[CachedResponse]]
+    ) -> CachedResponse:
+        if not self.enabled:
+            return await build()
+
+        cached = await self.backend.get(key)
+        if cached is not None:
+            age = time.time() - cached.stored_at
+            if age < self.ttl:
+                response_cache_requests_total.labels("hit").inc()
+                return cached
+            if age < self.ttl + self.stale_ttl:
+                response_cache_requests_total.labels("stale").inc()
+                self._start_build(key, build)
+                return cached
+
+        response_cache_requests_total.labels("miss").inc()
+        # shielded: a client going away must not cancel a build others await
+        return await asyncio.shield(self._start_build(key, build))
+
+    def _start_build(self, key: str, build) -> asyncio.Task:
+        task = self._builds.get(key)
+        if task is None:
+            task = asyncio.create_task(self._build(key, build))
+            self._builds[key] = task
+            task.add_done_callback(lambda task: self._build_done(key, task))
+        return task
+
+    def _build_done(self, key: str, task: asyncio.Task):
+        if self._builds.get(key) is task:
+            del self._builds[key]
+        self._invalidated_builds.discard(task)
+        # retrieve the error so a background refresh nobody awaits still logs
+        if not task.cancelled() and task.exception() is not None:
+            logger.debug(f"Building cached response {key} failed: {task.exception()!r}")
+
+    async def _build(self, key: str, build) -> CachedResponse:
+        response = await build()
+        response.stored_at = time.time()
+        if asyncio.current_task() not in self._invalidated_builds:
+            await self.backend.set(key, response, self.ttl + self.stale_ttl)
+        return response
+
+    async def invalidate(self, *keys: str):
+        if not self.enabled:
+            return
+        for key in keys:
+            # later requests start a fresh build instead of joining this one
+            task = self._builds.pop(key, None)
+            if task is not None:
+                self._invalidated_builds.add(task)
+        await self.backend.delete(*keys)
+
+    async def clear(self):
+        await self.invalidate(*self._builds)
+        await self.backend.clear()
+
+
+def cached_json_response(request: Request, cached: CachedResponse) -> Response:
+    headers = cache_headers(cached.etag, cached.last_modified)
+    if is_not_modified(request.headers, cached.etag, cached.last_modified):
+        return not_modified_response(headers)
+    return Response(content=cached.body, headers=headers, media_type="application/json")
+
+
+def build_backend(name: str):
+    if name == "memory":
+        return MemoryBackend(config.RESPONSE_CACHE_SIZE)
+    if name == "redis":
+        # needs the redis package (pip install redis)
+        return RedisBackend(config.RESPONSE_CACHE_REDIS_URL)
+    raise ValueError(f"Unknown response cache backend {name!r}")
+
+
+response_cache = ResponseCache(
+    build_backend(config.RESPONSE_CACHE_BACKEND),
+    ttl=config.RESPONSE_CACHE_TTL_SECONDS,
+    stale_ttl=config.RESPONSE_CACHE_STALE_SECONDS
+)
@@ -0,0 +1,12 @@
+from fastapi import APIRouter, Response
+
+from api.config import config
+from api.metrics import CONTENT_TYPE, generate_latest
+
+router = APIRouter()
+
+# sync on purpose: in multiprocess mode it reads every worker's snapshot
+# file, which FastAPI then does in the threadpool
+@router.get('/metrics', include_in_schema=False)
+def metrics():
+    return Response(generate_latest(config.METRICS_DIR), media_type=CONTENT_TYPE)
@@ -1,41 +1,65 @@
 import logging
 from enum import Enum
-from typing import Annotated
+from typing import Annotated, AsyncIterator
 
-import sqlalchemy
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Query, Request
+from fastapi.responses import StreamingResponse
+from pydantic_core import to_json
 
-from api.database import comment_table, database, like_table, post_table
+from api import statements
+from api.conditional import (
+    cache_headers,
+    is_not_modified,
+    make_etag,
+    not_modified_response,
+)
+from api.database import comment_table, database, post_table
 from api.models.post import (
     Comment,
     CommentIn,
     PostLikeIn,
+    SearchHit,
+    SearchPage,
     UserPost,
     UserPostIn,
+    UserPostPage,
     UserPostWithComment,
 )
 from api.models.user import User
+from api.pagination import DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE, decode_cursor, paginate
+from api.response_cache import CachedResponse, cached_json_response, response_cache
+from api.search import match_query
 from api.security import get_current_user
+from api.serialization import RowSerializer, json_response
 
 router = APIRouter()
 logger = logging.getLogger(__name__)
 
-select_post_and_likes = sqlalchemy.select(
-    post_table,
-    sqlalchemy.func.count(like_table.c.id).label("likes")
-).select_from(post_table.outerjoin(like_table)).group_by(post_table.c.id)
+post_serializer = RowSerializer(UserPost)
+comment_serializer = RowSerializer(Comment)
+search_serializer = RowSerializer(SearchHit)
 
 async def find_post(post_id: int):
-    query = post_table.select().where(post_table.c.id == post_id)
-    return await database.fetch_one(query)
+    return await database.fetch_one(statements.find_post(post_id=post_id))
+
+async def post_validators(post_id: int, resource: str) -> tuple[str, float | None] | None:
+    # one primary key lookup, made before the page query so a conditional
+    # request that still matches never runs it; None when there's no post
+    row = await database.fetch_one(statements.post_version(post_id=post_id))
+    if row is None:
+        return None
+    return make_etag(resource, post_id, row.version), row.updated_at
 
 @router.post('/', response_model=UserPost, status_code=201)
-async def createPost(post: UserPostIn, current_user: Annotated[User, get_current_user ]):
+async def createPost(post: UserPostIn, current_user: Annotated[User, Depends(get_current_user)]):
        
     
     data = {**post.model_dump(), "user_id": current_user.id}
-    query = post_table.insert().values(data)
-    last_record_id = await database.execute(query)
+    query = post_table.insert().values({**data, "updated_at": statements.now})
+    async with database.transaction():
+        last_record_id = await database.execute(query)
+        await database.execute(statements.bump_change_counter(name="posts"))
+    await response_cache.invalidate(*feed_cache_keys("posts"))
     return  { **data, "id":last_record_id}
 
 class PostSorting(str, Enum):
@@ -43,27 +67,188 @@ class PostSorting(str, Enum):
     oldest = "old"
     most_liked = "most_liked"
 
-@router.get('/', response_model=list[UserPost])
-async def get_all_posts(sorting: PostSorting = PostSorting.newest):
+def sorted_posts_query(
+    sorting: PostSorting, cursor: str | None = None, limit: int | None = None
+):
+    values = {}
+    if cursor:
+        if sorting == PostSorting.most_liked:
+            values["last_likes"], values["last_id"] = decode_cursor(
+                cursor, sorting.value, "likes", "id"
+            )
+        else:
+            (values["last_id"],) = decode_cursor(cursor, sorting.value, "id")
+    if limit is not None:
+        values["limit"] = limit
+
+    statement = statements.sorted_posts[(sorting.value, limit is not None, bool(cursor))]
+    return statement(**values)
+
+
+# the change counters each feed order depends on: every order changes when a
+# post is added, only most_liked when a like count does
+FEED_CHANGE_COUNTERS = {
+    PostSorting.newest: ("posts",),
+    PostSorting.oldest: ("posts",),
+    PostSorting.most_liked: ("posts", "likes"),
+}
+
+
+async def feed_validators(sorting: PostSorting) -> tuple[str, float | None]:
+    counters = {
+        row.name: row for row in await database.fetch_all(statements.change_counters())
+    }
+    names = FEED_CHANGE_COUNTERS[sorting]
+    # a counter nobody has bumped yet has no row
+    values = [counters[name].value if name in counters else 0 for name in names]
+    last_modified = max(
+        (counters[name].changed_at for name in names if name in counters), default=None
+    )
+    return make_etag("posts", sorting.value, *values), last_modified
+
+
+# Only the first page in the default size is cached, one entry per order,
+# and a write invalidates the orders its change counter feeds into.
+def feed_cache_key(sorting: PostSorting) -> str:
+    return f"posts:{sorting.value}"
+
+
+def feed_cache_keys(counter: str) -> list[str]:
+    return [
+        feed_cache_key(sorting)
+        for sorting, counters in FEED_CHANGE_COUNTERS.items() if counter in counters
+    ]
+
+
+def post_cursor(sorting: PostSorting, row) -> dict:
+    if sorting == PostSorting.most_liked:
+        return {"k": sorting.value, "likes": row.likes, "id": row.id}
+    return {"k": sorting.value, "id": row.id}
+
+
+@router.get('/', response_model=UserPostPage)
+async def get_all_posts(
+    request: Request,
+    sorting: PostSorting = PostSorting.newest,
+    cursor: str | None = None,
+    limit: Annotated[int, Query(ge=1, le=MAX_PAGE_SIZE)] = DEFAULT_PAGE_SIZE
+):
 
     logger.info("Getting all posts")
 
-    if sorting == PostSorting.newest:
-        query = post_table.select().order_by(post_table.c.id.desc())
+    if response_cache.enabled and cursor is None and limit == DEFAULT_PAGE_SIZE:
+        cached = await response_cache.get_or_build(
+            feed_cache_key(sorting), lambda: build_first_feed_page(sorting)
+        )
+        return cached_json_response(request, cached)
+
+    etag, last_modified = await feed_validators(sorting)
+    headers = cache_headers(etag, last_modified)
+    if is_not_modified(request.headers, etag, last_modified):
+        return not_modified_response(headers)
+    return json_response(await feed_page(sorting, cursor, limit), headers=headers)
 
-    elif sorting == PostSorting.oldest:
-        query = post_table.select().order_by(post_table.c.id.asc())
 
-    elif sorting == PostSorting.most_liked:
-        query = select_post_and_likes.order_by(sqlalchemy.desc('likes'))
-    
-    logger.debug(query)
+async def feed_page(sorting: PostSorting, cursor: str | None, limit: int) -> dict:
+    query = sorted_posts_query(sorting, cursor, limit + 1)
+
+    rows = await database.fetch_all(query)
+    items, next_cursor = paginate(
+        rows, limit, lambda row: post_cursor(sorting, row)
+    )
+    return {
+        "items": post_serializer.dump_many(items),
+        "next_cursor": next_cursor
+    }
+
+
+async def build_first_feed_page(sorting: PostSorting) -> CachedResponse:
+    etag, last_modified = await feed_validators(sorting)
+    page = await feed_page(sorting, None, DEFAULT_PAGE_SIZE)
+    return CachedResponse(to_json(page), etag, last_modified)
+
+
+class StreamFormat(str, Enum):
+    ndjson = "ndjson"
+    json = "json"
+
+STREAM_MEDIA_TYPES = {
+    StreamFormat.ndjson: "application/x-ndjson",
+    StreamFormat.json: "application/json",
+}
+
+# rows are flushed in small batches: one network write per row is too chatty,
+# while a batch keeps memory bounded regardless of table size
+STREAM_BATCH_SIZE = 100
+
+async def stream_posts(query, format: StreamFormat) -> AsyncIterator[bytes]:
+    separator = b"\n" if format == StreamFormat.ndjson else b","
+    first = True
+    batch = []
+
+    if format == StreamFormat.json:
+        yield b"["
+    async for row in database.iterate(query):
+        encoded = to_json(post_serializer.dump(row))
+        if format == StreamFormat.ndjson:
+            batch.append(encoded + separator)
+        else:
+            batch.append(encoded if first else separator + encoded)
+        first = False
+        if len(batch) >= STREAM_BATCH_SIZE:
+            yield b"".join(batch)
+            batch.clear()
+    if batch:
+        yield b"".join(batch)
+    if format == StreamFormat.json:
+        yield b"]"
+
+
+@router.get(
+    '/stream',
+    response_class=StreamingResponse,
+    responses={200: {"content": {media_type: {} for media_type in STREAM_MEDIA_TYPES.values()}}}
+)
+async def stream_all_posts(
+    sorting: PostSorting = PostSorting.newest,
+    format: StreamFormat = StreamFormat.ndjson,
+    cursor: str | None = None
+):
+    logger.info(f"Streaming all posts as {format.value}")
+    query = sorted_posts_query(sorting, cursor)
+    return StreamingResponse(
+        stream_posts(query, format), media_type=STREAM_MEDIA_TYPES[format]
+    )
 
-    return await database.fetch_all(query)
+
+# declared before /{post_id}, which would otherwise try to parse "search" as an id
+@router.get('/search', response_model=SearchPage)
+async def search_posts(
+    q: Annotated[str, Query(min_length=1, max_length=200)],
+    cursor: str | None = None,
+    limit: Annotated[int, Query(ge=1, le=MAX_PAGE_SIZE)] = DEFAULT_PAGE_SIZE
+):
+    logger.info(f"Searching posts for {q!r}")
+
+    query = match_query(q)
+    if query is None:
+        return json_response({"items": [], "next_cursor": None})
+
+    values = {"query": query, "limit": limit + 1}
+    if cursor:
+        values["last_score"], values["last_id"] = decode_cursor(cursor, "search", "score", "id")
+    rows = await database.fetch_all(statements.search_posts[bool(cursor)](**values))
+    items, next_cursor = paginate(
+        rows, limit, lambda row: {"k": "search", "score": row.score, "id": row.id}
+    )
+    return json_response({
+        "items": search_serializer.dump_many(items),
+        "next_cursor": next_cursor
+    })
 
 
 @router.post('/comment', response_model=Comment, status_code=201)
-async def createComment(comment:CommentIn, current_user: Annotated[User, get_current_user]):
+async def createComment(comment:CommentIn, current_user: Annotated[User, Depends(get_current_user)]):
     
     post = await find_post(comment.post_id)
     
@@ -74,31 +259,126 @@ async def createComment(comment:CommentIn, current_user: Annotated[User, get_cur
 
     data = {**comment.model_dump(), "user_id": current_user.id }
     query = comment_table.insert().values(data)
-    last_record_id = await database.execute(query)
+    async with database.transaction():
+        last_record_id = await database.execute(query)
+        await database.execute(statements.bump_post_version(post_id=comment.post_id))
+    await response_cache.invalidate(post_cache_key(comment.post_id))
     
     return { **data, "id": last_record_id}
 
 @router.get('/{post_id}/comment', response_model=list[Comment])
-async def get_all_post_comments(post_id: int):
-    query = comment_table.select().where(comment_table.c.post_id == post_id)
-    return await database.fetch_all(query)
+async def get_all_post_comments(post_id: int, request: Request):
+    headers = None
+    validators = await post_validators(post_id, "comments")
+    if validators is not None:
+        headers = cache_headers(*validators)
+        if is_not_modified(request.headers, *validators):
+            return not_modified_response(headers)
+
+    query = statements.post_comments(post_id=post_id)
+    return json_response(
+        comment_serializer.dump_many(await database.fetch_all(query)), headers=headers
+    )
    
+def post_cache_key(post_id: int) -> str:
+    return f"post:{post_id}"
+
+
 @router.get("/{post_id}", response_model=UserPostWithComment)
-async def get_post_with_comments(post_id: int):
+async def get_post_with_comments(
+    post_id: int,
+    request: Request,
+    comment_cursor: str | None = None,
+    comment_limit: Annotated[int, Query(ge=1, le=MAX_PAGE_SIZE)] = DEFAULT_PAGE_SIZE
+):
     logger.info(f"Getting post with id {post_id} and its comments")
-    query = select_post_and_likes.where(post_table.c.id == post_id)
 
-    logger.debug(f"Executing query: {query}")
+    if response_cache.enabled and comment_cursor is None and comment_limit == DEFAULT_PAGE_SIZE:
+        cached = await response_cache.get_or_build(
+            post_cache_key(post_id), lambda: build_post_page(post_id)
+        )
+        return cached_json_response(request, cached)
+
+    validators = await post_validators(post_id, "post")
+    if validators is None:
+        raise HTTPException(status_code=404, detail="post not found")
+    headers = cache_headers(*validators)
+    if is_not_modified(request.headers, *validators):
+        return not_modified_response(headers)
+    return json_response(
+        await post_page(post_id, comment_cursor, comment_limit), headers=headers
+    )
 
-    post = await database.fetch_one(query)
 
-    if not post:
+async def post_page(post_id: int, comment_cursor: str | None, comment_limit: int) -> dict:
+    values = {"post_id": post_id, "limit": comment_limit + 1}
+    if comment_cursor:
+        (values["last_comment_id"],) = decode_cursor(comment_cursor, "comment", "id")
+    query = statements.post_with_comments[bool(comment_cursor)](**values)
+
+    rows = await database.fetch_all(query)
+
+    if not rows:
         raise HTTPException(status_code=404, detail="post not found")
+
+    post = rows[0]
+    comments = [
+        {
+            "id": row.comment_id,
+            "body": row.comment_body,
+            "post_id": post.id,
+            "user_id": row.comment_user_id
+        }
+        for row in rows if row.comment_id is not None
+    ]
+    comments, next_comment_cursor = paginate(
+        comments, comment_limit, lambda comment: {"k": "comment", "id": comment["id"]}
+    )
     return {
-        "post": post,
-        "comment": await get_all_post_comments(post_id)
+        "post": {
+            "id": post.id,
+            "body": post.body,
+            "user_id": post.user_id,
+            "likes": post.likes
+        },
+        "comment": comments,
+        "next_comment_cursor": next_comment_cursor
     }
 
+
+async def build_post_page(post_id: int) -> CachedResponse:
+    validators = await post_validators(post_id, "post")
+    if validators is None:
+        raise HTTPException(status_code=404, detail="post not found")
+    page = await post_page(post_id, None, DEFAULT_PAGE_SIZE)
+    return CachedResponse(to_json(page), *validators)
+
+
+async def toggle_like(post_id: int, user_id: int):
+    like_key = {"post_id": post_id, "user_id": user_id}
+
+    # the unique (post_id, user_id) index turns the toggle into one indexed
+    # delete, falling back to an insert when there was nothing to delete
+    async with database.transaction():
+        deleted_like = await database.fetch_one(statements.delete_like(**like_key))
+        if deleted_like:
+            logger.info('disliking post')
+            await database.execute(statements.update_like_count(post_id=post_id, delta=-1))
+            await database.execute(statements.bump_change_counter(name="likes"))
+            return None
+
+        inserted_like = await database.fetch_one(statements.insert_like(**like_key))
+        if inserted_like:
+            await database.execute(statements.update_like_count(post_id=post_id, delta=1))
+            await database.execute(statements.bump_change_counter(name="likes"))
+            return inserted_like.id
+
+    # a concurrent request from the same user inserted the like first, and
+    # another one may already have toggled it off again
+    existing_like = await database.fetch_one(statements.find_like(**like_key))
+    return existing_like.id if existing_like else None
+
+
 @router.post('/like', status_code=201)
 async def like_post(like: PostLikeIn, current_user: Annotated[User, Depends(get_current_user)]):
     logger.info(f"User {current_user.id} is liking post {like.post_id}")
@@ -106,25 +386,12 @@ async def like_post(like: PostLikeIn, current_user: Annotated[User, Depends(get_
     
     if not post:
         raise HTTPException(status_code=404, detail='post not found')
-    existing_like_query = like_table.select().where(
-        (like_table.c.post_id == like.post_id) &
-        (like_table.c.user_id == current_user.id)
-    )
-    existing_like = await database.fetch_one(existing_like_query)
-    if existing_like:
-        logger.info('disliking post')
-        query = like_table.delete().where(
-            (like_table.c.post_id == like.post_id) &
-            (like_table.c.user_id == current_user.id)
-        )
-        await database.execute(query)
-        return {"message": "Post disliked"}
-    data = {**like.model_dump(), "user_id": current_user.id }
-    query = like_table.insert().values(data)
-
-    logger.debug(f"Executing query: {query}")
-
-    last_record_id = await database.execute(query)
-    return { **data, "id": last_record_id}
 
+    like_id = await toggle_like(like.post_id, current_user.id)
+    # after the commit, so a rebuild can't cache the old count
+    await response_cache.invalidate(post_cache_key(like.post_id), *feed_cache_keys("likes"))
+    if like_id is None:
+        return {"message": "Post disliked"}
 
+    data = {**like.model_dump(), "user_id": current_user.id }
+    return { **data, "id": like_id}
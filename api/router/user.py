@@ -1,43 +1,67 @@
 import logging
+from typing import Annotated
 
-from fastapi import APIRouter, BackgroundTasks, HTTPException, Request, status
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, status
 
+from api import statements
 from api.database import database, user_table
+from api.models.post import (
+    Comment,
+    CommentPage,
+    LikedPost,
+    LikedPostPage,
+    UserPostWithLikes,
+    UserPostWithLikesPage,
+)
 from api.models.user import UserIn
+from api.outbox import enqueue_registration_email
+from api.pagination import DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE, decode_cursor, paginate
+from api.rate_limit import rate_limit
 from api.security import (
     authenticate_user,
     create_access_token,
     create_confirmation_token,
-    get_password_hash,
+    get_password_hash_async,
     get_subject_for_token_type,
     get_user,
+    invalidate_user,
 )
-from api.tasks import send_registeration_email
+from api.serialization import RowSerializer, json_response
 
 router = APIRouter()
 logger = logging.getLogger(__name__)
 
-@router.post('/register', status_code=201)
-async def register(user: UserIn, background_task: BackgroundTasks, request: Request):
+listing_serializers = {
+    "posts": RowSerializer(UserPostWithLikes),
+    "comments": RowSerializer(Comment),
+    "likes": RowSerializer(LikedPost),
+}
+# the likes listing pages through the likes themselves, newest first
+listing_cursor_columns = {"posts": "id", "comments": "id", "likes": "like_id"}
+
+@router.post('/register', status_code=201, dependencies=[Depends(rate_limit("register"))])
+async def register(user: UserIn, request: Request):
     if await get_user(user.email):
         raise HTTPException (
             status_code=status.HTTP_400_BAD_REQUEST,
             detail="A user with that email already exists"
         )
-    hashed_password = get_password_hash(user.password)
+    hashed_password = await get_password_hash_async(user.password)
     query = user_table.insert().values(email=user.email, password=hashed_password)
 
-    logger.debug(query)
-
-    await database.execute(query)
-    background_task.add_task(
-        send_registeration_email,
-        user.email,
-        confirmation_url= request.url_for('confirm_email', token=create_confirmation_token(user.email))
-    )
+    # the email is written to the outbox in the same transaction as the user,
+    # the outbox worker delivers it; registration never waits on Mailgun
+    async with database.transaction():
+        await database.execute(query)
+        await enqueue_registration_email(
+            user.email,
+            confirmation_url=str(request.url_for(
+                'confirm_email', token=create_confirmation_token(user.email)
+            ))
+        )
     return { "detail": "Please Confirm your email"}
 
-@router.post('/token')
+@router.post('/token', dependencies=[Depends(rate_limit("token"))])
 async def login(user: UserIn):
     user = await authenticate_user(user.email, user.password)
     access_token = create_access_token(user.email)
@@ -47,7 +71,53 @@ async def login(user: UserIn):
 async def confirm_email(token: str):
     email = get_subject_for_token_type(token, "confirmation")
     query = user_table.update().where(user_table.c.email == email).values(confirmed=True)
-
-    logger.debug(query)
     await database.execute(query)
+    invalidate_user(email)
     return {"detail": "Email confirmed"}
+
+
+async def user_listing(user_id: int, listing: str, cursor: str | None, limit: int):
+    kind = f"user_{listing}"
+    values = {"user_id": user_id, "limit": limit + 1}
+    if cursor:
+        (values["last_id"],) = decode_cursor(cursor, kind, "id")
+    rows = await database.fetch_all(statements.user_listings[(listing, bool(cursor))](**values))
+
+    # only an empty first page needs to tell "no such user" from "nothing yet"
+    if not rows and not cursor:
+        if await database.fetch_one(statements.find_user(user_id=user_id)) is None:
+            raise HTTPException(status_code=404, detail="user not found")
+
+    column = listing_cursor_columns[listing]
+    items, next_cursor = paginate(rows, limit, lambda row: {"k": kind, "id": row[column]})
+    return json_response({
+        "items": listing_serializers[listing].dump_many(items),
+        "next_cursor": next_cursor
+    })
+
+@router.get('/user/{user_id}/posts', response_model=UserPostWithLikesPage)
+async def get_user_posts(
+    user_id: int,
+    cursor: str | None = None,
+    limit: Annotated[int, Query(ge=1, le=MAX_PAGE_SIZE)] = DEFAULT_PAGE_SIZE
+):
+    logger.info(f"Getting posts of user {user_id}")
+    return await user_listing(user_id, "posts", cursor, limit)
+
+@router.get('/user/{user_id}/comments', response_model=CommentPage)
+async def get_user_comments(
+    user_id: int,
+    cursor: str | None = None,
+    limit: Annotated[int, Query(ge=1, le=MAX_PAGE_SIZE)] = DEFAULT_PAGE_SIZE
+):
+    logger.info(f"Getting comments of user {user_id}")
+    return await user_listing(user_id, "comments", cursor, limit)
+
+@router.get('/user/{user_id}/likes', response_model=LikedPostPage)
+async def get_user_likes(
+    user_id: int,
+    cursor: str | None = None,
+    limit: Annotated[int, Query(ge=1, le=MAX_PAGE_SIZE)] = DEFAULT_PAGE_SIZE
+):
+    logger.info(f"Getting posts liked by user {user_id}")
+    return await user_listing(user_id, "likes", cursor, limit)
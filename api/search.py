@@ -0,0 +1,77 @@
+import re
+import sqlite3
+
+# Post and comment bodies share one FTS5 index, so a single bm25 ranking
+# covers both. Index rowids are derived from the source row (2 * post id,
+# 2 * comment id + 1) so the triggers can update and delete entries by
+# rowid instead of scanning the unindexed columns.
+SEARCH_TABLE = "post_search"
+
+SEARCH_INDEX_DDL = [
+    f"""CREATE VIRTUAL TABLE IF NOT EXISTS {SEARCH_TABLE} USING fts5(
+        body, post_id UNINDEXED, comment_id UNINDEXED, tokenize = 'unicode61'
+    )""",
+    f"""CREATE TRIGGER IF NOT EXISTS posts_search_insert AFTER INSERT ON posts BEGIN
+        INSERT INTO {SEARCH_TABLE} (rowid, body, post_id, comment_id)
+        VALUES (new.id * 2, new.body, new.id, NULL);
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS posts_search_update AFTER UPDATE OF body ON posts BEGIN
+        DELETE FROM {SEARCH_TABLE} WHERE rowid = old.id * 2;
+        INSERT INTO {SEARCH_TABLE} (rowid, body, post_id, comment_id)
+        VALUES (new.id * 2, new.body, new.id, NULL);
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS posts_search_delete AFTER DELETE ON posts BEGIN
+        DELETE FROM {SEARCH_TABLE} WHERE rowid = old.id * 2;
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS comments_search_insert AFTER INSERT ON comments BEGIN
+        INSERT INTO {SEARCH_TABLE} (rowid, body, post_id, comment_id)
+        VALUES (new.id * 2 + 1, new.body, new.post_id, new.id);
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS comments_search_update
+    AFTER UPDATE OF body, post_id ON comments BEGIN
+        DELETE FROM {SEARCH_TABLE} WHERE rowid = old.id * 2 + 1;
+        INSERT INTO {SEARCH_TABLE} (rowid, body, post_id, comment_id)
+        VALUES (new.id * 2 + 1, new.body, new.post_id, new.id);
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS comments_search_delete AFTER DELETE ON comments BEGIN
+        DELETE FROM {SEARCH_TABLE} WHERE rowid = old.id * 2 + 1;
+    END""",
+]
+
+REBUILD_SEARCH_INDEX = [
+    f"DELETE FROM {SEARCH_TABLE}",
+    f"""INSERT INTO {SEARCH_TABLE} (rowid, body, post_id, comment_id)
+        SELECT id * 2, body, id, NULL FROM posts""",
+    f"""INSERT INTO {SEARCH_TABLE} (rowid, body, post_id, comment_id)
+        SELECT id * 2 + 1, body, post_id, id FROM comments""",
+    # merge the b-trees the bulk insert left behind
+    f"INSERT INTO {SEARCH_TABLE} ({SEARCH_TABLE}) VALUES ('optimize')",
+]
+
+MAX_SEARCH_TERMS = 16
+
+term_pattern = re.compile(r"\w+")
+
+
+def match_query(q: str) -> str | None:
+    # FTS5 query syntax (quotes, AND/OR/NOT, column filters, ...) is not
+    # exposed: every word is matched as a quoted term and all must appear
+    terms = term_pattern.findall(q)[:MAX_SEARCH_TERMS]
+    if not terms:
+        return None
+    return " ".join(f'"{term}"' for term in terms)
+
+
+class SearchIndexConnection(sqlite3.Connection):
+    # Preparing a statement that fires the search triggers connects the FTS5
+    # table, which reads its config. Inside a deferred BEGIN that read takes a
+    # shared lock the transaction then has to upgrade to write, and two
+    # concurrent writers deadlock on it ("database is locked", no waiting).
+    # Connecting the table up front, outside any transaction, avoids it.
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        try:
+            self.execute(f"SELECT 1 FROM {SEARCH_TABLE} LIMIT 0").close()
+        except sqlite3.OperationalError:
+            # not migrated yet
+            pass
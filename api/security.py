@@ -1,5 +1,9 @@
+import asyncio
 import datetime
+import hashlib
 import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
 from typing import Annotated, Literal
 
 from fastapi import Depends, HTTPException, status
@@ -7,8 +11,11 @@ from fastapi.security import OAuth2PasswordBearer
 from jose import ExpiredSignatureError, JWTError, jwt
 from passlib.context import CryptContext
 
+from api import statements
+from api.cache import TTLCache
 from api.config import config
 from api.database import database, user_table
+from api.metrics import Histogram
 
 logger = logging.getLogger(__name__)
 
@@ -16,6 +23,31 @@ SECRET_KEY = config.SECRET_KEY
 ALGORITHM = 'HS256'
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl='token')
 
+def load_jwt_backend(name: str):
+    if name == "jose":
+        return jwt.encode, jwt.decode
+    if name != "pyjwt":
+        raise ValueError(f"Unknown JWT backend {name!r}")
+
+    import jwt as pyjwt
+
+    # translate PyJWT errors so callers only ever deal with jose's exceptions
+    def decode(token: str, key: str, algorithms: list[str]) -> dict:
+        try:
+            return pyjwt.decode(token, key, algorithms=algorithms)
+        except pyjwt.ExpiredSignatureError as e:
+            raise ExpiredSignatureError(str(e)) from e
+        except pyjwt.InvalidTokenError as e:
+            raise JWTError(str(e)) from e
+
+    return pyjwt.encode, decode
+
+jwt_encode, jwt_decode = load_jwt_backend(config.JWT_BACKEND)
+
+# Verified claims keyed by a digest of the token, kept until the token's own
+# exp; tokens are immutable, so a hit can never be stale.
+token_cache = TTLCache("token", maxsize=config.TOKEN_CACHE_SIZE, ttl=float("inf"))
+
 def create_credentials_exception(detail: str) -> HTTPException:
     return HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
@@ -45,7 +77,7 @@ def create_access_token(email: str):
         "type": "access"
     }
 
-    encoded_jwt = jwt.encode(jwt_data, key=SECRET_KEY, algorithm=ALGORITHM)
+    encoded_jwt = jwt_encode(jwt_data, key=SECRET_KEY, algorithm=ALGORITHM)
     return encoded_jwt
 
 def create_confirmation_token(email: str):
@@ -59,12 +91,24 @@ def create_confirmation_token(email: str):
         "exp": expire,
         "type": "confirmation"
     }
-    encoded_jwt = jwt.encode(jwt_data, key=SECRET_KEY, algorithm=ALGORITHM)
+    encoded_jwt = jwt_encode(jwt_data, key=SECRET_KEY, algorithm=ALGORITHM)
     return encoded_jwt
 
+def decode_token(token: str) -> dict:
+    cache_key = hashlib.sha256(token.encode()).digest()
+    payload = token_cache.get(cache_key)
+    if payload is not None:
+        return payload
+
+    payload = jwt_decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+    expires = payload.get('exp')
+    if isinstance(expires, (int, float)):
+        token_cache.set(cache_key, payload, ttl=expires - time.time())
+    return payload
+
 def get_subject_for_token_type(token: str, token_type: Literal["access", "confirmation"]) -> str:
     try:
-        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+        payload = decode_token(token)
        
         
     except ExpiredSignatureError as e:
@@ -83,7 +127,34 @@ def get_subject_for_token_type(token: str, token_type: Literal["access", "confir
     return email
 
 
-pwd_context = CryptContext(schemes=['bcrypt'])
+def build_password_context(
+    schemes: list[str],
+    bcrypt_rounds: int,
+    argon2_time_cost: int,
+    argon2_memory_cost: int,
+    argon2_parallelism: int
+) -> CryptContext:
+    # pinning min/max to the configured cost makes needs_update() flag hashes
+    # made with a different cost, not just ones made with an old scheme
+    return CryptContext(
+        schemes=schemes,
+        deprecated="auto",
+        bcrypt__rounds=bcrypt_rounds,
+        bcrypt__min_rounds=bcrypt_rounds,
+        bcrypt__max_rounds=bcrypt_rounds,
+        argon2__type="ID",
+        argon2__time_cost=argon2_time_cost,
+        argon2__memory_cost=argon2_memory_cost,
+        argon2__parallelism=argon2_parallelism
+    )
+
+pwd_context = build_password_context(
+    schemes=config.PASSWORD_HASH_SCHEMES,
+    bcrypt_rounds=config.BCRYPT_ROUNDS,
+    argon2_time_cost=config.ARGON2_TIME_COST,
+    argon2_memory_cost=config.ARGON2_MEMORY_COST,
+    argon2_parallelism=config.ARGON2_PARALLELISM
+)
 
 def get_password_hash(password: str):
     return pwd_context.hash(password)
@@ -91,11 +162,87 @@ def get_password_hash(password: str):
 def verify_password(plain_password: str, hashed_password: str) -> bool:
     return pwd_context.verify(plain_password, hashed_password)
 
+def verify_and_update_password(
+    plain_password: str, hashed_password: str
+) -> tuple[bool, str | None]:
+    return pwd_context.verify_and_update(plain_password, hashed_password)
+
+
+password_hash_wait_seconds = Histogram(
+    "password_hash_wait_seconds",
+    "Time a password hash spent queued before a worker picked it up"
+)
+password_hash_duration_seconds = Histogram(
+    "password_hash_duration_seconds",
+    "Time spent hashing or verifying a password"
+)
+
+class PasswordHasher:
+    def __init__(self, max_workers: int, max_pending: int):
+        self.max_workers = max_workers
+        self.max_pending = max_pending
+        self._executor: ThreadPoolExecutor | None = None
+        # only touched from the event loop thread, so no lock is needed
+        self.pending = 0
+
+    @property
+    def executor(self) -> ThreadPoolExecutor:
+        # created on first use, and again after shutdown(), so the same
+        # hasher serves every lifespan of the app in a process
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(
+                max_workers=self.max_workers, thread_name_prefix="password-hash"
+            )
+        return self._executor
+
+    async def run(self, func, *args):
+        if self.pending >= self.max_pending:
+            logger.warning(f"Password hash queue is full ({self.pending} pending)")
+            raise HTTPException(
+                status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                detail="Server is busy, please retry shortly",
+                headers={"Retry-After": "1"}
+            )
+
+        queued_at = time.perf_counter()
+
+        def timed():
+            password_hash_wait_seconds.observe(time.perf_counter() - queued_at)
+            with password_hash_duration_seconds.time():
+                return func(*args)
+
+        self.pending += 1
+        try:
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(self.executor, timed)
+        finally:
+            self.pending -= 1
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+password_hasher = PasswordHasher(
+    max_workers=config.PASSWORD_HASH_WORKERS,
+    max_pending=config.PASSWORD_HASH_MAX_PENDING
+)
+
+async def get_password_hash_async(password: str) -> str:
+    return await password_hasher.run(get_password_hash, password)
+
+async def verify_and_update_password_async(
+    plain_password: str, hashed_password: str
+) -> tuple[bool, str | None]:
+    return await password_hasher.run(
+        verify_and_update_password, plain_password, hashed_password
+    )
+
 
 async def get_user(email: str):
     
     logger.debug("fetching user from the database", extra={"email": email})
-    query = user_table.select().where(user_table.c.email == email)
+    query = statements.find_user_by_email(email=email)
     result =  await database.fetch_one(query)
 
     if result:
@@ -106,15 +253,33 @@ async def authenticate_user(email: str, password: str):
     user = await get_user(email)
     if not user:
         raise create_credentials_exception("User not found")
-    if not verify_password(password, user.password):
+    verified, new_hash = await verify_and_update_password_async(password, user.password)
+    if not verified:
         raise create_credentials_exception("Incorrect email or password")
+    if new_hash:
+        logger.info("Upgrading outdated password hash", extra={"email": email})
+        query = user_table.update().where(user_table.c.id == user.id).values(password=new_hash)
+        await database.execute(query)
+        invalidate_user(email)
     if(not user.confirmed):
         raise create_credentials_exception("user has not confirmed email")
     return user
 
+# Rows are cached per process, so a change made through another worker is
+# only picked up once the entry expires; keep the TTL short.
+user_cache = TTLCache(
+    "user", maxsize=config.USER_CACHE_SIZE, ttl=config.USER_CACHE_TTL_SECONDS
+)
+
+def invalidate_user(email: str):
+    user_cache.invalidate(email)
+
 async def get_current_user(token: Annotated[str, Depends(oauth2_scheme)]):
     email = get_subject_for_token_type(token, "access")
-    user = await get_user(email=email)
-    if not user:
-        raise create_credentials_exception("User not found")
+    user = user_cache.get(email)
+    if user is None:
+        user = await get_user(email=email)
+        if not user:
+            raise create_credentials_exception("User not found")
+        user_cache.set(email, user)
     return user
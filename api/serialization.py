@@ -0,0 +1,35 @@
+from typing import Any
+
+from fastapi.responses import Response
+from pydantic import BaseModel
+from pydantic_core import to_json
+
+
+class RowSerializer:
+    # Rows coming from our own tables already have the types the response
+    # models declare, so validating them again on the way out only costs CPU.
+    # This projects a row onto a model's fields instead; the route keeps its
+    # response_model so the OpenAPI schema is unchanged.
+    def __init__(self, model: type[BaseModel]):
+        self.fields = tuple(model.model_fields)
+
+    def dump(self, row) -> dict:
+        return {field: row[field] for field in self.fields}
+
+    def dump_many(self, rows) -> list[dict]:
+        # through the public record interface, which applies the columns'
+        # result processing (SQLite hands booleans and dates back raw)
+        fields = self.fields
+        return [{field: row[field] for field in fields} for row in rows]
+
+
+def json_response(
+    content: Any, status_code: int = 200, headers: dict[str, str] | None = None
+) -> Response:
+    # returning a Response makes FastAPI skip response_model validation
+    return Response(
+        content=to_json(content),
+        status_code=status_code,
+        headers=headers,
+        media_type="application/json"
+    )
@@ -0,0 +1,270 @@
+import sqlalchemy
+from sqlalchemy.dialects import sqlite
+
+from api.database import (
+    change_counter_table,
+    comment_table,
+    like_table,
+    post_table,
+    user_table,
+)
+from api.search import SEARCH_TABLE
+
+# Hot-path statements are built and compiled once, at import, and executed as
+# text() with bound parameters, so a request only pays for binding values
+# instead of rebuilding the Core construct and compiling it again.
+# Placeholders are rendered as :name, which is what text() parses back.
+dialect = sqlite.dialect(paramstyle="named")
+
+STATEMENTS: dict[str, "Statement"] = {}
+
+
+class Statement:
+    def __init__(self, name: str, construct: sqlalchemy.Executable):
+        compiled = construct.compile(dialect=dialect)
+        self.name = name
+        self.construct = construct
+        self.sql = str(compiled)
+        # typed result columns, so records are keyed exactly as the construct's
+        self.columns = list(construct.exported_columns)
+        # parameters the construct rendered itself (literals, OFFSET 0, ...)
+        # keep their values; only the bindparam() placeholders are left open
+        self.parameters = {
+            key for key, bind in compiled.binds.items() if bind.required
+        }
+        text = sqlalchemy.text(self.sql).bindparams(**{
+            key: value for key, value in compiled.params.items()
+            if key not in self.parameters
+        })
+        self.text = text.columns(*self.columns) if self.columns else text
+        STATEMENTS[name] = self
+
+    def __call__(self, **values):
+        return self.text.bindparams(**values)
+
+    def __repr__(self):
+        return f"Statement({self.name!r})"
+
+
+post_id = sqlalchemy.bindparam("post_id")
+user_id = sqlalchemy.bindparam("user_id")
+last_id = sqlalchemy.bindparam("last_id")
+limit = sqlalchemy.bindparam("limit")
+
+# unix time from the database's clock, so every worker stamps the same way
+now = (sqlalchemy.func.julianday("now") - 2440587.5) * 86400.0
+
+select_post_and_likes = sqlalchemy.select(
+    post_table,
+    post_table.c.like_count.label("likes")
+)
+
+find_post = Statement(
+    "find_post",
+    post_table.select().where(post_table.c.id == post_id)
+)
+
+find_user_by_email = Statement(
+    "find_user_by_email",
+    user_table.select().where(user_table.c.email == sqlalchemy.bindparam("email"))
+)
+
+find_user = Statement(
+    "find_user",
+    user_table.select().where(user_table.c.id == user_id)
+)
+
+# relative update so concurrent likes never overwrite each other's count
+update_like_count = Statement(
+    "update_like_count",
+    post_table.update().where(post_table.c.id == post_id).values(
+        like_count=post_table.c.like_count + sqlalchemy.bindparam("delta"),
+        version=post_table.c.version + 1,
+        updated_at=now
+    )
+)
+
+bump_post_version = Statement(
+    "bump_post_version",
+    post_table.update().where(post_table.c.id == post_id).values(
+        version=post_table.c.version + 1,
+        updated_at=now
+    )
+)
+
+post_version = Statement(
+    "post_version",
+    sqlalchemy.select(post_table.c.version, post_table.c.updated_at)
+    .where(post_table.c.id == post_id)
+)
+
+change_counters = Statement("change_counters", change_counter_table.select())
+
+bump_change_counter = Statement(
+    "bump_change_counter",
+    sqlite.insert(change_counter_table)
+    .values(name=sqlalchemy.bindparam("name"), value=1, changed_at=now)
+    .on_conflict_do_update(
+        index_elements=[change_counter_table.c.name],
+        set_={"value": change_counter_table.c.value + 1, "changed_at": now}
+    )
+)
+
+like_key = (like_table.c.post_id == post_id) & (like_table.c.user_id == user_id)
+
+find_like = Statement("find_like", like_table.select().where(like_key))
+
+delete_like = Statement(
+    "delete_like",
+    like_table.delete().where(like_key).returning(like_table.c.id)
+)
+
+insert_like = Statement(
+    "insert_like",
+    sqlite.insert(like_table)
+    .values(post_id=post_id, user_id=user_id)
+    .on_conflict_do_nothing()
+    .returning(like_table.c.id)
+)
+
+post_comments = Statement(
+    "post_comments",
+    comment_table.select().where(comment_table.c.post_id == post_id)
+)
+
+
+def post_with_comments_construct(after_cursor: bool):
+    # one round trip: the post is outer-joined to a page of its comments, so
+    # a post without (further) comments still comes back as a single row
+    comment_join = comment_table.c.post_id == post_table.c.id
+    if after_cursor:
+        comment_join &= comment_table.c.id > sqlalchemy.bindparam("last_comment_id")
+    return (
+        sqlalchemy.select(
+            post_table.c.id,
+            post_table.c.body,
+            post_table.c.user_id,
+            post_table.c.like_count.label("likes"),
+            comment_table.c.id.label("comment_id"),
+            comment_table.c.body.label("comment_body"),
+            comment_table.c.user_id.label("comment_user_id")
+        )
+        .select_from(post_table.outerjoin(comment_table, comment_join))
+        .where(post_table.c.id == post_id)
+        .order_by(comment_table.c.id)
+        .limit(limit)
+    )
+
+
+post_with_comments = {
+    after_cursor: Statement(
+        f"post_with_comments{'_after_cursor' if after_cursor else ''}",
+        post_with_comments_construct(after_cursor)
+    )
+    for after_cursor in (False, True)
+}
+
+
+def sorted_posts_construct(sorting: str, paged: bool, after_cursor: bool):
+    if sorting == "new":
+        query = post_table.select().order_by(post_table.c.id.desc())
+        if after_cursor:
+            query = query.where(post_table.c.id < last_id)
+
+    elif sorting == "old":
+        query = post_table.select().order_by(post_table.c.id.asc())
+        if after_cursor:
+            query = query.where(post_table.c.id > last_id)
+
+    elif sorting == "most_liked":
+        query = select_post_and_likes.order_by(
+            post_table.c.like_count.desc(), post_table.c.id.desc()
+        )
+        if after_cursor:
+            query = query.where(
+                sqlalchemy.tuple_(post_table.c.like_count, post_table.c.id) <
+                sqlalchemy.tuple_(sqlalchemy.bindparam("last_likes"), last_id)
+            )
+
+    if paged:
+        query = query.limit(limit)
+    return query
+
+
+# keyed by (sorting, paged, after_cursor)
+sorted_posts = {
+    (sorting, paged, after_cursor): Statement(
+        f"sorted_posts_{sorting}"
+        f"{'_paged' if paged else ''}{'_after_cursor' if after_cursor else ''}",
+        sorted_posts_construct(sorting, paged, after_cursor)
+    )
+    for sorting in ("new", "old", "most_liked")
+    for paged in (False, True)
+    for after_cursor in (False, True)
+}
+
+
+def user_listing_construct(listing: str, after_cursor: bool):
+    # newest first along the table's (user_id, id DESC) index; like counts
+    # come from posts.like_count, never from counting likes
+    if listing == "posts":
+        table = post_table
+        query = sqlalchemy.select(post_table, post_table.c.like_count.label("likes"))
+
+    elif listing == "comments":
+        table = comment_table
+        query = comment_table.select()
+
+    elif listing == "likes":
+        table = like_table
+        query = sqlalchemy.select(
+            like_table.c.id.label("like_id"),
+            post_table.c.id,
+            post_table.c.body,
+            post_table.c.user_id,
+            post_table.c.like_count.label("likes")
+        ).select_from(like_table.join(post_table, post_table.c.id == like_table.c.post_id))
+
+    query = query.where(table.c.user_id == user_id).order_by(table.c.id.desc()).limit(limit)
+    if after_cursor:
+        query = query.where(table.c.id < last_id)
+    return query
+
+
+# keyed by (listing, after_cursor)
+user_listings = {
+    (listing, after_cursor): Statement(
+        f"user_{listing}{'_after_cursor' if after_cursor else ''}",
+        user_listing_construct(listing, after_cursor)
+    )
+    for listing in ("posts", "comments", "likes")
+    for after_cursor in (False, True)
+}
+
+
+def search_construct(after_cursor: bool):
+    # bm25 scores are negative, best match first; rowid breaks ties so the
+    # (score, id) cursor is a total order
+    after = f"AND (bm25({SEARCH_TABLE}), rowid) > (:last_score, :last_id)" if after_cursor else ""
+    return sqlalchemy.text(f"""
+        SELECT rowid AS id, post_id, comment_id, body, bm25({SEARCH_TABLE}) AS score
+        FROM {SEARCH_TABLE}
+        WHERE {SEARCH_TABLE} MATCH :query {after}
+        ORDER BY score, id
+        LIMIT :limit
+    """).columns(
+        sqlalchemy.column("id", sqlalchemy.Integer),
+        sqlalchemy.column("post_id", sqlalchemy.Integer),
+        sqlalchemy.column("comment_id", sqlalchemy.Integer),
+        sqlalchemy.column("body", sqlalchemy.String),
+        sqlalchemy.column("score", sqlalchemy.Float)
+    )
+
+
+search_posts = {
+    after_cursor: Statement(
+        f"search_posts{'_after_cursor' if after_cursor else ''}",
+        search_construct(after_cursor)
+    )
+    for after_cursor in (False, True)
+}
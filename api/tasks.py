@@ -1,8 +1,13 @@
+import json
 import logging
+from typing import AsyncIterable, AsyncIterator
 
 import httpx
+import sqlalchemy
+from pydantic import BaseModel
 
 from api.config import config
+from api.database import database, user_table
 
 logger = logging.getLogger(__name__)
 
@@ -12,37 +17,157 @@ class APIResponseError(Exception):
         self.detail = detail
         super().__init__(f"API Error {status_code}: {detail}")
 
+# One long-lived client per process so Mailgun sends reuse pooled keep-alive
+# connections instead of paying a TCP + TLS handshake per email. It is opened
+# and closed by the app lifespan; anything running outside of it (scripts,
+# tests) gets one lazily.
+http_client: httpx.AsyncClient | None = None
+
+def create_http_client() -> httpx.AsyncClient:
+    return httpx.AsyncClient(
+        http2=config.MAILGUN_HTTP2,
+        timeout=httpx.Timeout(config.MAILGUN_TIMEOUT_SECONDS),
+        limits=httpx.Limits(
+            max_connections=config.MAILGUN_MAX_CONNECTIONS,
+            max_keepalive_connections=config.MAILGUN_MAX_KEEPALIVE_CONNECTIONS
+        )
+    )
+
+def get_http_client() -> httpx.AsyncClient:
+    global http_client
+    if http_client is None:
+        http_client = create_http_client()
+    return http_client
+
+async def close_http_client():
+    global http_client
+    if http_client is not None:
+        await http_client.aclose()
+        http_client = None
+
 async def send_simple_email(to: str, subject: str, body: str):
     logger.debug(f"Sending email to {to} with subject '{subject}'")
-    async with httpx.AsyncClient() as client:
-        try:
-            response = await client.post(
-                f"https://api.mailgun.net/v3/{config.MAILGUN_DOMAIN}/messages",
-                auth=("api", config.MAILGUN_API_KEY),
-                data={
-                    "from": f"Shumye Ayalneh <mailgun@{config.MAILGUN_DOMAIN}>",
-                    "to": [to],
-                    "subject": subject,
-                    "text": body
-                }
-            )
-            response.raise_for_status()
-            logger.debug(response.content)
-            return response
-        
-        except httpx.HTTPStatusError as err:
-            logger.error(f"Failed to send email to {to}: {err}")
-            raise APIResponseError(
-                f"API request failed with status code {err.response.status_code} "
-            ) from err
+    client = get_http_client()
+    try:
+        response = await client.post(
+            f"{config.MAILGUN_API_URL}/{config.MAILGUN_DOMAIN}/messages",
+            auth=("api", config.MAILGUN_API_KEY),
+            data={
+                "from": f"Shumye Ayalneh <mailgun@{config.MAILGUN_DOMAIN}>",
+                "to": [to],
+                "subject": subject,
+                "text": body
+            }
+        )
+        response.raise_for_status()
+        logger.debug(response.content)
+        return response
+
+    except httpx.HTTPStatusError as err:
+        logger.error(f"Failed to send email to {to}: {err}")
+        raise APIResponseError(
+            err.response.status_code,
+            f"API request failed with status code {err.response.status_code}"
+        ) from err
     
-async def send_registeration_email(email: str, confirmation_url: str):
-    return await send_simple_email(
-        email,
-        "successfully signed up",
-        f"Hi, {email} you have successfully signed up to the REST API,"
-        "please verify your email by clicking on the following ${confirmation_url}"
+# Mailgun accepts at most this many recipients per batch-sending request
+MAILGUN_MAX_RECIPIENTS = 1000
 
-    )
+class RecipientResult(BaseModel):
+    email: str
+    # Mailgun queued the message; delivery happens (or fails) later
+    accepted: bool
+    message_id: str | None = None
+    error: str | None = None
+
+async def send_batch_email(
+    recipients: list[dict], subject: str, body: str
+) -> list[RecipientResult]:
+    # Each recipient is a dict with at least "email"; every key is available
+    # to subject/body as %recipient.<key>%. Passing recipient-variables makes
+    # Mailgun send one individual message per recipient, so nobody sees the
+    # other addresses.
+    emails = [recipient["email"] for recipient in recipients]
+    logger.debug(f"Sending batch email to {len(emails)} recipients with subject '{subject}'")
+    client = get_http_client()
+    try:
+        response = await client.post(
+            f"{config.MAILGUN_API_URL}/{config.MAILGUN_DOMAIN}/messages",
+            auth=("api", config.MAILGUN_API_KEY),
+            data={
+                "from": f"Shumye Ayalneh <mailgun@{config.MAILGUN_DOMAIN}>",
+                "to": emails,
+                "subject": subject,
+                "text": body,
+                "recipient-variables": json.dumps(
+                    {recipient["email"]: recipient for recipient in recipients}
+                )
+            }
+        )
+        response.raise_for_status()
+    except httpx.HTTPError as err:
+        logger.error(f"Failed to send batch email to {len(emails)} recipients: {err}")
+        return [RecipientResult(email=email, accepted=False, error=str(err)) for email in emails]
+
+    try:
+        message_id = response.json().get("id")
+    except (ValueError, AttributeError):
+        # the 2xx already means the batch was queued, only the id is missing
+        logger.warning(f"Mailgun accepted a batch of {len(emails)} without a JSON message id")
+        message_id = None
+    return [RecipientResult(email=email, accepted=True, message_id=message_id) for email in emails]
+
+async def send_bulk_email(
+    recipients: AsyncIterable[dict],
+    subject: str,
+    body: str,
+    batch_size: int = MAILGUN_MAX_RECIPIENTS
+) -> AsyncIterator[RecipientResult]:
+    batch = []
+    async for recipient in recipients:
+        batch.append(recipient)
+        if len(batch) >= batch_size:
+            for result in await send_batch_email(batch, subject, body):
+                yield result
+            batch = []
+    if batch:
+        for result in await send_batch_email(batch, subject, body):
+            yield result
 
+async def iterate_user_recipients(
+    where: sqlalchemy.ColumnElement[bool] | None = None,
+    page_size: int = MAILGUN_MAX_RECIPIENTS
+) -> AsyncIterator[dict]:
+    # Pages by id so the user table is never loaded in one go. Each page is
+    # read completely before it is handed out: an open cursor would hold the
+    # SQLite read lock, and block every writer, while batches go to Mailgun.
+    last_id = 0
+    while True:
+        query = (
+            sqlalchemy.select(user_table.c.id, user_table.c.email)
+            .where(user_table.c.id > last_id)
+            .order_by(user_table.c.id)
+            .limit(page_size)
+        )
+        if where is not None:
+            query = query.where(where)
+        rows = await database.fetch_all(query)
+        for row in rows:
+            yield {"email": row.email, "id": row.id}
+        if len(rows) < page_size:
+            return
+        last_id = rows[-1].id
 
+def send_email_to_users(
+    subject: str,
+    body: str,
+    where: sqlalchemy.ColumnElement[bool] | None = None
+) -> AsyncIterator[RecipientResult]:
+    return send_bulk_email(iterate_user_recipients(where), subject, body)
+
+def registration_email(email: str, confirmation_url: str) -> tuple[str, str]:
+    return (
+        "successfully signed up",
+        f"Hi, {email} you have successfully signed up to the REST API,"
+        f"please verify your email by clicking on the following {confirmation_url}"
+    )
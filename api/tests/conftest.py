@@ -1,4 +1,5 @@
 import os
+from contextlib import contextmanager
 from typing import AsyncGenerator, Generator
 from unittest.mock import AsyncMock, Mock
 
@@ -8,14 +9,39 @@ from httpx import ASGITransport, AsyncClient, Request, Response
 
 os.environ['ENV_STATE'] = "test"
 
-from api.database import database, user_table # noqa = E042
+from api.database import database, engine, user_table # noqa = E042
 from api.main import app # noqa = E402
+from api.migrations import migrate # noqa = E402
+from api.query_stats import count_queries # noqa = E402
+from api.security import token_cache, user_cache # noqa = E402
 
 
 @pytest.fixture(scope='session')
 def anyio_backend():
     return 'asyncio'
 
+@pytest.fixture(scope='session', autouse=True)
+def migrated_database():
+    migrate(engine)
+
+@pytest.fixture(autouse=True)
+def clear_security_caches():
+    user_cache.clear()
+    token_cache.clear()
+
+@pytest.fixture()
+def query_budget():
+    # with query_budget(2): await async_client.get(...)
+    # fails the test, listing the statements, when the block runs more
+    # queries than budgeted; catches N+1 regressions in endpoints
+    @contextmanager
+    def budget(limit: int):
+        with count_queries() as stats:
+            yield stats
+        if stats.count > limit:
+            pytest.fail(f"ran {stats.count} queries, budget is {limit}:\n{stats}")
+    return budget
+
 @pytest.fixture()
 def client()-> Generator:
     yield TestClient(app)
@@ -27,7 +53,7 @@ async def db()-> AsyncGenerator:
     await database.disconnect()
 
 @pytest.fixture()
-async def async_client(client)-> AsyncGenerator:
+async def async_client(client, db)-> AsyncGenerator:
     transport = ASGITransport(app=app)
     async with AsyncClient(transport=transport, base_url=client.base_url) as ac:
         yield ac
@@ -51,12 +77,12 @@ async def confirmed_user(registered_user: dict) -> dict:
 @pytest.fixture()
 async def logged_in_token(async_client: AsyncClient, confirmed_user: dict) -> str:
     response = await async_client.post('/token', json=confirmed_user)
-    return response.json()['access_token']
+    return response.json()['accessToken']
 
 @pytest.fixture(autouse=True)
 def mock_httpx_client(mocker):
-    mocker_client = mocker.patch('api.tasks.httpx.AsyncClient')
     mocked_async_client = Mock()
     response = Response(status_code=200, content="", request=Request("Post", "//"))
     mocked_async_client.post = AsyncMock(return_value = response)
-    mocker_client.return_value.__aenter__.return_value = mocked_async_client
\ No newline at end of file
+    mocker.patch('api.tasks.http_client', mocked_async_client)
+    return mocked_async_client
@@ -0,0 +1,28 @@
+import pytest
+from httpx import AsyncClient
+
+from api.instrumentation import http_requests_in_progress, http_requests_total
+
+
+@pytest.mark.anyio
+async def test_metrics_endpoint(async_client: AsyncClient):
+    before = http_requests_total.labels("GET", "/post/{post_id}", 422).value
+    await async_client.get('/post/not-a-number')
+
+    response = await async_client.get('/metrics')
+
+    assert response.status_code == 200
+    assert response.headers['content-type'].startswith("text/plain; version=0.0.4")
+    assert http_requests_total.labels("GET", "/post/{post_id}", 422).value == before + 1
+    assert 'http_requests_total{method="GET",route="/post/{post_id}",status="422"}' in response.text
+    assert 'http_request_duration_seconds_bucket{method="GET",route="/post/{post_id}",le="+Inf"}' in response.text
+    assert "db_query_duration_seconds_count" in response.text
+    assert http_requests_in_progress.value == 0
+
+
+@pytest.mark.anyio
+async def test_unmatched_routes_share_one_label(async_client: AsyncClient):
+    await async_client.get('/no/such/path')
+    await async_client.get('/another/missing/path')
+
+    assert http_requests_total.labels("GET", "unmatched", 404).value >= 2
@@ -1,14 +1,20 @@
+import json
+from types import SimpleNamespace
+from unittest.mock import AsyncMock
 
 import pytest
 from httpx import AsyncClient
 
 from api import security
+from api.database import comment_table, database, post_table
+from api.response_cache import MemoryBackend, response_cache
+from api.router import post as post_router
 
 
 async def create_post(body: str, async_client: AsyncClient, logged_in_token: str) -> dict:
     
     response = await async_client.post(
-        '/post', 
+        '/post/', 
         json={"body": body}, 
         headers={
             "Authorization": f"Bearer {logged_in_token}"
@@ -18,7 +24,7 @@ async def create_post(body: str, async_client: AsyncClient, logged_in_token: str
 async def create_comment(body: str,post_id: int, async_client: AsyncClient, logged_in_token: str) -> dict:
     
     response = await async_client.post(
-        '/comment', 
+        '/post/comment', 
         json={"body": body, "post_id": post_id},
         headers={
             "Authorization": f"Bearer {logged_in_token}"
@@ -29,7 +35,7 @@ async def create_comment(body: str,post_id: int, async_client: AsyncClient, logg
 async def like_post(post_id: int, async_client: AsyncClient, logged_in_token: str) -> dict:
     
     response = await async_client.post(
-        '/like', 
+        '/post/like', 
         json={"post_id": post_id},
         headers={ "Authorization": f"Bearer {logged_in_token}" }
 )
@@ -50,7 +56,7 @@ async def test_create_post(async_client: AsyncClient, confirmed_user: dict, logg
 
     body = "Test Post"
     response = await async_client.post(
-        '/post', 
+        '/post/', 
         json={ "body": body},
         headers={
             "Authorization": f"Bearer {logged_in_token}"
@@ -60,12 +66,25 @@ async def test_create_post(async_client: AsyncClient, confirmed_user: dict, logg
     assert response.status_code == 201
     assert { "id": 1, "body": body, 'user_id': confirmed_user['id']}.items() <= response.json().items()
 
+@pytest.mark.anyio
+async def test_create_post_stores_post(async_client: AsyncClient, confirmed_user: dict):
+    token = security.create_access_token(confirmed_user['email'])
+    response = await async_client.post(
+        '/post/', json={"body": "Stored through the API"}, headers={"Authorization": f"Bearer {token}"}
+    )
+    assert response.status_code == 201
+    post = response.json()
+    assert post == {"id": post['id'], "body": "Stored through the API", "user_id": confirmed_user['id']}
+
+    response = await async_client.get(f"/post/{post['id']}")
+    assert response.json()['post'] == {**post, "likes": 0}
+
 @pytest.mark.anyio
 async def test_like_post(async_client: AsyncClient, created_post: dict, logged_in_token: str, registered_user: dict):
-    response = await like_post(
-        created_post['id'], 
-        async_client, 
-        logged_in_token
+    response = await async_client.post(
+        '/post/like',
+        json={"post_id": created_post['id']},
+        headers={"Authorization": f"Bearer {logged_in_token}"}
     )
 
     assert response.status_code == 201
@@ -75,6 +94,32 @@ async def test_like_post(async_client: AsyncClient, created_post: dict, logged_i
         "user_id": registered_user['id']
     }.items() <= response.json().items()
 
+@pytest.mark.anyio
+async def test_like_post_updates_like_count(
+    async_client: AsyncClient, created_post: dict, logged_in_token: str
+):
+    await like_post(created_post['id'], async_client, logged_in_token)
+    response = await async_client.get(f"/post/{created_post['id']}")
+    assert response.json()['post']['likes'] == 1
+
+    await like_post(created_post['id'], async_client, logged_in_token)
+    response = await async_client.get(f"/post/{created_post['id']}")
+    assert response.json()['post']['likes'] == 0
+
+@pytest.mark.anyio
+@pytest.mark.parametrize("existing_like, expected", [
+    (SimpleNamespace(id=7), 7),
+    (None, None),
+])
+async def test_toggle_like_after_losing_the_insert_race(mocker, existing_like, expected):
+    # nothing to delete, the insert conflicts with a concurrent one, and the
+    # like found afterwards may already have been toggled off again
+    fetch_one = mocker.patch.object(
+        database, "fetch_one", AsyncMock(side_effect=[None, None, existing_like])
+    )
+    assert await post_router.toggle_like(post_id=1, user_id=1) == expected
+    assert fetch_one.await_count == 3
+
 @pytest.mark.anyio
 async def test_create_post_expired_token(
     async_client: AsyncClient, confirmed_user, mocker
@@ -83,7 +128,7 @@ async def test_create_post_expired_token(
     token = security.create_access_token(confirmed_user['email'])
 
     response = await async_client.post(
-        '/post', 
+        '/post/', 
         json={ "body": "Test body"},
         headers={
             "Authorization": f"Bearer {token}"
@@ -95,13 +140,17 @@ async def test_create_post_expired_token(
 
 
 @pytest.mark.anyio
-async def test_create_comment(async_client: AsyncClient, confirmed_user: dict, created_post: str):
+async def test_create_comment(
+    async_client: AsyncClient, confirmed_user: dict, created_post: dict, logged_in_token: str
+):
 
     body = "Test Post"
-    response = await async_client.post('/comment', json={
+    response = await async_client.post('/post/comment', json={
          "body": body,
          "post_id": created_post['id'] 
-        })
+        },
+        headers={"Authorization": f"Bearer {logged_in_token}"}
+        )
 
     assert response.status_code == 201
     assert { 
@@ -115,7 +164,7 @@ async def test_create_comment(async_client: AsyncClient, confirmed_user: dict, c
 @pytest.mark.anyio
 async def test_create_post_missing_data(async_client: AsyncClient, logged_in_token: str):
     response = await async_client.post(
-        '/post', 
+        '/post/', 
          json={},
          headers={
             "Authorization": f"Bearer {logged_in_token}"
@@ -126,16 +175,16 @@ async def test_create_post_missing_data(async_client: AsyncClient, logged_in_tok
 
 @pytest.mark.anyio
 async def test_get_all_posts(async_client: AsyncClient, created_post):
-    response = await async_client.get('/post')
+    response = await async_client.get('/post/')
 
     assert response.status_code == 200
-    assert response.json() == [created_post]
+    assert response.json() == {"items": [created_post], "next_cursor": None}
 
 
 @pytest.mark.anyio
 @pytest.mark.parametrize("sorting, expected_order", [
-    ("newest", [2, 1]),  # Assuming the second created post has id 2 and the first has id 1
-    ("oldest", [1, 2])   # Assuming the first created post has more likes than the second
+    ("new", [2, 1]),  # Assuming the second created post has id 2 and the first has id 1
+    ("old", [1, 2])   # Assuming the first created post has more likes than the second
 ])
 async def test_get_all_posts_sorted(
     async_client: AsyncClient, 
@@ -147,13 +196,14 @@ async def test_get_all_posts_sorted(
     await create_post('First Post', async_client, logged_in_token)
     await create_post('Second Post', async_client, logged_in_token)
 
-    response = await async_client.get('/post', params={"sorting": sorting})
+    response = await async_client.get('/post/', params={"sorting": sorting})
 
     assert response.status_code == 200
-    actual_order = [post['id'] for post in response.json()]
+    actual_order = [post['id'] for post in response.json()['items']]
     assert actual_order == expected_order
 
 
+@pytest.mark.anyio
 async def test_get_all_posts_sorted_likes(
     async_client: AsyncClient, 
     logged_in_token,
@@ -162,14 +212,85 @@ async def test_get_all_posts_sorted_likes(
     await create_post('First Post', async_client, logged_in_token)
     await create_post('Second Post', async_client, logged_in_token)
     await like_post(1, async_client, logged_in_token)
-    response = await async_client.get('/post', params={"sorting": "most_liked"})
+    response = await async_client.get('/post/', params={"sorting": "most_liked"})
 
     assert response.status_code == 200
     expected_order = [1, 2]  # Assuming the first created post has more likes than the second
-    actual_order = [post['id'] for post in response.json()]
+    actual_order = [post['id'] for post in response.json()['items']]
     assert actual_order == expected_order
            
 
+@pytest.mark.anyio
+@pytest.mark.parametrize("sorting", ["new", "old", "most_liked"])
+async def test_get_all_posts_paginated(
+    async_client: AsyncClient,
+    logged_in_token,
+    sorting: str
+):
+    for body in ['First Post', 'Second Post', 'Third Post']:
+        await create_post(body, async_client, logged_in_token)
+    await like_post(2, async_client, logged_in_token)
+
+    seen = []
+    params = {"sorting": sorting, "limit": 2}
+    while True:
+        response = await async_client.get('/post/', params=params)
+        assert response.status_code == 200
+        page = response.json()
+        assert len(page['items']) <= 2
+        seen.extend(post['id'] for post in page['items'])
+        if page['next_cursor'] is None:
+            break
+        params['cursor'] = page['next_cursor']
+
+    expected = {
+        "new": [3, 2, 1],
+        "old": [1, 2, 3],
+        "most_liked": [2, 3, 1]
+    }
+    assert seen == expected[sorting]
+
+
+@pytest.mark.anyio
+@pytest.mark.parametrize("sorting, expected_order", [
+    ("new", [2, 1]),
+    ("old", [1, 2]),
+])
+async def test_stream_all_posts(
+    async_client: AsyncClient,
+    logged_in_token,
+    sorting: str,
+    expected_order: list[int]
+):
+    await create_post('First Post', async_client, logged_in_token)
+    await create_post('Second Post', async_client, logged_in_token)
+
+    response = await async_client.get('/post/stream', params={"sorting": sorting})
+    assert response.status_code == 200
+    assert response.headers['content-type'] == "application/x-ndjson"
+    posts = [json.loads(line) for line in response.text.splitlines()]
+    assert [post['id'] for post in posts] == expected_order
+
+    response = await async_client.get(
+        '/post/stream', params={"sorting": sorting, "format": "json"}
+    )
+    assert [post['id'] for post in response.json()] == expected_order
+
+
+@pytest.mark.anyio
+async def test_stream_all_posts_empty(async_client: AsyncClient):
+    response = await async_client.get('/post/stream', params={"format": "json"})
+    assert response.status_code == 200
+    assert response.json() == []
+
+
+@pytest.mark.anyio
+async def test_get_all_posts_invalid_cursor(async_client: AsyncClient):
+    response = await async_client.get('/post/', params={"cursor": "not-a-cursor"})
+    assert response.status_code == 400
+    assert response.json()['detail'] == "Invalid cursor"
+
+
 @pytest.mark.anyio
 async def test_get_all_post_comments(
     async_client: AsyncClient, created_post: dict, created_comment: dict
@@ -195,7 +316,35 @@ async def test_get_post_with_comments(
     response = await async_client.get(f"/post/{created_post['id']}")
 
     assert response.status_code == 200
-    assert response.json() == {"post": {**created_post, "likes": 0}, "comment": [created_comment]}
+    assert response.json() == {
+        "post": {**created_post, "likes": 0},
+        "comment": [created_comment],
+        "next_comment_cursor": None
+    }
+
+
+@pytest.mark.anyio
+async def test_get_post_with_comments_paginated(
+    async_client: AsyncClient, created_post: dict, logged_in_token: str
+):
+    for body in ['First Comment', 'Second Comment', 'Third Comment']:
+        await create_comment(body, created_post['id'], async_client, logged_in_token)
+
+    response = await async_client.get(
+        f"/post/{created_post['id']}", params={"comment_limit": 2}
+    )
+    assert response.status_code == 200
+    first_page = response.json()
+    assert [c['body'] for c in first_page['comment']] == ['First Comment', 'Second Comment']
+
+    response = await async_client.get(
+        f"/post/{created_post['id']}",
+        params={"comment_limit": 2, "comment_cursor": first_page['next_comment_cursor']}
+    )
+    second_page = response.json()
+    assert second_page['post'] == first_page['post']
+    assert [c['body'] for c in second_page['comment']] == ['Third Comment']
+    assert second_page['next_comment_cursor'] is None
 
 
 @pytest.mark.anyio
@@ -206,4 +355,234 @@ async def test_get_missing_post_with_comments(
 
     assert response.status_code == 404
   
-     
\ No newline at end of file
+     
+
+@pytest.mark.anyio
+async def test_openapi_keeps_response_models(async_client: AsyncClient):
+    response = await async_client.get('/openapi.json')
+    paths = response.json()['paths']
+
+    def response_schema(path: str) -> dict:
+        return paths[path]['get']['responses']['200']['content']['application/json']['schema']
+
+    assert response_schema('/post/') == {"$ref": "#/components/schemas/UserPostPage"}
+    assert response_schema('/post/{post_id}') == {"$ref": "#/components/schemas/UserPostWithComment"}
+    assert response_schema('/post/{post_id}/comment')['items'] == {"$ref": "#/components/schemas/Comment"}
+
+
+@pytest.fixture()
+async def stored_post(registered_user: dict) -> dict:
+    # straight into the database, so query budgets don't depend on /token
+    user_id = registered_user['id']
+    post_id = await database.execute(post_table.insert().values(body="Stored post", user_id=user_id))
+    for body in ['First Comment', 'Second Comment']:
+        await database.execute(
+            comment_table.insert().values(body=body, post_id=post_id, user_id=user_id)
+        )
+    return {"id": post_id, "body": "Stored post", "user_id": user_id}
+
+
+@pytest.mark.anyio
+async def test_get_post_with_comments_query_budget(
+    async_client: AsyncClient, stored_post: dict, query_budget
+):
+    # the version lookup behind the ETag, then the post and its comments
+    with query_budget(2):
+        response = await async_client.get(f"/post/{stored_post['id']}")
+
+    assert response.status_code == 200
+    assert len(response.json()['comment']) == 2
+
+
+@pytest.mark.anyio
+async def test_get_all_posts_query_budget(
+    async_client: AsyncClient, stored_post: dict, query_budget
+):
+    # the change counters behind the ETag, then the page
+    with query_budget(2):
+        response = await async_client.get('/post/', params={"sorting": "most_liked"})
+
+    assert response.status_code == 200
+
+
+@pytest.mark.anyio
+async def test_server_timing_header(async_client: AsyncClient, stored_post: dict):
+    response = await async_client.get(f"/post/{stored_post['id']}")
+
+    assert response.headers['server-timing'].startswith('db;dur=')
+    assert 'desc="2 queries"' in response.headers['server-timing']
+
+
+@pytest.mark.anyio
+@pytest.mark.parametrize("path", ["/post/{id}", "/post/{id}/comment", "/post/"])
+async def test_read_endpoints_answer_304_before_querying(
+    async_client: AsyncClient, stored_post: dict, query_budget, path: str
+):
+    url = path.format(id=stored_post['id'])
+    response = await async_client.get(url)
+    assert response.status_code == 200
+    assert 's-maxage=' in response.headers['cache-control']
+    etag = response.headers['etag']
+
+    with query_budget(1):
+        response = await async_client.get(url, headers={"If-None-Match": etag})
+
+    assert response.status_code == 304
+    assert response.content == b""
+    assert response.headers['etag'] == etag
+
+
+@pytest.mark.anyio
+async def test_like_changes_post_and_most_liked_etags_only(
+    async_client: AsyncClient, stored_post: dict, confirmed_user: dict
+):
+    async def etag(url: str, **params) -> str:
+        return (await async_client.get(url, params=params)).headers['etag']
+
+    post_url = f"/post/{stored_post['id']}"
+    before = {
+        "post": await etag(post_url),
+        "new": await etag('/post/'),
+        "most_liked": await etag('/post/', sorting="most_liked"),
+    }
+    token = security.create_access_token(confirmed_user['email'])
+    response = await async_client.post(
+        '/post/like',
+        json={"post_id": stored_post['id']},
+        headers={"Authorization": f"Bearer {token}"}
+    )
+    assert response.status_code == 201
+
+    assert await etag(post_url) != before["post"]
+    assert await etag('/post/', sorting="most_liked") != before["most_liked"]
+    assert await etag('/post/') == before["new"]
+    response = await async_client.get(post_url, headers={"If-None-Match": before["post"]})
+    assert response.status_code == 200
+    assert response.json()['post']['likes'] == 1
+
+
+@pytest.fixture()
+def enabled_response_cache(monkeypatch):
+    monkeypatch.setattr(response_cache, "ttl", 60)
+    monkeypatch.setattr(response_cache, "backend", MemoryBackend(100))
+    return response_cache
+
+
+@pytest.mark.anyio
+async def test_cached_post_is_invalidated_by_a_like(
+    async_client: AsyncClient,
+    stored_post: dict,
+    confirmed_user: dict,
+    enabled_response_cache,
+    query_budget
+):
+    post_url = f"/post/{stored_post['id']}"
+    await async_client.get(post_url)
+    await async_client.get('/post/', params={"sorting": "most_liked"})
+    with query_budget(0):
+        response = await async_client.get(post_url)
+        assert response.status_code == 200
+        assert response.json()['post']['likes'] == 0
+        response = await async_client.get(post_url, headers={"If-None-Match": response.headers['etag']})
+        assert response.status_code == 304
+
+    token = security.create_access_token(confirmed_user['email'])
+    await async_client.post(
+        '/post/like',
+        json={"post_id": stored_post['id']},
+        headers={"Authorization": f"Bearer {token}"}
+    )
+
+    response = await async_client.get(post_url)
+    assert response.json()['post']['likes'] == 1
+    response = await async_client.get('/post/', params={"sorting": "most_liked"})
+    assert response.json()['items'][0]['id'] == stored_post['id']
+
+
+@pytest.mark.anyio
+async def test_missing_post_is_not_cached(async_client: AsyncClient, enabled_response_cache):
+    response = await async_client.get("/post/999999")
+
+    assert response.status_code == 404
+    assert await enabled_response_cache.backend.get("post:999999") is None
+
+
+
+@pytest.mark.anyio
+async def test_search_posts_and_comments(async_client: AsyncClient, registered_user: dict):
+    user_id = registered_user['id']
+    first = await database.execute(
+        post_table.insert().values(body="Sourdough starter tips", user_id=user_id)
+    )
+    second = await database.execute(
+        post_table.insert().values(body="Sourdough sourdough sourdough", user_id=user_id)
+    )
+    comment_id = await database.execute(
+        comment_table.insert().values(body="My sourdough never rises", post_id=first, user_id=user_id)
+    )
+    await database.execute(post_table.insert().values(body="Unrelated", user_id=user_id))
+
+    response = await async_client.get('/post/search', params={"q": "SOURDOUGH"})
+
+    assert response.status_code == 200
+    hits = response.json()['items']
+    # bm25: the post that repeats the term ranks first
+    assert (hits[0]['post_id'], hits[0]['comment_id']) == (second, None)
+    assert {(hit['post_id'], hit['comment_id']) for hit in hits} == {
+        (first, None), (second, None), (first, comment_id)
+    }
+
+    response = await async_client.get('/post/search', params={"q": "sourdough rises"})
+    assert [hit['comment_id'] for hit in response.json()['items']] == [comment_id]
+
+
+@pytest.mark.anyio
+async def test_search_posts_paginated(async_client: AsyncClient, registered_user: dict):
+    for i in range(5):
+        await database.execute(
+            post_table.insert().values(body=f"Paging needle {i}", user_id=registered_user['id'])
+        )
+
+    seen = []
+    cursor = None
+    for _ in range(3):
+        params = {"q": "needle", "limit": 2, **({"cursor": cursor} if cursor else {})}
+        page = (await async_client.get('/post/search', params=params)).json()
+        seen += [hit['body'] for hit in page['items']]
+        cursor = page['next_cursor']
+
+    assert cursor is None
+    assert sorted(seen) == [f"Paging needle {i}" for i in range(5)]
+
+
+@pytest.mark.anyio
+@pytest.mark.parametrize("q", ['"unbalanced', "NOT", "body:x OR", "*"])
+async def test_search_ignores_query_syntax(async_client: AsyncClient, q: str):
+    response = await async_client.get('/post/search', params={"q": q})
+
+    assert response.status_code == 200
+
+
+@pytest.mark.anyio
+async def test_authenticated_user_can_post_and_comment(async_client: AsyncClient, confirmed_user: dict):
+    headers = {"Authorization": f"Bearer {security.create_access_token(confirmed_user['email'])}"}
+
+    post = await async_client.post('/post/', json={"body": "Test Post"}, headers=headers)
+    assert post.status_code == 201
+    assert post.json()['user_id'] == confirmed_user['id']
+
+    comment = await async_client.post(
+        '/post/comment', json={"body": "Test Comment", "post_id": post.json()['id']}, headers=headers
+    )
+    assert comment.status_code == 201
+    assert comment.json()['user_id'] == confirmed_user['id']
+
+
+@pytest.mark.anyio
+@pytest.mark.parametrize("path, body", [
+    ('/post/', {"body": "Test Post"}),
+    ('/post/comment', {"body": "Test Comment", "post_id": 1}),
+])
+async def test_write_routes_require_authentication(async_client: AsyncClient, path: str, body: dict):
+    response = await async_client.post(path, json=body)
+    assert response.status_code == 401
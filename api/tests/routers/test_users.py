@@ -1,7 +1,19 @@
+import uuid
+
 import pytest
-from fastapi import BackgroundTasks
 from httpx import AsyncClient
 
+from api.database import (
+    comment_table,
+    database,
+    email_outbox_table,
+    like_table,
+    post_table,
+    user_table,
+)
+from api.rate_limit import Bucket, MemoryStore, rate_limiter
+from api.router import user as user_router
+
 
 async def register_user(async_client: AsyncClient, email: str, password: str):
     return await async_client.post(
@@ -16,7 +28,7 @@ async def test_register_user(async_client: AsyncClient):
 
 @pytest.mark.anyio
 async def test_confirm_user(async_client: AsyncClient, mocker):
-    spy = mocker.spy(BackgroundTasks, "add_task")
+    spy = mocker.spy(user_router, "enqueue_registration_email")
     response = await register_user(async_client, "test@exmaple.com","1234")
     confirmation_url = str(spy.call_args[1]['confirmation_url'])
     response = await async_client.get(confirmation_url)
@@ -31,10 +43,10 @@ async def test_confirm_user_invalid_token(async_client: AsyncClient):
 @pytest.mark.anyio
 async def test_confirm_user_expired_token(async_client: AsyncClient, mocker):
     mocker.patch("api.security.confirm_token_expire_minutes", return_value=-1)
-    spy =  mocker.spy(BackgroundTasks, "send_user_registration_email")
+    spy = mocker.spy(user_router, "enqueue_registration_email")
     response = await register_user(async_client, "test@example.com","1234")
     
-    confirmation_url = str(spy.spy_return)
+    confirmation_url = str(spy.call_args[1]['confirmation_url'])
     response = await async_client.get(confirmation_url)
     assert response.status_code == 401
 
@@ -66,4 +78,123 @@ async def test_login_user_not_exists(async_client: AsyncClient):
 @pytest.mark.anyio
 async def test_login_existing_user(async_client: AsyncClient, confirmed_user: dict):
     response = await async_client.post('/token', json={"email":confirmed_user['email'], "password":confirmed_user['password']})
-    assert response.status_code == 200
\ No newline at end of file
+    assert response.status_code == 200
+@pytest.mark.anyio
+async def test_register_user_queues_confirmation_email(async_client: AsyncClient, mock_httpx_client):
+    response = await register_user(async_client, "outbox@example.com", "1234")
+    assert response.status_code == 201
+    mock_httpx_client.post.assert_not_called()
+
+    query = email_outbox_table.select().where(email_outbox_table.c.recipient == "outbox@example.com")
+    email = await database.fetch_one(query)
+    assert email.status == 'pending'
+    assert "/confirm/" in email.body
+
+
+@pytest.fixture()
+async def fresh_user_id() -> int:
+    return await database.execute(
+        user_table.insert().values(email=f"{uuid.uuid4().hex}@example.com", password="x")
+    )
+
+@pytest.fixture()
+async def user_activity(fresh_user_id: int) -> dict:
+    user_id = fresh_user_id
+    post_ids = [
+        await database.execute(post_table.insert().values(body=f"Post {i}", user_id=user_id))
+        for i in range(3)
+    ]
+    await database.execute(
+        comment_table.insert().values(body="Comment", post_id=post_ids[0], user_id=user_id)
+    )
+    for post_id in post_ids[:2]:
+        await database.execute(like_table.insert().values(post_id=post_id, user_id=user_id))
+    await database.execute(post_table.update().where(post_table.c.id.in_(post_ids[:2])).values(like_count=1))
+    return {"user_id": user_id, "post_ids": post_ids}
+
+@pytest.mark.anyio
+async def test_get_user_posts_paginated(async_client: AsyncClient, user_activity: dict, query_budget):
+    url = f"/user/{user_activity['user_id']}/posts"
+    with query_budget(1):
+        response = await async_client.get(url, params={"limit": 2})
+    assert response.status_code == 200
+    first_page = response.json()
+    assert [post['id'] for post in first_page['items']] == user_activity['post_ids'][:0:-1]
+    assert [post['likes'] for post in first_page['items']] == [0, 1]
+
+    response = await async_client.get(url, params={"limit": 2, "cursor": first_page['next_cursor']})
+    second_page = response.json()
+    assert [post['id'] for post in second_page['items']] == user_activity['post_ids'][:1]
+    assert second_page['next_cursor'] is None
+
+@pytest.mark.anyio
+async def test_get_user_comments(async_client: AsyncClient, user_activity: dict):
+    response = await async_client.get(f"/user/{user_activity['user_id']}/comments")
+    assert response.status_code == 200
+    assert [comment['post_id'] for comment in response.json()['items']] == user_activity['post_ids'][:1]
+
+@pytest.mark.anyio
+async def test_get_user_likes(async_client: AsyncClient, user_activity: dict):
+    url = f"/user/{user_activity['user_id']}/likes"
+    response = await async_client.get(url, params={"limit": 1})
+    first_page = response.json()
+    assert [post['id'] for post in first_page['items']] == [user_activity['post_ids'][1]]
+    assert first_page['items'][0]['likes'] == 1
+
+    response = await async_client.get(url, params={"limit": 1, "cursor": first_page['next_cursor']})
+    assert [post['id'] for post in response.json()['items']] == [user_activity['post_ids'][0]]
+
+@pytest.mark.anyio
+async def test_get_user_listing_cursor_is_per_listing(async_client: AsyncClient, user_activity: dict):
+    url = f"/user/{user_activity['user_id']}"
+    response = await async_client.get(f"{url}/posts", params={"limit": 1})
+    response = await async_client.get(f"{url}/likes", params={"cursor": response.json()['next_cursor']})
+    assert response.status_code == 400
+
+@pytest.mark.anyio
+@pytest.mark.parametrize("listing", ["posts", "comments", "likes"])
+async def test_get_user_listing_empty(async_client: AsyncClient, fresh_user_id: int, listing: str):
+    response = await async_client.get(f"/user/{fresh_user_id}/{listing}")
+    assert response.status_code == 200
+    assert response.json() == {"items": [], "next_cursor": None}
+
+@pytest.mark.anyio
+async def test_get_missing_user_posts(async_client: AsyncClient):
+    response = await async_client.get("/user/999999/posts")
+    assert response.status_code == 404
+
+
+@pytest.fixture()
+def enabled_rate_limiter(monkeypatch):
+    monkeypatch.setattr(rate_limiter, "enabled", True)
+    monkeypatch.setattr(rate_limiter, "store", MemoryStore(100))
+    monkeypatch.setattr(rate_limiter, "ip_bucket", Bucket(capacity=3, refill_per_second=0.01))
+    monkeypatch.setattr(rate_limiter, "email_bucket", Bucket(capacity=1, refill_per_second=0.01))
+    return rate_limiter
+
+@pytest.mark.anyio
+async def test_login_rate_limited_before_any_work(
+    async_client: AsyncClient, enabled_rate_limiter, query_budget, mocker
+):
+    credentials = {"email": "limited@example.net", "password": "1234"}
+    response = await async_client.post('/token', json=credentials)
+    assert response.status_code == 401
+
+    authenticate = mocker.spy(user_router, "authenticate_user")
+    with query_budget(0):
+        response = await async_client.post('/token', json=credentials)
+    assert response.status_code == 429
+    assert int(response.headers['Retry-After']) > 0
+    authenticate.assert_not_called()
+
+@pytest.mark.anyio
+async def test_register_rate_limited_per_ip(
+    async_client: AsyncClient, enabled_rate_limiter, mocker
+):
+    hash_password = mocker.spy(user_router, "get_password_hash_async")
+    statuses = [
+        (await register_user(async_client, f"limited{i}@example.net", "1234")).status_code
+        for i in range(4)
+    ]
+    assert statuses == [201, 201, 201, 429]
+    assert hash_password.call_count == 3
@@ -0,0 +1,43 @@
+from api.cache import TTLCache
+
+
+def test_cache_hit_and_miss():
+    cache = TTLCache("test_hit_and_miss", maxsize=2, ttl=60)
+    assert cache.get("missing") is None
+    cache.set("key", "value")
+    assert cache.get("key") == "value"
+    assert cache.hits.value == 1
+    assert cache.misses.value == 1
+
+
+def test_cache_evicts_least_recently_used():
+    cache = TTLCache("test_lru", maxsize=2, ttl=60)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    cache.get("a")
+    cache.set("c", 3)
+    assert cache.get("b") is None
+    assert cache.get("a") == 1
+    assert cache.get("c") == 3
+
+
+def test_cache_expires_entries(mocker):
+    monotonic = mocker.patch("api.cache.time.monotonic", return_value=100.0)
+    cache = TTLCache("test_expiry", maxsize=2, ttl=10)
+    cache.set("key", "value")
+    cache.set("short", "value", ttl=1)
+
+    monotonic.return_value = 102.0
+    assert cache.get("short") is None
+    assert cache.get("key") == "value"
+
+    monotonic.return_value = 111.0
+    assert cache.get("key") is None
+    assert len(cache) == 0
+
+
+def test_cache_invalidate():
+    cache = TTLCache("test_invalidate", maxsize=2, ttl=60)
+    cache.set("key", "value")
+    cache.invalidate("key")
+    assert cache.get("key") is None
@@ -0,0 +1,56 @@
+import httpx
+import pytest
+import sqlalchemy
+
+from api.commands import email_users, main, rebuild_search_index, reconcile_like_counts
+from api.database import comment_table, database, like_table, post_table
+
+
+@pytest.mark.anyio
+async def test_reconcile_like_counts(registered_user: dict):
+    post_id = await database.execute(
+        post_table.insert().values(body="Test Post", user_id=registered_user['id'], like_count=5)
+    )
+    await database.execute(
+        like_table.insert().values(post_id=post_id, user_id=registered_user['id'])
+    )
+
+    assert await reconcile_like_counts() >= 1
+
+    post = await database.fetch_one(post_table.select().where(post_table.c.id == post_id))
+    assert post.like_count == 1
+    assert await reconcile_like_counts() == 0
+
+
+@pytest.mark.anyio
+async def test_rebuild_search_index(registered_user: dict):
+    post_id = await database.execute(
+        post_table.insert().values(body="Rebuilt post", user_id=registered_user['id'])
+    )
+    await database.execute(
+        comment_table.insert().values(body="Rebuilt comment", post_id=post_id, user_id=registered_user['id'])
+    )
+    await database.execute(sqlalchemy.text("DELETE FROM post_search"))
+
+    assert await rebuild_search_index() >= 2
+
+    rows = await database.fetch_all(
+        sqlalchemy.text("SELECT post_id, comment_id FROM post_search WHERE post_search MATCH 'rebuilt'")
+    )
+    assert {(row.post_id, row.comment_id) for row in rows} >= {(post_id, None)}
+    assert len(rows) == 2
+
+
+@pytest.mark.anyio
+async def test_email_users(mock_httpx_client, registered_user: dict):
+    mock_httpx_client.post.return_value = httpx.Response(
+        status_code=200, json={"id": "<users@mailgun>"}, request=httpx.Request("Post", "//")
+    )
+
+    assert await email_users("Test subject", "Hi %recipient.email%") >= 1
+    assert mock_httpx_client.post.call_args.kwargs['data']['text'] == "Hi %recipient.email%"
+
+
+def test_email_users_needs_subject_and_body():
+    with pytest.raises(SystemExit):
+        main(["email-users", "--subject", "Test subject"])
@@ -0,0 +1,45 @@
+from starlette.datastructures import Headers
+
+from api.conditional import cache_headers, etag_matches, is_not_modified, make_etag
+
+# Sun, 06 Nov 1994 08:49:37 GMT
+LAST_MODIFIED = 784111777.25
+
+
+def test_make_etag():
+    assert make_etag("post", 1, 3) == '"post-1-3"'
+
+
+def test_cache_headers():
+    headers = cache_headers('"post-1-3"', LAST_MODIFIED)
+
+    assert headers["ETag"] == '"post-1-3"'
+    assert headers["Last-Modified"] == "Sun, 06 Nov 1994 08:49:37 GMT"
+    assert "s-maxage=" in headers["Cache-Control"]
+    assert "Last-Modified" not in cache_headers('"post-1-0"', None)
+
+
+def test_etag_matches():
+    assert etag_matches('"post-1-3"', '"post-1-3"')
+    assert etag_matches('"post-1-2", W/"post-1-3"', '"post-1-3"')
+    assert etag_matches("*", '"post-1-3"')
+    assert not etag_matches('"post-1-2"', '"post-1-3"')
+
+
+def test_if_modified_since():
+    def not_modified(if_modified_since: str) -> bool:
+        headers = Headers({"if-modified-since": if_modified_since})
+        return is_not_modified(headers, '"post-1-3"', LAST_MODIFIED)
+
+    assert not_modified("Sun, 06 Nov 1994 08:49:37 GMT")
+    assert not not_modified("Sun, 06 Nov 1994 08:49:36 GMT")
+    assert not not_modified("not a date")
+
+
+def test_if_none_match_takes_precedence():
+    headers = Headers({
+        "if-none-match": '"post-1-2"',
+        "if-modified-since": "Sun, 06 Nov 1994 08:49:37 GMT"
+    })
+
+    assert not is_not_modified(headers, '"post-1-3"', LAST_MODIFIED)
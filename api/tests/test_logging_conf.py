@@ -0,0 +1,54 @@
+import logging
+import threading
+
+import pytest
+
+from api import logging_conf
+from api.logging_conf import configure_logging, start_log_listener, stop_log_listener
+
+
+class CollectingHandler(logging.Handler):
+    def __init__(self):
+        super().__init__()
+        self.records = []
+        self.threads = []
+
+    def emit(self, record):
+        self.records.append(record)
+        self.threads.append(threading.current_thread())
+
+
+@pytest.fixture(autouse=True)
+def log_directory(tmp_path, monkeypatch):
+    # keep the rotating file handler away from the project's api.log
+    monkeypatch.chdir(tmp_path)
+
+
+def test_records_are_handled_on_listener_thread():
+    configure_logging()
+    collector = CollectingHandler()
+    logging.getLogger(logging_conf.SINK_LOGGER).addHandler(collector)
+
+    start_log_listener()
+    try:
+        logging.getLogger("api.test").warning("queued %s", "message")
+    finally:
+        stop_log_listener()
+
+    assert [record.getMessage() for record in collector.records] == ["queued message"]
+    # the correlation id filter runs before the record is queued
+    assert collector.records[0].correlation_id == "-"
+    assert collector.threads[0] is not threading.current_thread()
+    assert logging_conf.log_listener is None
+
+
+def test_records_logged_before_start_are_delivered():
+    configure_logging()
+    collector = CollectingHandler()
+    logging.getLogger(logging_conf.SINK_LOGGER).addHandler(collector)
+
+    logging.getLogger("api.test").warning("early")
+    start_log_listener()
+    stop_log_listener()
+
+    assert [record.getMessage() for record in collector.records] == ["early"]
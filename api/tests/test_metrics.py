@@ -0,0 +1,85 @@
+import json
+
+import pytest
+
+from api import metrics
+from api.metrics import (
+    Counter,
+    Gauge,
+    Histogram,
+    Metric,
+    generate_latest,
+    merge,
+    render,
+)
+
+
+@pytest.fixture()
+def registry(monkeypatch):
+    monkeypatch.setattr(metrics, "REGISTRY", {})
+    return metrics.REGISTRY
+
+
+def test_labelled_metrics(registry):
+    requests = Counter("test_requests_total", "Requests", labelnames=("route",))
+    requests.labels("/a").inc()
+    requests.labels("/a").inc(2)
+    requests.labels("/b").inc()
+
+    assert requests.labels("/a").value == 3
+    with pytest.raises(ValueError):
+        requests.labels("/a", "extra")
+
+
+def test_metric_without_children_cannot_be_created(registry):
+    class Incomplete(Metric):
+        type = "counter"
+
+    with pytest.raises(TypeError):
+        Incomplete("test_incomplete", "Incomplete")
+    assert registry == {}
+
+
+def test_render_prometheus_text(registry):
+    Counter("test_total", "A counter").inc()
+    Gauge("test_in_progress", "A gauge", labelnames=("route",)).labels('/"quoted"').set(2)
+    histogram = Histogram("test_seconds", "A histogram", buckets=(0.1, 1.0))
+    histogram.observe(0.05)
+    histogram.observe(0.5)
+
+    text = render(merge([{"metrics": metrics.snapshot()}]))
+
+    assert "# TYPE test_total counter\ntest_total 1.0\n" in text
+    assert 'test_in_progress{route="/\\"quoted\\""} 2.0' in text
+    assert 'test_seconds_bucket{le="0.1"} 1.0' in text
+    assert 'test_seconds_bucket{le="1.0"} 2.0' in text
+    assert 'test_seconds_bucket{le="+Inf"} 2.0' in text
+    assert "test_seconds_count 2.0" in text
+    assert "test_seconds_sum 0.55" in text
+
+
+def test_multiprocess_snapshots_are_merged(registry, tmp_path):
+    counter = Counter("test_total", "A counter")
+    Gauge("test_lag", "A gauge", aggregate="max").set(0.2)
+    Gauge("test_in_progress", "A gauge").set(1)
+    counter.inc(5)
+
+    other_worker = {
+        "live": True,
+        "metrics": {
+            "test_total": {**counter.snapshot(), "samples": [[[], 2]]},
+            "test_lag": {**registry["test_lag"].snapshot(), "samples": [[[], 0.5]]},
+            "test_in_progress": {**registry["test_in_progress"].snapshot(), "samples": [[[], 3]]},
+        }
+    }
+    stopped_worker = {**other_worker, "live": False}
+    (tmp_path / "metrics-1.json").write_text(json.dumps(other_worker))
+    (tmp_path / "metrics-2.json").write_text(json.dumps(stopped_worker))
+
+    text = generate_latest(str(tmp_path))
+
+    # counters sum over every worker, gauges only over live ones
+    assert "test_total 9.0" in text
+    assert "test_lag 0.5" in text
+    assert "test_in_progress 4.0" in text
+    assert (tmp_path / metrics.snapshot_path(str(tmp_path)).split("/")[-1]).exists()
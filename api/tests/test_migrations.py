@@ -0,0 +1,50 @@
+import sqlalchemy
+
+from api.database import metadata
+from api.migrations import MIGRATIONS, migrate
+
+OLD_SCHEMA = [
+    "CREATE TABLE users (id INTEGER PRIMARY KEY, email VARCHAR UNIQUE, password VARCHAR, confirmed BOOLEAN)",
+    "CREATE TABLE posts (id INTEGER PRIMARY KEY, body VARCHAR, user_id INTEGER NOT NULL REFERENCES users (id))",
+    "CREATE TABLE comments (id INTEGER PRIMARY KEY, body VARCHAR, post_id INTEGER NOT NULL REFERENCES posts (id), user_id INTEGER NOT NULL REFERENCES users (id))",
+    "CREATE TABLE likes (id INTEGER PRIMARY KEY, post_id INTEGER NOT NULL REFERENCES posts (id), user_id INTEGER NOT NULL REFERENCES users (id))",
+    "INSERT INTO users (id, email, password, confirmed) VALUES (1, 'test@example.net', 'x', 1)",
+    "INSERT INTO posts (id, body, user_id) VALUES (1, 'Test Post', 1)",
+    "INSERT INTO likes (post_id, user_id) VALUES (1, 1), (1, 1)",
+]
+
+
+def index_names(engine, table: str) -> set[str]:
+    return {index['name'] for index in sqlalchemy.inspect(engine).get_indexes(table)}
+
+
+def test_migrate_fresh_database(tmp_path):
+    engine = sqlalchemy.create_engine(f"sqlite:///{tmp_path / 'fresh.db'}")
+
+    assert migrate(engine) == MIGRATIONS[-1][0]
+    assert set(metadata.tables) <= set(sqlalchemy.inspect(engine).get_table_names())
+
+
+def test_migrate_existing_database(tmp_path):
+    engine = sqlalchemy.create_engine(f"sqlite:///{tmp_path / 'old.db'}")
+    with engine.begin() as connection:
+        for statement in OLD_SCHEMA:
+            connection.execute(sqlalchemy.text(statement))
+
+    assert migrate(engine) == MIGRATIONS[-1][0]
+
+    with engine.connect() as connection:
+        assert connection.scalar(sqlalchemy.text("SELECT count(*) FROM likes")) == 1
+        assert connection.scalar(sqlalchemy.text("SELECT like_count FROM posts")) == 1
+    assert {'uq_likes_post_id_user_id', 'ix_likes_user_id_id'} <= index_names(engine, 'likes')
+    assert 'ix_likes_user_id' not in index_names(engine, 'likes')
+    assert {'ix_comments_post_id', 'ix_comments_user_id_id'} <= index_names(engine, 'comments')
+    assert 'ix_posts_user_id_id' in index_names(engine, 'posts')
+    with engine.connect() as connection:
+        # rows that predate the search index get indexed by the migration
+        assert connection.scalar(
+            sqlalchemy.text("SELECT post_id FROM post_search WHERE post_search MATCH 'test'")
+        ) == 1
+
+    # already up to date, nothing to apply
+    assert migrate(engine) == MIGRATIONS[-1][0]
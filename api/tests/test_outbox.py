@@ -0,0 +1,135 @@
+import asyncio
+import time
+from unittest.mock import AsyncMock
+
+import pytest
+
+from api.database import database, email_outbox_table
+from api.outbox import EmailOutboxWorker, enqueue_email
+from api.tasks import APIResponseError
+
+
+def outbox_worker(send, max_attempts: int = 3) -> EmailOutboxWorker:
+    return EmailOutboxWorker(
+        batch_size=100,
+        concurrency=5,
+        poll_interval=0.01,
+        max_attempts=max_attempts,
+        backoff=10,
+        max_backoff=60,
+        lease=30,
+        send=send
+    )
+
+
+async def fetch_outbox_row(email_id: int):
+    query = email_outbox_table.select().where(email_outbox_table.c.id == email_id)
+    return await database.fetch_one(query)
+
+
+@pytest.mark.anyio
+async def test_outbox_delivers_email():
+    send = AsyncMock()
+    email_id = await enqueue_email("test@example.net", "Test subject", "Test body")
+
+    await outbox_worker(send).process_batch()
+
+    send.assert_any_await("test@example.net", "Test subject", "Test body")
+    row = await fetch_outbox_row(email_id)
+    assert row.status == 'sent'
+    assert row.attempts == 1
+
+
+@pytest.mark.anyio
+async def test_outbox_retries_with_backoff():
+    send = AsyncMock(side_effect=APIResponseError(503, "unavailable"))
+    email_id = await enqueue_email("test@example.net", "Test subject", "Test body")
+
+    before = time.time()
+    await outbox_worker(send).process_batch()
+
+    row = await fetch_outbox_row(email_id)
+    assert row.status == 'pending'
+    assert row.attempts == 1
+    assert row.next_attempt_at >= before + 10
+    assert "503" in row.last_error
+
+    # not due yet, so it is not claimed again
+    await outbox_worker(send).process_batch()
+    assert (await fetch_outbox_row(email_id)).attempts == 1
+
+
+@pytest.mark.anyio
+async def test_outbox_dead_letters_permanent_failure():
+    send = AsyncMock(side_effect=APIResponseError(400, "bad recipient"))
+    email_id = await enqueue_email("not-an-email", "Test subject", "Test body")
+
+    await outbox_worker(send).process_batch()
+
+    row = await fetch_outbox_row(email_id)
+    assert row.status == 'dead'
+    assert row.attempts == 1
+
+
+@pytest.mark.anyio
+async def test_outbox_dead_letters_after_max_attempts():
+    send = AsyncMock(side_effect=APIResponseError(500, "server error"))
+    email_id = await enqueue_email("test@example.net", "Test subject", "Test body")
+    worker = outbox_worker(send, max_attempts=2)
+
+    await worker.process_batch()
+    await database.execute(
+        email_outbox_table.update()
+        .where(email_outbox_table.c.id == email_id)
+        .values(next_attempt_at=time.time())
+    )
+    await worker.process_batch()
+
+    row = await fetch_outbox_row(email_id)
+    assert row.status == 'dead'
+    assert row.attempts == 2
+
+
+@pytest.mark.anyio
+async def test_outbox_reclaims_expired_lease():
+    email_id = await enqueue_email("test@example.net", "Test subject", "Test body")
+    await database.execute(
+        email_outbox_table.update()
+        .where(email_outbox_table.c.id == email_id)
+        .values(status='sending', claimed_at=time.time() - 60)
+    )
+
+    await outbox_worker(AsyncMock()).process_batch()
+
+    assert (await fetch_outbox_row(email_id)).status == 'sent'
+
+
+@pytest.mark.anyio
+async def test_outbox_worker_start_stop():
+    send = AsyncMock()
+    email_id = await enqueue_email("test@example.net", "Test subject", "Test body")
+    worker = outbox_worker(send)
+
+    worker.start()
+    for _ in range(100):
+        if (await fetch_outbox_row(email_id)).status == 'sent':
+            break
+        await asyncio.sleep(0.01)
+    await worker.stop()
+
+    assert (await fetch_outbox_row(email_id)).status == 'sent'
+
+
+def test_outbox_worker_restarts_on_another_loop(mocker):
+    worker = outbox_worker(AsyncMock())
+    mocker.patch.object(worker, "process_batch", AsyncMock(return_value=0))
+
+    async def run_once():
+        worker.start()
+        await asyncio.sleep(0.02)
+        await worker.stop()
+
+    # each app lifespan (tests, reload) can run on its own event loop
+    asyncio.run(run_once())
+    asyncio.run(run_once())
+    assert worker.process_batch.await_count >= 2
@@ -0,0 +1,40 @@
+import pytest
+from fastapi import HTTPException
+
+from api.pagination import decode_cursor, encode_cursor, paginate
+
+
+def test_cursor_round_trip():
+    cursor = encode_cursor({"k": "most_liked", "likes": 3, "id": 42})
+    assert decode_cursor(cursor, "most_liked", "likes", "id") == (3, 42)
+
+
+def test_cursor_rejects_other_listing():
+    cursor = encode_cursor({"k": "new", "id": 42})
+    with pytest.raises(HTTPException) as exc_info:
+        decode_cursor(cursor, "old", "id")
+    assert exc_info.value.status_code == 400
+
+
+@pytest.mark.parametrize("cursor", [
+    "not-a-cursor",
+    encode_cursor({"k": "new"}),
+    encode_cursor({"k": "new", "id": "1 OR 1=1"}),
+    encode_cursor({"k": "new", "id": True}),
+])
+def test_cursor_rejects_malformed(cursor):
+    with pytest.raises(HTTPException) as exc_info:
+        decode_cursor(cursor, "new", "id")
+    assert exc_info.value.detail == "Invalid cursor"
+
+
+def test_paginate_last_page():
+    rows, next_cursor = paginate([1, 2], 2, lambda row: {"k": "new", "id": row})
+    assert rows == [1, 2]
+    assert next_cursor is None
+
+
+def test_paginate_has_more():
+    rows, next_cursor = paginate([3, 2, 1], 2, lambda row: {"k": "new", "id": row})
+    assert rows == [3, 2]
+    assert decode_cursor(next_cursor, "new", "id") == (2,)
@@ -0,0 +1,125 @@
+import asyncio
+import json
+import time
+
+import pytest
+from fastapi import FastAPI
+from fastapi.responses import StreamingResponse
+from httpx import ASGITransport, AsyncClient
+
+from api.profiling import ProfilingMiddleware, classify, record_query, task_factories
+from api.serialization import json_response
+
+
+def busy(seconds: float):
+    deadline = time.perf_counter() + seconds
+    while time.perf_counter() < deadline:
+        pass
+
+
+def test_classify_innermost_phase_wins():
+    def serialize_response():
+        pass
+
+    def validate():
+        pass
+
+    assert classify([busy.__code__]) == "app"
+    assert classify([busy.__code__, json_response.__code__]) == "serialization"
+    assert classify([serialize_response.__code__, validate.__code__]) == "validation"
+
+
+@pytest.fixture()
+def profiled_app(tmp_path):
+    app = FastAPI()
+    app.add_middleware(ProfilingMiddleware, token="secret", directory=str(tmp_path), interval=0.001)
+
+    @app.get("/slow")
+    async def slow():
+        busy(0.05)
+        return json_response({"ok": True})
+
+    @app.get("/stream")
+    async def stream():
+        async def body():
+            record_query("SELECT 1", None, 0.25, None)
+            busy(0.05)
+            yield b"done"
+
+        # the body runs in a separate task
+        return StreamingResponse(body())
+
+    @app.get("/gather")
+    async def gather():
+        async def work():
+            busy(0.05)
+
+        await asyncio.gather(work())
+        return json_response({"ok": True})
+
+    return app
+
+
+@pytest.mark.anyio
+async def test_request_without_header_is_not_profiled(profiled_app, tmp_path):
+    transport = ASGITransport(app=profiled_app)
+    async with AsyncClient(transport=transport, base_url="http://test") as client:
+        response = await client.get("/slow", headers={"X-Profile": "wrong"})
+
+    assert response.status_code == 200
+    assert "x-profile-file" not in response.headers
+    assert list(tmp_path.iterdir()) == []
+
+
+@pytest.mark.anyio
+async def test_profiled_request_writes_speedscope_file(profiled_app, tmp_path):
+    transport = ASGITransport(app=profiled_app)
+    async with AsyncClient(transport=transport, base_url="http://test") as client:
+        response = await client.get("/slow", headers={"X-Profile": "secret"})
+
+    assert response.status_code == 200
+    profile = json.loads((tmp_path / response.headers["x-profile-file"]).read_text())
+    names = {frame["name"] for frame in profile["shared"]["frames"]}
+    assert "profiled_app.<locals>.slow" in names
+    assert profile["profiles"][0]["type"] == "sampled"
+    assert profile["phases"]["app"] > 0.02
+    assert set(profile["phases"]) == {"validation", "serialization", "app", "waiting", "db", "wall"}
+
+
+@pytest.mark.anyio
+async def test_profile_covers_spawned_tasks_and_db_time(profiled_app, tmp_path):
+    transport = ASGITransport(app=profiled_app)
+    async with AsyncClient(transport=transport, base_url="http://test") as client:
+        response = await client.get("/stream", headers={"X-Profile": "secret"})
+
+    profile = json.loads((tmp_path / response.headers["x-profile-file"]).read_text())
+    assert profile["phases"]["app"] > 0.02
+    assert profile["phases"]["db"] == 0.25
+
+
+@pytest.mark.anyio
+async def test_profile_covers_gathered_tasks(profiled_app, tmp_path):
+    transport = ASGITransport(app=profiled_app)
+    async with AsyncClient(transport=transport, base_url="http://test") as client:
+        response = await client.get("/gather", headers={"X-Profile": "secret"})
+
+    profile = json.loads((tmp_path / response.headers["x-profile-file"]).read_text())
+    names = {frame["name"] for frame in profile["shared"]["frames"]}
+    assert "profiled_app.<locals>.gather.<locals>.work" in names
+    assert profile["phases"]["app"] > 0.02
+
+
+@pytest.mark.anyio
+async def test_task_factory_is_restored_after_profiling(profiled_app):
+    loop = asyncio.get_running_loop()
+    original = loop.get_task_factory()
+    transport = ASGITransport(app=profiled_app)
+    async with AsyncClient(transport=transport, base_url="http://test") as client:
+        responses = await asyncio.gather(
+            client.get("/slow", headers={"X-Profile": "secret"}),
+            client.get("/gather", headers={"X-Profile": "secret"}),
+        )
+
+    assert all(response.status_code == 200 for response in responses)
+    assert loop.get_task_factory() is original
+    assert loop not in task_factories
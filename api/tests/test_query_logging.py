@@ -0,0 +1,99 @@
+import logging
+from unittest.mock import Mock
+
+import pytest
+import sqlalchemy
+
+from api import query_logging
+from api.config import config
+from api.database import database, user_table
+from api.query_logging import log_query, redact_parameters
+
+
+@pytest.fixture()
+def sql_log_level():
+    level = query_logging.logger.level
+    yield query_logging.logger.setLevel
+    query_logging.logger.setLevel(level)
+
+
+def test_redact_parameters():
+    assert redact_parameters(
+        {"email_1": "a@b.c", "password": "hunter2", "body": "hi", "status": "x" * 300, "id_1": 5}
+    ) == {
+        "email_1": "***",
+        "password": "***",
+        "body": "***",
+        "status": "x" * 200 + "...",
+        "id_1": 5,
+    }
+
+
+def test_log_query_does_not_compile_when_debug_disabled(sql_log_level):
+    sql_log_level(logging.INFO)
+    query = Mock()
+
+    log_query(query, None, 0.001, None)
+
+    query.compile.assert_not_called()
+
+
+def test_log_query_logs_rendered_query_at_debug(sql_log_level, mocker):
+    sql_log_level(logging.DEBUG)
+    debug = mocker.patch.object(query_logging.logger, "debug")
+
+    log_query(user_table.select().where(user_table.c.id == 5), None, 0.001, None)
+
+    message = debug.call_args.args[0]
+    assert "SELECT users.id" in message
+    assert "'id_1': 5" in message
+
+
+def test_log_query_logs_slow_queries_redacted(sql_log_level, mocker, monkeypatch):
+    sql_log_level(logging.INFO)
+    monkeypatch.setattr(config, "SLOW_QUERY_THRESHOLD_SECONDS", 0.1)
+    warning = mocker.patch.object(query_logging.slow_logger, "warning")
+
+    log_query(user_table.insert().values(email="a@b.c", password="hunter2"), None, 0.2, None)
+
+    message = warning.call_args.args[0]
+    assert message.startswith("Slow query 200.0ms ok: INSERT INTO users")
+    assert "hunter2" not in message
+    assert "a@b.c" not in message
+    assert "'email': 'str'" in message
+
+
+def test_log_query_never_logs_emails(sql_log_level, mocker, monkeypatch):
+    sql_log_level(logging.DEBUG)
+    debug = mocker.patch.object(query_logging.logger, "debug")
+    warning = mocker.patch.object(query_logging.slow_logger, "warning")
+    query = user_table.select().where(user_table.c.email == "a@b.c")
+
+    log_query(query, None, 0.001, None)
+    monkeypatch.setattr(config, "SLOW_QUERY_THRESHOLD_SECONDS", 0.1)
+    log_query(query, None, 0.2, None)
+
+    messages = [debug.call_args.args[0], warning.call_args.args[0]]
+    assert all("a@b.c" not in message for message in messages)
+
+
+@pytest.mark.anyio
+async def test_database_reports_queries_to_observers(db):
+    calls = []
+
+    def observer(query, values, elapsed, error):
+        calls.append((query, elapsed, error))
+
+    query = sqlalchemy.select(sqlalchemy.literal(1))
+    database.add_query_observer(observer)
+    try:
+        assert await database.fetch_val(query) == 1
+        with pytest.raises(Exception):
+            await database.execute("SELECT * FROM missing_table")
+    finally:
+        database.remove_query_observer(observer)
+
+    assert calls[0][0] is query
+    assert calls[0][1] >= 0
+    assert calls[0][2] is None
+    assert calls[1][2] is not None
@@ -0,0 +1,63 @@
+import pytest
+from fastapi import FastAPI
+from httpx import ASGITransport, AsyncClient
+
+from api import statements
+from api.database import post_table
+from api.query_stats import (
+    QueryStatsMiddleware,
+    count_queries,
+    record_query,
+    statement_label,
+)
+
+
+def test_statement_label_names_registered_statements():
+    assert statement_label(statements.find_post(post_id=1)) == "find_post"
+    assert statement_label(post_table.select().where(post_table.c.id == 1)) == "select posts"
+    assert statement_label(post_table.insert().values(body="x", user_id=1)) == "insert posts"
+
+
+def test_count_queries_reports_to_enclosing_counters():
+    with count_queries() as outer:
+        record_query(statements.find_post(post_id=1), None, 0.002, None)
+        with count_queries() as inner:
+            record_query(statements.find_post(post_id=2), None, 0.003, None)
+
+    assert inner.count == 1
+    assert outer.count == 2
+    assert outer.total == pytest.approx(0.005)
+    assert [label for label, _ in outer.statements] == ["find_post", "find_post"]
+
+
+def test_record_query_outside_a_request_is_ignored():
+    record_query(statements.find_post(post_id=1), None, 0.002, None)
+
+
+@pytest.fixture()
+def counted_app():
+    app = FastAPI()
+    app.add_middleware(QueryStatsMiddleware, server_timing=True, n_plus_one_threshold=3)
+
+    @app.get("/posts/{n}")
+    async def posts(n: int):
+        for post_id in range(n):
+            record_query(statements.find_post(post_id=post_id), None, 0.001, None)
+        return {}
+
+    return app
+
+
+@pytest.mark.anyio
+async def test_server_timing_and_n_plus_one_warning(counted_app, mocker):
+    logger = mocker.patch("api.query_stats.logger")
+    transport = ASGITransport(app=counted_app)
+    async with AsyncClient(transport=transport, base_url="http://test") as client:
+        few = await client.get("/posts/2")
+        many = await client.get("/posts/4")
+
+    assert 'desc="2 queries"' in few.headers["server-timing"]
+    assert 'desc="4 queries"' in many.headers["server-timing"]
+    warnings = [call.args[0] for call in logger.warning.call_args_list]
+    assert len(warnings) == 1
+    assert "GET /posts/4" in warnings[0] and "'find_post' ran 4 times" in warnings[0]
@@ -0,0 +1,105 @@
+import pytest
+from fastapi import HTTPException
+
+from api.rate_limit import Bucket, MemoryStore, RateLimiter
+
+
+@pytest.mark.anyio
+async def test_bucket_allows_burst_then_refills(mocker):
+    monotonic = mocker.patch("api.rate_limit.time.monotonic", return_value=100.0)
+    store = MemoryStore(maxsize=10)
+    bucket = Bucket(capacity=2, refill_per_second=0.5)
+
+    assert await store.take("key", bucket) == 0
+    assert await store.take("key", bucket) == 0
+    assert await store.take("key", bucket) == 2
+
+    monotonic.return_value = 102.0
+    assert await store.take("key", bucket) == 0
+    assert await store.take("key", bucket) == 2
+
+
+@pytest.mark.anyio
+async def test_full_buckets_expire(mocker):
+    monotonic = mocker.patch("api.rate_limit.time.monotonic", return_value=100.0)
+    store = MemoryStore(maxsize=10)
+    bucket = Bucket(capacity=2, refill_per_second=1)
+    await store.take("a", bucket)
+    await store.take("b", bucket)
+    assert len(store) == 2
+
+    # "a" is full again at 101; "b" was just used and is kept
+    monotonic.return_value = 101.0
+    await store.take("b", bucket)
+    assert len(store) == 1
+
+
+@pytest.mark.anyio
+async def test_expired_buckets_behind_a_long_lived_one_are_dropped(mocker):
+    monotonic = mocker.patch("api.rate_limit.time.monotonic", return_value=100.0)
+    store = MemoryStore(maxsize=10)
+    # least recently used, but the last to be full again
+    await store.take("slow", Bucket(capacity=1, refill_per_second=0.001))
+    for key in "ab":
+        await store.take(key, Bucket(capacity=1, refill_per_second=1))
+
+    monotonic.return_value = 102.0
+    await store.take("c", Bucket(capacity=1, refill_per_second=1))
+    assert len(store) == 2
+
+
+@pytest.mark.anyio
+async def test_superseded_expiries_are_compacted(mocker):
+    mocker.patch("api.rate_limit.time.monotonic", return_value=100.0)
+    store = MemoryStore(maxsize=10)
+    bucket = Bucket(capacity=1000, refill_per_second=1)
+    for _ in range(500):
+        await store.take("key", bucket)
+    assert len(store) == 1
+    assert len(store._expiries) <= 2 + 64
+
+
+@pytest.mark.anyio
+async def test_store_is_bounded(mocker):
+    mocker.patch("api.rate_limit.time.monotonic", return_value=100.0)
+    store = MemoryStore(maxsize=2)
+    bucket = Bucket(capacity=1, refill_per_second=0.01)
+    for key in "abc":
+        await store.take(key, bucket)
+    assert len(store) == 2
+    # the least recently used key starts over with a full bucket
+    assert await store.take("a", bucket) == 0
+    assert await store.take("c", bucket) > 0
+
+
+@pytest.mark.anyio
+async def test_rate_limiter_rejects_per_ip_and_per_email():
+    limiter = RateLimiter(
+        MemoryStore(maxsize=10),
+        ip_bucket=Bucket(capacity=2, refill_per_second=0.01),
+        email_bucket=Bucket(capacity=1, refill_per_second=0.01),
+    )
+    await limiter.check("token", "1.2.3.4", "a@example.com")
+
+    with pytest.raises(HTTPException) as exc_info:
+        await limiter.check("token", "5.6.7.8", " A@example.com")
+    assert exc_info.value.status_code == 429
+    assert exc_info.value.headers["Retry-After"] == "100"
+
+    await limiter.check("token", "1.2.3.4", "b@example.com")
+    # other endpoints have buckets of their own
+    await limiter.check("register", "1.2.3.4", "c@example.com")
+    with pytest.raises(HTTPException):
+        await limiter.check("token", "1.2.3.4", "c@example.com")
+
+
+@pytest.mark.anyio
+async def test_disabled_rate_limiter():
+    limiter = RateLimiter(
+        MemoryStore(maxsize=10),
+        ip_bucket=Bucket(capacity=1, refill_per_second=0.01),
+        email_bucket=Bucket(capacity=1, refill_per_second=0.01),
+        enabled=False
+    )
+    for _ in range(3):
+        await limiter.check("token", "1.2.3.4", "a@example.com")
@@ -0,0 +1,128 @@
+import asyncio
+
+import pytest
+
+from api.response_cache import CachedResponse, MemoryBackend, ResponseCache
+
+
+def make_builder(bodies: list[bytes], started: asyncio.Event | None = None, release=None):
+    calls = []
+
+    async def build() -> CachedResponse:
+        calls.append(len(calls))
+        if started is not None:
+            started.set()
+        if release is not None:
+            await release.wait()
+        return CachedResponse(bodies[len(calls) - 1], f'"v{len(calls)}"', None)
+
+    return build, calls
+
+
+@pytest.fixture()
+def clock(mocker):
+    return mocker.patch("api.response_cache.time.time", return_value=1000.0)
+
+
+@pytest.mark.anyio
+async def test_fresh_entries_are_served_from_the_cache(clock):
+    cache = ResponseCache(MemoryBackend(10), ttl=5, stale_ttl=30)
+    build, calls = make_builder([b"first", b"second"])
+
+    assert (await cache.get_or_build("key", build)).body == b"first"
+    clock.return_value = 1004.0
+    assert (await cache.get_or_build("key", build)).body == b"first"
+    assert len(calls) == 1
+
+
+@pytest.mark.anyio
+async def test_stale_entry_is_served_while_one_refresh_runs(clock):
+    cache = ResponseCache(MemoryBackend(10), ttl=5, stale_ttl=30)
+    release = asyncio.Event()
+    build, calls = make_builder([b"first", b"second"])
+    await cache.get_or_build("key", build)
+
+    refresh, refresh_calls = make_builder([b"second"], release=release)
+    clock.return_value = 1010.0
+    stale = [await cache.get_or_build("key", refresh) for _ in range(3)]
+    assert [response.body for response in stale] == [b"first"] * 3
+
+    release.set()
+    await asyncio.sleep(0)
+    await asyncio.sleep(0)
+    assert len(refresh_calls) == 1
+    assert (await cache.get_or_build("key", refresh)).body == b"second"
+
+
+@pytest.mark.anyio
+async def test_expired_entry_is_rebuilt(clock):
+    cache = ResponseCache(MemoryBackend(10), ttl=5, stale_ttl=30)
+    build, calls = make_builder([b"first", b"second"])
+    await cache.get_or_build("key", build)
+
+    clock.return_value = 1036.0
+    assert (await cache.get_or_build("key", build)).body == b"second"
+
+
+@pytest.mark.anyio
+async def test_concurrent_misses_share_one_build(clock):
+    cache = ResponseCache(MemoryBackend(10), ttl=5, stale_ttl=30)
+    release = asyncio.Event()
+    build, calls = make_builder([b"first"], release=release)
+
+    waiting = [asyncio.create_task(cache.get_or_build("key", build)) for _ in range(5)]
+    await asyncio.sleep(0)
+    release.set()
+    responses = await asyncio.gather(*waiting)
+
+    assert len(calls) == 1
+    assert {response.body for response in responses} == {b"first"}
+
+
+@pytest.mark.anyio
+async def test_build_invalidated_while_running_is_not_stored(clock):
+    cache = ResponseCache(MemoryBackend(10), ttl=5, stale_ttl=30)
+    started, release = asyncio.Event(), asyncio.Event()
+    build, calls = make_builder([b"before write", b"after write"], started, release)
+
+    reading = asyncio.create_task(cache.get_or_build("key", build))
+    await started.wait()
+    await cache.invalidate("key")
+    release.set()
+    assert (await reading).body == b"before write"
+
+    assert (await cache.get_or_build("key", build)).body == b"after write"
+    assert len(calls) == 2
+
+
+@pytest.mark.anyio
+async def test_build_errors_are_not_cached(clock):
+    cache = ResponseCache(MemoryBackend(10), ttl=5, stale_ttl=30)
+
+    async def missing():
+        raise LookupError("post not found")
+
+    with pytest.raises(LookupError):
+        await cache.get_or_build("key", missing)
+    assert await cache.backend.get("key") is None
+
+
+@pytest.mark.anyio
+async def test_disabled_cache_always_builds(clock):
+    cache = ResponseCache(MemoryBackend(10), ttl=0, stale_ttl=30)
+    build, calls = make_builder([b"first", b"second"])
+
+    await cache.get_or_build("key", build)
+    assert (await cache.get_or_build("key", build)).body == b"second"
+
+
+@pytest.mark.anyio
+async def test_memory_backend_evicts_least_recently_used():
+    backend = MemoryBackend(2)
+    for key in ("a", "b"):
+        await backend.set(key, CachedResponse(key.encode(), key, None), ttl=60)
+    await backend.get("a")
+    await backend.set("c", CachedResponse(b"c", "c", None), ttl=60)
+
+    assert await backend.get("b") is None
+    assert (await backend.get("a")).body == b"a"
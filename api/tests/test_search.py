@@ -0,0 +1,43 @@
+import sqlite3
+import threading
+
+import sqlalchemy
+
+from api.database import connection_options
+from api.migrations import migrate
+from api.search import SearchIndexConnection, match_query
+
+
+def test_match_query_quotes_terms():
+    assert match_query('fast "api" OR') == '"fast" "api" "OR"'
+    assert match_query("  ") is None
+
+
+def test_concurrent_writers_wait_instead_of_deadlocking(tmp_path):
+    path = tmp_path / "search.db"
+    migrate(sqlalchemy.create_engine(f"sqlite:///{path}"))
+
+    def connect():
+        return sqlite3.connect(
+            path, isolation_level=None, timeout=5, check_same_thread=False,
+            factory=SearchIndexConnection
+        )
+
+    insert = "INSERT INTO posts (body, user_id) VALUES ('post', 1)"
+    first, second = connect(), connect()
+    first.execute("BEGIN")
+    first.execute(insert)
+    # the second writer waits on the first one's lock until it commits
+    timer = threading.Timer(0.2, first.execute, ["COMMIT"])
+    timer.start()
+    second.execute("BEGIN")
+    second.execute(insert)
+    second.execute("COMMIT")
+    timer.join()
+
+    assert second.execute("SELECT count(*) FROM post_search").fetchone() == (2,)
+
+
+def test_connection_factory_only_for_sqlite():
+    assert connection_options("sqlite:///data.db") == {"factory": SearchIndexConnection}
+    assert connection_options("postgresql://user@localhost/api") == {}
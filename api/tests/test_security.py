@@ -1,4 +1,5 @@
-
+import asyncio
+import threading
 
 import pytest
 from jose import jwt
@@ -121,3 +122,105 @@ async def test_get_current_user_wrong_token_type():
     token = security.create_confirmation_token('123')
     with pytest.raises(security.HTTPException):
         await security.get_current_user(token)
+
+@pytest.mark.anyio
+async def test_password_hashes_async():
+    password = "1234"
+    hashed_password = await security.get_password_hash_async(password)
+    assert await security.verify_and_update_password_async(password, hashed_password) == (True, None)
+    verified, _ = await security.verify_and_update_password_async("wrong password", hashed_password)
+    assert not verified
+
+@pytest.mark.anyio
+async def test_password_hasher_restarts_after_shutdown():
+    hasher = security.PasswordHasher(max_workers=1, max_pending=1)
+    assert await hasher.run(security.get_password_hash, "1234")
+    hasher.shutdown()
+    # a later lifespan in the same process hashes again
+    assert await hasher.run(security.get_password_hash, "1234")
+    hasher.shutdown()
+
+@pytest.mark.anyio
+async def test_password_hasher_rejects_when_full():
+    hasher = security.PasswordHasher(max_workers=1, max_pending=1)
+    release = threading.Event()
+    busy = asyncio.ensure_future(hasher.run(release.wait))
+    await asyncio.sleep(0)
+
+    with pytest.raises(security.HTTPException) as exc_info:
+        await hasher.run(security.get_password_hash, "1234")
+    assert exc_info.value.status_code == 503
+    assert exc_info.value.headers["Retry-After"] == "1"
+
+    release.set()
+    await busy
+    hasher.shutdown()
+
+@pytest.mark.anyio
+async def test_authenticate_user_upgrades_outdated_hash(confirmed_user: dict):
+    outdated_context = security.build_password_context(
+        schemes=["bcrypt"],
+        bcrypt_rounds=security.config.BCRYPT_ROUNDS + 1,
+        argon2_time_cost=1,
+        argon2_memory_cost=1024,
+        argon2_parallelism=1
+    )
+    outdated_hash = outdated_context.hash(confirmed_user['password'])
+    await security.database.execute(
+        security.user_table.update()
+        .where(security.user_table.c.id == confirmed_user['id'])
+        .values(password=outdated_hash)
+    )
+    assert security.pwd_context.needs_update(outdated_hash)
+
+    await security.authenticate_user(confirmed_user['email'], confirmed_user['password'])
+
+    user = await security.get_user(confirmed_user['email'])
+    assert user.password != outdated_hash
+    assert not security.pwd_context.needs_update(user.password)
+    assert security.verify_password(confirmed_user['password'], user.password)
+
+@pytest.mark.anyio
+async def test_get_current_user_is_cached(registered_user, mocker):
+    token = security.create_access_token(registered_user['email'])
+    await security.get_current_user(token)
+
+    spy = mocker.spy(security, "get_user")
+    user = await security.get_current_user(token)
+    assert user.email == registered_user['email']
+    spy.assert_not_called()
+
+    security.invalidate_user(registered_user['email'])
+    await security.get_current_user(token)
+    spy.assert_called_once()
+
+def test_get_subject_for_token_type_uses_token_cache(mocker):
+    token = security.create_access_token("test@example.com")
+    security.get_subject_for_token_type(token, "access")
+
+    spy = mocker.spy(security, "jwt_decode")
+    assert security.get_subject_for_token_type(token, "access") == "test@example.com"
+    spy.assert_not_called()
+
+    with pytest.raises(security.HTTPException):
+        security.get_subject_for_token_type(token, "confirmation")
+
+def test_expired_token_is_not_cached(mocker):
+    mocker.patch("api.security.access_token_expire_minutes", return_value=-1)
+    token = security.create_access_token("test@example.com")
+    with pytest.raises(security.HTTPException):
+        security.get_subject_for_token_type(token, "access")
+    assert len(security.token_cache) == 0
+
+def test_pyjwt_backend():
+    pytest.importorskip("jwt")
+    encode, decode = security.load_jwt_backend("pyjwt")
+    token = security.create_access_token("test@example.com")
+    assert decode(token, security.SECRET_KEY, algorithms=[security.ALGORITHM])['sub'] == "test@example.com"
+    assert jwt.decode(
+        encode({"sub": "123"}, security.SECRET_KEY, algorithm=security.ALGORITHM),
+        security.SECRET_KEY,
+        algorithms=[security.ALGORITHM]
+    ) == {"sub": "123"}
+    with pytest.raises(security.JWTError):
+        decode("invalid token", security.SECRET_KEY, algorithms=[security.ALGORITHM])
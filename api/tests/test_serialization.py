@@ -0,0 +1,58 @@
+import json
+
+import pytest
+from pydantic import BaseModel
+
+from api.database import database, post_table, user_table
+from api.models.post import UserPost
+from api.serialization import RowSerializer, json_response
+
+
+def test_row_serializer_projects_model_fields():
+    row = {"id": 1, "body": "Test Post", "user_id": 2, "like_count": 3}
+    assert RowSerializer(UserPost).dump(row) == {"body": "Test Post", "id": 1, "user_id": 2}
+
+
+@pytest.mark.anyio
+async def test_row_serializer_matches_model_dump(registered_user: dict):
+    for body in ["Test Post", "Ünïcode \"quoted\""]:
+        await database.execute(
+            post_table.insert().values(body=body, user_id=registered_user['id'])
+        )
+    rows = await database.fetch_all(post_table.select())
+
+    expected = [
+        UserPost.model_validate(row, from_attributes=True).model_dump(mode="json")
+        for row in rows
+    ]
+    response = json_response(RowSerializer(UserPost).dump_many(rows))
+
+    assert response.media_type == "application/json"
+    assert json.loads(response.body) == expected
+
+
+def test_row_serializer_empty():
+    assert RowSerializer(UserPost).dump_many([]) == []
+
+
+class UserId(BaseModel):
+    id: int
+
+
+class UserConfirmed(BaseModel):
+    id: int
+    confirmed: bool
+
+
+@pytest.mark.anyio
+async def test_row_serializer_single_field(registered_user: dict):
+    rows = await database.fetch_all(user_table.select())
+
+    assert RowSerializer(UserId).dump_many(rows) == [{"id": row.id} for row in rows]
+
+
+@pytest.mark.anyio
+async def test_row_serializer_applies_result_processing(confirmed_user: dict):
+    rows = await database.fetch_all(user_table.select().where(user_table.c.id == confirmed_user['id']))
+
+    assert RowSerializer(UserConfirmed).dump_many(rows) == [{"id": confirmed_user['id'], "confirmed": True}]
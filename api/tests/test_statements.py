@@ -0,0 +1,58 @@
+import pytest
+
+from api import statements
+from api.database import database, like_table, post_table
+from api.statements import STATEMENTS
+
+
+def test_statements_are_registered_by_name():
+    assert STATEMENTS["find_post"] is statements.find_post
+    assert len(STATEMENTS) == 12 + 2 + 12 + 2 + 6
+
+
+def test_statement_keeps_construct_literals():
+    statement = statements.sorted_posts[("new", True, False)]
+    # SQLite renders "LIMIT :limit OFFSET :param_1"; only limit is left open
+    assert statement.parameters == {"limit"}
+    assert statement(limit=5).compile().params == {"limit": 5, "param_1": 0}
+
+
+def test_statement_result_columns():
+    statement = statements.sorted_posts[("most_liked", False, False)]
+    assert [column.name for column in statement.columns] == [
+        "id", "body", "user_id", "like_count", "version", "updated_at", "likes"
+    ]
+
+
+@pytest.mark.anyio
+async def test_statements_execute(registered_user: dict):
+    post_ids = [
+        await database.execute(
+            post_table.insert().values(body=f"Post {i}", user_id=registered_user['id'])
+        )
+        for i in range(3)
+    ]
+    like_key = {"post_id": post_ids[0], "user_id": registered_user['id']}
+
+    assert (await database.fetch_one(statements.insert_like(**like_key))).id
+    assert await database.fetch_one(statements.insert_like(**like_key)) is None
+    await database.execute(statements.update_like_count(post_id=post_ids[0], delta=1))
+
+    rows = await database.fetch_all(
+        statements.sorted_posts[("most_liked", True, True)](
+            last_likes=1, last_id=post_ids[0] + 1, limit=100
+        )
+    )
+    assert [(row.id, row.likes) for row in rows if row.id in post_ids] == [
+        (post_ids[0], 1), (post_ids[2], 0), (post_ids[1], 0)
+    ]
+
+    rows = await database.fetch_all(
+        statements.sorted_posts[("new", True, True)](last_id=post_ids[2], limit=10)
+    )
+    assert [row.id for row in rows][:2] == [post_ids[1], post_ids[0]]
+
+    assert (await database.fetch_one(statements.delete_like(**like_key))).id
+    assert await database.fetch_one(
+        like_table.select().where(like_table.c.post_id == post_ids[0])
+    ) is None
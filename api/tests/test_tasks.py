@@ -1,7 +1,19 @@
+import json
+
 import httpx
 import pytest
 
-from api.tasks import APIResponseError, send_simple_email
+from api.database import database, user_table
+from api.tasks import (
+    APIResponseError,
+    close_http_client,
+    get_http_client,
+    iterate_user_recipients,
+    send_batch_email,
+    send_bulk_email,
+    send_email_to_users,
+    send_simple_email,
+)
 
 
 @pytest.mark.anyio
@@ -17,4 +29,109 @@ async def test_send_simple_email_api_error(mock_httpx_client):
     )
 
     with pytest.raises(APIResponseError):
-        await send_simple_email("test@example.net", "Test subject", "Test body")
\ No newline at end of file
+        await send_simple_email("test@example.net", "Test subject", "Test body")
+
+@pytest.mark.anyio
+async def test_send_simple_email_reuses_client(mock_httpx_client):
+    await send_simple_email('test@example.net', 'Test subject', 'Test body')
+    await send_simple_email('test@example.net', 'Test subject', 'Test body')
+    assert get_http_client() is mock_httpx_client
+    assert mock_httpx_client.post.await_count == 2
+
+
+@pytest.mark.anyio
+async def test_close_http_client(mocker):
+    mocker.patch('api.tasks.http_client', None)
+    client = get_http_client()
+    assert get_http_client() is client
+
+    await close_http_client()
+    assert client.is_closed
+    assert get_http_client() is not client
+    await close_http_client()
+
+
+async def recipients(*emails: str):
+    for email in emails:
+        yield {"email": email}
+
+
+@pytest.mark.anyio
+async def test_send_batch_email(mock_httpx_client):
+    mock_httpx_client.post.return_value = httpx.Response(
+        status_code=200, json={"id": "<batch@mailgun>"}, request=httpx.Request("Post", "//")
+    )
+    results = await send_batch_email(
+        [{"email": "a@example.net", "name": "A"}, {"email": "b@example.net", "name": "B"}],
+        "Hi %recipient.name%",
+        "Test body"
+    )
+
+    data = mock_httpx_client.post.call_args.kwargs['data']
+    assert data['to'] == ["a@example.net", "b@example.net"]
+    assert json.loads(data['recipient-variables'])["b@example.net"] == {"email": "b@example.net", "name": "B"}
+    assert [result.email for result in results] == ["a@example.net", "b@example.net"]
+    assert all(result.accepted and result.message_id == "<batch@mailgun>" for result in results)
+
+
+@pytest.mark.anyio
+@pytest.mark.parametrize("reply", [{"content": "Queued. Thank you."}, {"json": ["queued"]}])
+async def test_send_batch_email_without_json_id(mock_httpx_client, reply):
+    mock_httpx_client.post.return_value = httpx.Response(
+        status_code=200, request=httpx.Request("Post", "//"), **reply
+    )
+    results = await send_batch_email([{"email": "a@example.net"}], "Test subject", "Test body")
+
+    assert [(result.accepted, result.message_id) for result in results] == [(True, None)]
+
+
+@pytest.mark.anyio
+async def test_send_bulk_email_batches_recipients(mock_httpx_client):
+    mock_httpx_client.post.side_effect = [
+        httpx.Response(status_code=200, json={"id": "<1@mailgun>"}, request=httpx.Request("Post", "//")),
+        httpx.Response(status_code=500, content="", request=httpx.Request("Post", "//")),
+    ]
+    results = [
+        result async for result in send_bulk_email(
+            recipients("a@example.net", "b@example.net", "c@example.net"),
+            "Test subject",
+            "Test body",
+            batch_size=2
+        )
+    ]
+
+    assert mock_httpx_client.post.await_count == 2
+    assert [(result.email, result.accepted) for result in results] == [
+        ("a@example.net", True),
+        ("b@example.net", True),
+        ("c@example.net", False),
+    ]
+    assert "500" in results[2].error
+
+
+@pytest.mark.anyio
+async def test_send_email_to_users(mock_httpx_client, registered_user):
+    mock_httpx_client.post.return_value = httpx.Response(
+        status_code=200, json={"id": "<users@mailgun>"}, request=httpx.Request("Post", "//")
+    )
+    results = [result async for result in send_email_to_users("Test subject", "Test body")]
+
+    assert registered_user['email'] in {result.email for result in results}
+    recipient_variables = json.loads(mock_httpx_client.post.call_args.kwargs['data']['recipient-variables'])
+    assert recipient_variables[registered_user['email']]['id'] == registered_user['id']
+
+
+@pytest.mark.anyio
+async def test_iterate_user_recipients_pages_by_id(registered_user):
+    for email in ("second@example.net", "third@example.net"):
+        await database.execute(user_table.insert().values(email=email, password="x"))
+
+    recipients = [recipient async for recipient in iterate_user_recipients(page_size=2)]
+
+    ids = [recipient["id"] for recipient in recipients]
+    assert ids == sorted(set(ids))
+    assert {registered_user['email'], "second@example.net", "third@example.net"} <= {
+        recipient["email"] for recipient in recipients
+    }
+    only_second = iterate_user_recipients(user_table.c.email == "second@example.net", page_size=1)
+    assert [recipient["email"] async for recipient in only_second] == ["second@example.net"]
@@ -0,0 +1,95 @@
+"""Mailgun delivery throughput: a new httpx client per email vs the shared pooled client.
+
+Starts a fake Mailgun API on localhost (uvicorn, plain HTTP, optional
+artificial latency) and sends `--emails` messages `--concurrency` at a time
+both ways, reporting emails/sec. Against the real API the per-email path
+also pays a TLS handshake, so the gap there is larger than shown here.
+
+    python -m benchmarks.email_delivery --emails 500 --concurrency 20
+"""
+import argparse
+import asyncio
+import os
+import socket
+import threading
+import time
+
+import httpx
+import uvicorn
+from starlette.applications import Starlette
+from starlette.responses import JSONResponse
+from starlette.routing import Route
+
+os.environ.setdefault("ENV_STATE", "test")
+
+from api import tasks  # noqa: E402
+from api.config import config  # noqa: E402
+
+
+def fake_mailgun(latency: float) -> Starlette:
+    async def messages(request):
+        await request.form()
+        if latency:
+            await asyncio.sleep(latency)
+        return JSONResponse({"id": "<fake@mailgun>", "message": "Queued. Thank you."})
+
+    return Starlette(routes=[Route("/v3/{domain}/messages", messages, methods=["POST"])])
+
+
+def start_server(app: Starlette) -> tuple[uvicorn.Server, int]:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        port = sock.getsockname()[1]
+    server = uvicorn.Server(uvicorn.Config(app, port=port, log_level="warning"))
+    threading.Thread(target=server.run, daemon=True).start()
+    while not server.started:
+        time.sleep(0.01)
+    return server, port
+
+
+async def send_with_new_client(to: str):
+    async with httpx.AsyncClient() as client:
+        response = await client.post(
+            f"{config.MAILGUN_API_URL}/{config.MAILGUN_DOMAIN}/messages",
+            auth=("api", config.MAILGUN_API_KEY),
+            data={"from": "benchmark", "to": [to], "subject": "Benchmark", "text": "Benchmark"}
+        )
+        response.raise_for_status()
+
+
+async def send_with_shared_client(to: str):
+    await tasks.send_simple_email(to, "Benchmark", "Benchmark")
+
+
+async def run(send, emails: int, concurrency: int) -> float:
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def one(i: int):
+        async with semaphore:
+            await send(f"user{i}@example.com")
+
+    started = time.perf_counter()
+    await asyncio.gather(*(one(i) for i in range(emails)))
+    return emails / (time.perf_counter() - started)
+
+
+async def main(args):
+    server, port = start_server(fake_mailgun(args.latency))
+    config.MAILGUN_API_URL = f"http://127.0.0.1:{port}/v3"
+    config.MAILGUN_DOMAIN = "benchmark.example.com"
+    config.MAILGUN_API_KEY = "benchmark"
+
+    print(f"{'client':<22} {'emails/s':>10}")
+    print(f"{'new client per email':<22} {await run(send_with_new_client, args.emails, args.concurrency):>10.1f}")
+    print(f"{'shared pooled client':<22} {await run(send_with_shared_client, args.emails, args.concurrency):>10.1f}")
+
+    await tasks.close_http_client()
+    server.should_exit = True
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--emails", type=int, default=500)
+    parser.add_argument("--concurrency", type=int, default=20)
+    parser.add_argument("--latency", type=float, default=0.0, help="fake API latency in seconds")
+    asyncio.run(main(parser.parse_args()))
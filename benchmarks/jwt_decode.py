@@ -0,0 +1,44 @@
+"""Access token decode cost per JWT backend, with and without the claims cache.
+
+    python -m benchmarks.jwt_decode --iterations 20000
+"""
+import argparse
+import os
+import timeit
+
+os.environ.setdefault("ENV_STATE", "test")
+os.environ.setdefault("TEST_SECRET_KEY", "benchmark-secret-benchmark-secret")
+
+from api import security  # noqa: E402
+
+
+def main(args):
+    token = security.create_access_token("benchmark@example.com")
+    print(f"{'decoder':<16} {'us/decode':>10} {'decodes/s':>12}")
+
+    decoders = {}
+    for name in ("jose", "pyjwt"):
+        try:
+            _, decode = security.load_jwt_backend(name)
+        except ImportError:
+            print(f"{name:<16} skipped: not installed")
+            continue
+        decoders[name] = decode
+
+    for name, decode in decoders.items():
+        elapsed = timeit.timeit(
+            lambda: decode(token, security.SECRET_KEY, algorithms=[security.ALGORITHM]),
+            number=args.iterations
+        )
+        print(f"{name:<16} {elapsed / args.iterations * 1e6:>10.1f} {args.iterations / elapsed:>12.0f}")
+
+    security.token_cache.clear()
+    security.decode_token(token)
+    elapsed = timeit.timeit(lambda: security.decode_token(token), number=args.iterations)
+    print(f"{'cached':<16} {elapsed / args.iterations * 1e6:>10.1f} {args.iterations / elapsed:>12.0f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--iterations", type=int, default=20000)
+    main(parser.parse_args())
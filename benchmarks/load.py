@@ -0,0 +1,513 @@
+"""Throughput and latency of every post and user endpoint against a seeded dataset.
+
+`seed` builds a SQLite database of users, posts, comments and likes at one of
+the SCALES presets (10k, 1m or 10m posts). The dataset is generated from
+`--seed`, so every run of a preset gets the same rows. `run` drives each
+endpoint in ENDPOINTS `--requests` times, `--concurrency` at a time, either
+in-process through httpx's ASGITransport or against a uvicorn server started
+as a subprocess (`--mode server`, `--workers` processes). It reports requests/s
+(successful responses only) and p50/p95/p99 latency per endpoint and saves
+them, with the commit and settings, as JSON. `compare` reads two result files
+and flags every endpoint whose throughput dropped or whose p95/p99 rose by
+more than `--threshold`, and every endpoint of the current run that returned
+any errors. It exits with status 1 when anything regressed.
+
+Writes go through the real handlers, so runs change the dataset: likes
+toggle and new posts, comments and users accumulate. Reseed before comparing
+runs that must start from identical data. The database lives at `--database`
+(default load-benchmark.db in the working directory). The server runs in a
+temporary directory, so its api.log never lands in the checkout.
+
+    python -m benchmarks.load seed --scale 10k
+    python -m benchmarks.load run --mode asgi --requests 500 --output before.json
+    python -m benchmarks.load run --mode server --workers 2 --output after.json
+    python -m benchmarks.load compare before.json after.json --threshold 0.1
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import random
+import socket
+import sqlite3
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import uuid
+from dataclasses import dataclass
+from typing import Callable
+
+import httpx
+
+os.environ.setdefault("ENV_STATE", "test")
+ENV_PREFIX = os.environ["ENV_STATE"].upper()
+os.environ.setdefault(f"{ENV_PREFIX}_SECRET_KEY", "benchmark-secret-benchmark-secret")
+# writes must stick, the test config rolls every transaction back
+os.environ[f"{ENV_PREFIX}_DB_FORCE_ROLL_BACK"] = "false"
+# every request comes from one address; measure /token and /register, not 429s
+os.environ.setdefault(f"{ENV_PREFIX}_RATE_LIMIT_ENABLED", "false")
+
+PASSWORD = "benchmark-password"
+SEED_CHUNK_SIZE = 50_000
+
+
+@dataclass(frozen=True)
+class Scale:
+    users: int
+    posts: int
+    comments: int
+    likes: int
+
+
+SCALES = {
+    "10k": Scale(users=1_000, posts=10_000, comments=20_000, likes=20_000),
+    "1m": Scale(users=100_000, posts=1_000_000, comments=2_000_000, likes=2_000_000),
+    "10m": Scale(users=1_000_000, posts=10_000_000, comments=20_000_000, likes=20_000_000),
+}
+
+
+def database_url(path: str) -> str:
+    return f"sqlite:///{os.path.abspath(path)}"
+
+
+def email(user_id: int) -> str:
+    return f"user{user_id}@benchmark.test"
+
+
+def chunks(rows, size: int = SEED_CHUNK_SIZE):
+    chunk = []
+    for row in rows:
+        chunk.append(row)
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def seed(args):
+    os.environ[f"{ENV_PREFIX}_DATABASE_URL"] = database_url(args.database)
+    from api.database import engine
+    from api.migrations import migrate
+    from api.security import get_password_hash
+
+    scale = SCALES[args.scale]
+    if os.path.exists(args.database):
+        os.remove(args.database)
+    migrate(engine)
+    engine.dispose()
+
+    rng = random.Random(args.seed)
+    # one hash for everyone; at 1M users hashing each would take hours
+    hashed_password = get_password_hash(PASSWORD)
+    started = time.perf_counter()
+    connection = sqlite3.connect(args.database)
+    connection.execute("PRAGMA journal_mode = OFF")
+    connection.execute("PRAGMA synchronous = OFF")
+    tables = (
+        (
+            "users", "INSERT INTO users (id, email, password, confirmed) VALUES (?, ?, ?, 1)",
+            ((i, email(i), hashed_password) for i in range(1, scale.users + 1))
+        ),
+        (
+            "posts", "INSERT INTO posts (id, body, user_id, like_count) VALUES (?, ?, ?, 0)",
+            (
+                (i, f"Benchmark post {i}", rng.randint(1, scale.users))
+                for i in range(1, scale.posts + 1)
+            )
+        ),
+        (
+            "comments", "INSERT INTO comments (id, body, post_id, user_id) VALUES (?, ?, ?, ?)",
+            (
+                (i, f"Benchmark comment {i}", rng.randint(1, scale.posts), rng.randint(1, scale.users))
+                for i in range(1, scale.comments + 1)
+            )
+        ),
+        (
+            # duplicates of a (post, user) pair are dropped, so slightly fewer
+            "likes", "INSERT OR IGNORE INTO likes (post_id, user_id) VALUES (?, ?)",
+            (
+                (rng.randint(1, scale.posts), rng.randint(1, scale.users))
+                for _ in range(scale.likes)
+            )
+        ),
+    )
+    for table, statement, rows in tables:
+        for chunk in chunks(rows):
+            connection.executemany(statement, chunk)
+        connection.commit()
+        print(f"seeded {table:<9} {time.perf_counter() - started:8.1f}s")
+
+    connection.execute(
+        "UPDATE posts SET like_count = counts.likes FROM "
+        "(SELECT post_id, count(*) AS likes FROM likes GROUP BY post_id) AS counts "
+        "WHERE posts.id = counts.post_id"
+    )
+    connection.commit()
+    connection.execute("ANALYZE")
+    connection.close()
+    print(f"seeded {args.scale} dataset in {time.perf_counter() - started:.1f}s: {args.database}")
+
+
+@dataclass
+class Dataset:
+    users: int
+    posts: int
+    access_token: str
+    confirmation_token: str
+
+
+def read_dataset(path: str) -> Dataset:
+    from api.security import create_access_token, create_confirmation_token
+
+    if not os.path.exists(path):
+        raise SystemExit(f"{path} does not exist, run `python -m benchmarks.load seed` first")
+    connection = sqlite3.connect(path)
+    # only seeded users have a known password; /register adds others
+    users, posts = connection.execute(
+        "SELECT (SELECT max(id) FROM users WHERE email LIKE 'user%@benchmark.test'), "
+        "(SELECT max(id) FROM posts)"
+    ).fetchone()
+    connection.close()
+    return Dataset(
+        users=users,
+        posts=posts,
+        access_token=create_access_token(email(1)),
+        confirmation_token=create_confirmation_token(email(2)),
+    )
+
+
+@dataclass(frozen=True)
+class Endpoint:
+    name: str
+    method: str
+    # (dataset, rng, run id, request number) -> url and request kwargs
+    build: Callable
+
+
+def authorized(dataset: Dataset) -> dict:
+    return {"Authorization": f"Bearer {dataset.access_token}"}
+
+
+def recent_posts_cursor(dataset: Dataset) -> str:
+    from api.pagination import encode_cursor
+
+    # the stream has no limit; start it 100 posts from the end
+    return encode_cursor({"k": "new", "id": min(dataset.posts, 100) + 1})
+
+
+ENDPOINTS = [
+    Endpoint("GET /post/ new", "GET", lambda d, rng, run, i: ("/post/", {})),
+    Endpoint(
+        "GET /post/ most_liked", "GET",
+        lambda d, rng, run, i: ("/post/", {"params": {"sorting": "most_liked"}})
+    ),
+    Endpoint(
+        "GET /post/stream", "GET",
+        lambda d, rng, run, i: ("/post/stream", {"params": {"cursor": recent_posts_cursor(d)}})
+    ),
+    Endpoint(
+        "GET /post/search", "GET",
+        lambda d, rng, run, i: ("/post/search", {
+            "params": {"q": f"benchmark {rng.randint(1, d.posts)}"}
+        })
+    ),
+    Endpoint(
+        "GET /post/{post_id}", "GET",
+        lambda d, rng, run, i: (f"/post/{rng.randint(1, d.posts)}", {})
+    ),
+    Endpoint(
+        "GET /post/{post_id}/comment", "GET",
+        lambda d, rng, run, i: (f"/post/{rng.randint(1, d.posts)}/comment", {})
+    ),
+    *(
+        Endpoint(
+            f"GET /user/{{user_id}}/{listing}", "GET",
+            lambda d, rng, run, i, listing=listing: (
+                f"/user/{rng.randint(1, d.users)}/{listing}", {}
+            )
+        )
+        for listing in ("posts", "comments", "likes")
+    ),
+    Endpoint(
+        "POST /post/", "POST",
+        lambda d, rng, run, i: (
+            "/post/", {"json": {"body": f"Load post {run}-{i}"}, "headers": authorized(d)}
+        )
+    ),
+    Endpoint(
+        "POST /post/comment", "POST",
+        lambda d, rng, run, i: ("/post/comment", {
+            "json": {"body": f"Load comment {run}-{i}", "post_id": rng.randint(1, d.posts)},
+            "headers": authorized(d)
+        })
+    ),
+    Endpoint(
+        "POST /post/like", "POST",
+        lambda d, rng, run, i: ("/post/like", {
+            "json": {"post_id": rng.randint(1, d.posts)}, "headers": authorized(d)
+        })
+    ),
+    Endpoint(
+        "POST /register", "POST",
+        lambda d, rng, run, i: ("/register", {
+            "json": {"email": f"load-{run}-{i}@benchmark.test", "password": PASSWORD}
+        })
+    ),
+    Endpoint(
+        "POST /token", "POST",
+        lambda d, rng, run, i: ("/token", {
+            "json": {"email": email(rng.randint(1, d.users)), "password": PASSWORD}
+        })
+    ),
+    Endpoint(
+        "GET /confirm/{token}", "GET",
+        lambda d, rng, run, i: (f"/confirm/{d.confirmation_token}", {})
+    ),
+]
+
+
+def percentile(latencies: list[float], p: int) -> float:
+    if len(latencies) < 2:
+        return latencies[0] if latencies else 0.0
+    return statistics.quantiles(latencies, n=100, method="inclusive")[p - 1]
+
+
+async def drive(
+    client: httpx.AsyncClient, endpoint: Endpoint, dataset: Dataset, args, run_id: str
+) -> dict:
+    rng = random.Random(args.seed)
+    semaphore = asyncio.Semaphore(args.concurrency)
+    latencies = []
+    errors = 0
+
+    async def one(i: int):
+        nonlocal errors
+        url, kwargs = endpoint.build(dataset, rng, run_id, i)
+        async with semaphore:
+            started = time.perf_counter()
+            response = await client.request(endpoint.method, url, **kwargs)
+            latencies.append(time.perf_counter() - started)
+        if response.status_code >= 400:
+            errors += 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*(one(i) for i in range(args.requests)))
+    elapsed = time.perf_counter() - started
+    return {
+        "requests": args.requests,
+        "errors": errors,
+        # failed responses are often faster than real ones; don't count them
+        "rps": (args.requests - errors) / elapsed,
+        "p50": percentile(latencies, 50),
+        "p95": percentile(latencies, 95),
+        "p99": percentile(latencies, 99),
+    }
+
+
+async def drive_all(client: httpx.AsyncClient, dataset: Dataset, args) -> dict:
+    run_id = uuid.uuid4().hex[:8]
+    selected = [e for e in ENDPOINTS if not args.endpoint or e.name in args.endpoint]
+    results = {}
+    for endpoint in selected:
+        # warm up caches and connections without recording
+        for i in range(min(10, args.requests)):
+            url, kwargs = endpoint.build(dataset, random.Random(i), f"{run_id}-warm", i)
+            await client.request(endpoint.method, url, **kwargs)
+        results[endpoint.name] = await drive(client, endpoint, dataset, args, run_id)
+        print_result(endpoint.name, results[endpoint.name])
+    return results
+
+
+async def run_asgi(dataset: Dataset, args) -> dict:
+    from api.database import database
+    from api.main import app
+    from api.security import password_hasher
+
+    await database.connect()
+    try:
+        # a handler that raises is a 500 like in server mode, not an aborted run
+        transport = httpx.ASGITransport(app=app, raise_app_exceptions=False)
+        async with httpx.AsyncClient(transport=transport, base_url="http://benchmark") as client:
+            return await drive_all(client, dataset, args)
+    finally:
+        await database.disconnect()
+        password_hasher.shutdown()
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+async def wait_for_server(url: str, server: subprocess.Popen, timeout: float = 30):
+    deadline = time.perf_counter() + timeout
+    async with httpx.AsyncClient() as client:
+        while time.perf_counter() < deadline:
+            if server.poll() is not None:
+                raise SystemExit(f"uvicorn exited with status {server.returncode}")
+            try:
+                await client.get(f"{url}/openapi.json")
+                return
+            except httpx.TransportError:
+                await asyncio.sleep(0.1)
+    raise SystemExit(f"uvicorn did not start within {timeout}s")
+
+
+async def run_server(dataset: Dataset, args) -> dict:
+    port = free_port()
+    url = f"http://127.0.0.1:{port}"
+    command = [
+        sys.executable, "-m", "uvicorn", "api.main:app",
+        "--host", "127.0.0.1", "--port", str(port),
+        "--workers", str(args.workers), "--no-access-log", "--log-level", "warning",
+    ]
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    env = {**os.environ, "PYTHONPATH": root}
+    with tempfile.TemporaryDirectory() as directory:
+        # the server's console output would interleave with the results table
+        log_path = os.path.join(directory, "server.log")
+        with open(log_path, "w") as log:
+            server = subprocess.Popen(
+                command, cwd=directory, env=env, stdout=log, stderr=subprocess.STDOUT
+            )
+        try:
+            try:
+                await wait_for_server(url, server)
+            except SystemExit:
+                with open(log_path) as log:
+                    print(log.read(), file=sys.stderr)
+                raise
+            limits = httpx.Limits(max_connections=args.concurrency)
+            async with httpx.AsyncClient(base_url=url, limits=limits) as client:
+                return await drive_all(client, dataset, args)
+        finally:
+            server.terminate()
+            server.wait(timeout=30)
+
+
+def git_commit() -> str | None:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "HEAD"], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def print_result(name: str, result: dict):
+    print(
+        f"{name:<28} {result['rps']:>9.1f} {result['p50'] * 1000:>8.2f} "
+        f"{result['p95'] * 1000:>8.2f} {result['p99'] * 1000:>8.2f} {result['errors']:>7}"
+    )
+
+
+def run(args):
+    os.environ[f"{ENV_PREFIX}_DATABASE_URL"] = database_url(args.database)
+    dataset = read_dataset(args.database)
+    print(
+        f"{args.mode}: {dataset.posts} posts, {args.requests} requests per endpoint, "
+        f"concurrency {args.concurrency}"
+    )
+    print(f"{'endpoint':<28} {'req/s':>9} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'errors':>7}")
+    runner = run_server if args.mode == "server" else run_asgi
+    endpoints = asyncio.run(runner(dataset, args))
+
+    result = {
+        "commit": git_commit(),
+        "created_at": time.time(),
+        "python": platform.python_version(),
+        "mode": args.mode,
+        "workers": args.workers if args.mode == "server" else None,
+        "posts": dataset.posts,
+        "users": dataset.users,
+        "requests": args.requests,
+        "concurrency": args.concurrency,
+        "endpoints": endpoints,
+    }
+    output = args.output or f"load-{(result['commit'] or 'unknown')[:12]}-{args.mode}.json"
+    with open(output, "w") as f:
+        json.dump(result, f, indent=2)
+    print(f"saved {output}")
+
+
+def regressions(baseline: dict, current: dict, threshold: float) -> list[tuple[str, str, str]]:
+    found = []
+    for name, after in current["endpoints"].items():
+        # an endpoint that fails isn't measuring anything, whatever the baseline
+        if after["errors"]:
+            found.append((name, "errors", f"{after['errors']} of {after['requests']} requests"))
+        before = baseline["endpoints"].get(name)
+        if before is None:
+            continue
+        if before["rps"] and after["rps"] < before["rps"] * (1 - threshold):
+            found.append((name, "rps", f"{after['rps'] / before['rps'] - 1:+.1%}"))
+        for latency in ("p95", "p99"):
+            if before[latency] and after[latency] > before[latency] * (1 + threshold):
+                found.append((name, latency, f"{after[latency] / before[latency] - 1:+.1%}"))
+    return found
+
+
+def compare(args):
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+    with open(args.current) as f:
+        current = json.load(f)
+    for setting in ("mode", "workers", "posts", "concurrency"):
+        if baseline.get(setting) != current.get(setting):
+            print(f"warning: {setting} differs ({baseline.get(setting)} vs {current.get(setting)})")
+
+    print(f"{'endpoint':<28} {'req/s':>17} {'p95 ms':>17} {'p99 ms':>17}")
+    for name, before in baseline["endpoints"].items():
+        after = current["endpoints"].get(name)
+        if after is None:
+            continue
+        print(
+            f"{name:<28} {before['rps']:>8.1f}->{after['rps']:<8.1f}"
+            f" {before['p95'] * 1000:>8.2f}->{after['p95'] * 1000:<8.2f}"
+            f" {before['p99'] * 1000:>8.2f}->{after['p99'] * 1000:<8.2f}"
+        )
+
+    found = regressions(baseline, current, args.threshold)
+    for name, measure, change in found:
+        print(f"REGRESSION {name}: {measure} {change}")
+    if found:
+        raise SystemExit(1)
+    print(f"no regressions beyond {args.threshold:.0%}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    seed_parser = subparsers.add_parser("seed")
+    seed_parser.add_argument("--scale", choices=SCALES, default="10k")
+    seed_parser.add_argument("--database", default="load-benchmark.db")
+    seed_parser.add_argument("--seed", type=int, default=0)
+    seed_parser.set_defaults(handler=seed)
+
+    run_parser = subparsers.add_parser("run")
+    run_parser.add_argument("--mode", choices=("asgi", "server"), default="asgi")
+    run_parser.add_argument("--workers", type=int, default=1)
+    run_parser.add_argument("--database", default="load-benchmark.db")
+    run_parser.add_argument("--requests", type=int, default=500)
+    run_parser.add_argument("--concurrency", type=int, default=10)
+    run_parser.add_argument("--seed", type=int, default=0)
+    run_parser.add_argument(
+        "--endpoint", action="append", help="only this endpoint, e.g. 'GET /post/' (repeatable)"
+    )
+    run_parser.add_argument("--output")
+    run_parser.set_defaults(handler=run)
+
+    compare_parser = subparsers.add_parser("compare")
+    compare_parser.add_argument("baseline")
+    compare_parser.add_argument("current")
+    compare_parser.add_argument("--threshold", type=float, default=0.1)
+    compare_parser.set_defaults(handler=compare)
+
+    args = parser.parse_args()
+    args.handler(args)
@@ -0,0 +1,115 @@
+"""Request throughput with handlers attached directly vs behind the logging queue.
+
+Seeds `--posts` posts and drives GET /post/ in-process (httpx ASGITransport)
+`--requests` times, `--concurrency` at a time, with the `api` logger at INFO
+and at DEBUG. "direct" puts the console and rotating file handlers on the
+loggers, as before; "queued" is what configure_logging sets up now. Log
+output goes to the console handler (stderr; stdout for Rich) and to an
+api.log in a temporary directory, so redirect it to measure without a
+terminal, or leave it to include rendering cost. The drain column is how
+long the listener took to flush the queue at the end. Run with
+ENV_STATE=dev to get the Rich console handler.
+
+    python -m benchmarks.logging_throughput --requests 2000 2>/dev/null
+"""
+import argparse
+import asyncio
+import logging
+import os
+import tempfile
+import time
+
+import httpx
+from asgi_correlation_id import CorrelationIdFilter
+
+os.environ.setdefault("ENV_STATE", "test")
+directory = tempfile.mkdtemp()
+os.chdir(directory)
+os.environ.setdefault(
+    f"{os.environ['ENV_STATE'].upper()}_DATABASE_URL", f"sqlite:///{directory}/benchmark.db"
+)
+
+from api import logging_conf  # noqa: E402
+from api.database import database, engine, post_table, user_table  # noqa: E402
+from api.main import app  # noqa: E402
+from api.migrations import migrate  # noqa: E402
+
+
+def seed(posts: int):
+    migrate(engine)
+    with engine.begin() as connection:
+        connection.execute(post_table.delete())
+        connection.execute(user_table.delete())
+        user_id = connection.execute(
+            user_table.insert().values(email="benchmark@example.com", password="-", confirmed=True)
+        ).inserted_primary_key[0]
+        connection.execute(
+            post_table.insert(),
+            [{"body": f"Benchmark post {i}", "user_id": user_id} for i in range(posts)]
+        )
+
+
+def attach_directly():
+    # the pre-queue layout: every logger call runs the sink handlers inline
+    sinks = logging.getLogger(logging_conf.SINK_LOGGER).handlers
+    for handler in sinks:
+        handler.addFilter(CorrelationIdFilter(default_value="-"))
+    for name in ("api", "uvicorn"):
+        logger = logging.getLogger(name)
+        logger.handlers = list(sinks)
+
+
+async def drive(requests: int, concurrency: int) -> float:
+    semaphore = asyncio.Semaphore(concurrency)
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://benchmark") as client:
+
+        async def one():
+            async with semaphore:
+                response = await client.get("/post/")
+                response.raise_for_status()
+
+        started = time.perf_counter()
+        await asyncio.gather(*(one() for _ in range(requests)))
+        return requests / (time.perf_counter() - started)
+
+
+async def measure(mode: str, level: str, args) -> tuple[float, float]:
+    logging_conf.configure_logging()
+    if mode == "direct":
+        attach_directly()
+    else:
+        logging_conf.start_log_listener()
+    logging.getLogger("api").setLevel(level)
+
+    rps = await drive(args.requests, args.concurrency)
+
+    started = time.perf_counter()
+    logging_conf.stop_log_listener()
+    return rps, time.perf_counter() - started
+
+
+async def main(args):
+    seed(args.posts)
+    await database.connect()
+    try:
+        await drive(min(args.requests, 100), args.concurrency)  # warm up
+        results = [
+            (mode, level, *await measure(mode, level, args))
+            for level in ("INFO", "DEBUG")
+            for mode in ("direct", "queued")
+        ]
+    finally:
+        await database.disconnect()
+
+    print(f"{'mode':<8} {'level':<6} {'requests/s':>11} {'drain ms':>9}")
+    for mode, level, rps, drain in results:
+        print(f"{mode:<8} {level:<6} {rps:>11.0f} {drain * 1000:>9.1f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--posts", type=int, default=20)
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, default=10)
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,86 @@
+"""Login latency per password hashing configuration.
+
+Runs `--logins` password verifications per configuration, `--concurrency` at
+a time, through the same bounded PasswordHasher pool the API uses, and
+reports p50/p99 latency (queue wait included) and logins per second.
+
+    python -m benchmarks.password_hashing --logins 200 --concurrency 16
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import time
+
+os.environ.setdefault("ENV_STATE", "test")
+
+from passlib.exc import MissingBackendError  # noqa: E402
+
+from api.security import PasswordHasher, build_password_context  # noqa: E402
+
+CONFIGURATIONS = {
+    "bcrypt-10": dict(schemes=["bcrypt"], bcrypt_rounds=10),
+    "bcrypt-12": dict(schemes=["bcrypt"], bcrypt_rounds=12),
+    "argon2id-t2-m19MiB": dict(
+        schemes=["argon2", "bcrypt"], argon2_time_cost=2, argon2_memory_cost=19456
+    ),
+    "argon2id-t1-m46MiB": dict(
+        schemes=["argon2", "bcrypt"], argon2_time_cost=1, argon2_memory_cost=47104
+    ),
+}
+
+
+def percentile(samples: list[float], pct: float) -> float:
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+
+async def run_configuration(settings: dict, logins: int, concurrency: int, workers: int):
+    context = build_password_context(**{
+        "bcrypt_rounds": 12,
+        "argon2_time_cost": 2,
+        "argon2_memory_cost": 19456,
+        "argon2_parallelism": 1,
+        **settings
+    })
+    hashed_password = context.hash("correct horse battery staple")
+    hasher = PasswordHasher(max_workers=workers, max_pending=logins)
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies = []
+
+    async def login():
+        async with semaphore:
+            started = time.perf_counter()
+            assert await hasher.run(context.verify, "correct horse battery staple", hashed_password)
+            latencies.append(time.perf_counter() - started)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(login() for _ in range(logins)))
+    elapsed = time.perf_counter() - started
+    hasher.shutdown()
+    return latencies, elapsed
+
+
+async def main(args):
+    print(f"{'configuration':<22} {'p50 ms':>9} {'p99 ms':>9} {'mean ms':>9} {'logins/s':>9}")
+    for name, settings in CONFIGURATIONS.items():
+        try:
+            latencies, elapsed = await run_configuration(
+                settings, args.logins, args.concurrency, args.workers
+            )
+        except MissingBackendError as e:
+            print(f"{name:<22} skipped: {e}")
+            continue
+        print(
+            f"{name:<22} {percentile(latencies, 50) * 1000:>9.1f} "
+            f"{percentile(latencies, 99) * 1000:>9.1f} "
+            f"{statistics.mean(latencies) * 1000:>9.1f} {args.logins / elapsed:>9.1f}"
+        )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--logins", type=int, default=100)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--workers", type=int, default=4)
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,71 @@
+"""Response serialization cost for DB rows: response_model validation vs RowSerializer.
+
+Fetches `--rows` posts through `databases` (so the inputs are real Records)
+and times building the GET /post JSON body both ways.
+
+    python -m benchmarks.serialization --rows 10000
+"""
+import argparse
+import asyncio
+import json
+import os
+import tempfile
+import timeit
+
+import databases
+import sqlalchemy
+from pydantic import TypeAdapter
+
+os.environ.setdefault("ENV_STATE", "test")
+
+from api.database import metadata, post_table  # noqa: E402
+from api.models.post import UserPost  # noqa: E402
+from api.serialization import RowSerializer, json_response  # noqa: E402
+
+
+async def fetch_rows(url: str, count: int):
+    engine = sqlalchemy.create_engine(url)
+    metadata.create_all(engine)
+    with engine.begin() as connection:
+        connection.execute(
+            post_table.insert(),
+            [{"body": f"Benchmark post {i}", "user_id": 1} for i in range(count)]
+        )
+    database = databases.Database(url)
+    await database.connect()
+    rows = await database.fetch_all(post_table.select())
+    await database.disconnect()
+    return rows
+
+
+def main(args):
+    with tempfile.TemporaryDirectory() as directory:
+        rows = asyncio.run(fetch_rows(f"sqlite:///{directory}/benchmark.db", args.rows))
+
+    # what FastAPI does for response_model=list[UserPost]: validate every row
+    # from attributes, dump it back to JSON-compatible data, then json.dumps
+    adapter = TypeAdapter(list[UserPost])
+
+    def validated():
+        return json.dumps(adapter.dump_python(
+            adapter.validate_python(rows, from_attributes=True), mode="json"
+        )).encode()
+
+    serializer = RowSerializer(UserPost)
+
+    def projected():
+        return json_response(serializer.dump_many(rows)).body
+
+    assert json.loads(validated()) == json.loads(projected())
+
+    print(f"{'path':<16} {'ms/response':>12} {'rows/s':>12}")
+    for name, build in (("response_model", validated), ("RowSerializer", projected)):
+        elapsed = timeit.timeit(build, number=args.repeat) / args.repeat
+        print(f"{name:<16} {elapsed * 1000:>12.2f} {args.rows / elapsed:>12.0f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", type=int, default=10000)
+    parser.add_argument("--repeat", type=int, default=10)
+    main(parser.parse_args())
@@ -0,0 +1,118 @@
+"""Per-request statement CPU: building and compiling Core constructs vs the statement registry.
+
+Replays the statements a mix of requests executes (GET /post/ in every sort
+order, GET /post/{id}, POST /post/like, and the user lookup behind
+authentication) through the same compile step `databases` runs before every
+execution, without touching the database. "built" constructs the query per
+request as the routers used to; "registry" binds values to the prebuilt
+statements in api.statements. Both paths run under cProfile; pass --top to
+print where the time goes.
+
+    python -m benchmarks.statement_cache --requests 2000 --top 10
+"""
+import argparse
+import cProfile
+import os
+import pstats
+import time
+
+import sqlalchemy
+from databases.backends.sqlite import SQLiteBackend
+from sqlalchemy.dialects import sqlite
+
+os.environ.setdefault("ENV_STATE", "test")
+
+from api import statements  # noqa: E402
+from api.database import comment_table, like_table, post_table, user_table  # noqa: E402
+
+
+def built_request_mix(i: int) -> list:
+    like_key = (like_table.c.post_id == i) & (like_table.c.user_id == 1)
+    select_post_and_likes = sqlalchemy.select(post_table, post_table.c.like_count.label("likes"))
+    comment_join = (comment_table.c.post_id == post_table.c.id) & (comment_table.c.id > i)
+    return [
+        user_table.select().where(user_table.c.email == f"user{i}@example.com"),
+        post_table.select().order_by(post_table.c.id.desc()).where(post_table.c.id < i).limit(21),
+        post_table.select().order_by(post_table.c.id.asc()).where(post_table.c.id > i).limit(21),
+        select_post_and_likes.order_by(post_table.c.like_count.desc(), post_table.c.id.desc())
+        .where(
+            sqlalchemy.tuple_(post_table.c.like_count, post_table.c.id) <
+            sqlalchemy.tuple_(3, i)
+        ).limit(21),
+        sqlalchemy.select(
+            post_table.c.id,
+            post_table.c.body,
+            post_table.c.user_id,
+            post_table.c.like_count.label("likes"),
+            comment_table.c.id.label("comment_id"),
+            comment_table.c.body.label("comment_body"),
+            comment_table.c.user_id.label("comment_user_id")
+        )
+        .select_from(post_table.outerjoin(comment_table, comment_join))
+        .where(post_table.c.id == i)
+        .order_by(comment_table.c.id)
+        .limit(21),
+        post_table.select().where(post_table.c.id == i),
+        like_table.delete().where(like_key).returning(like_table.c.id),
+        sqlite.insert(like_table).values(post_id=i, user_id=1)
+        .on_conflict_do_nothing().returning(like_table.c.id),
+        post_table.update().where(post_table.c.id == i).values(
+            like_count=post_table.c.like_count + 1,
+            version=post_table.c.version + 1,
+            updated_at=statements.now
+        ),
+    ]
+
+
+def registry_request_mix(i: int) -> list:
+    like_key = {"post_id": i, "user_id": 1}
+    return [
+        statements.find_user_by_email(email=f"user{i}@example.com"),
+        statements.sorted_posts[("new", True, True)](last_id=i, limit=21),
+        statements.sorted_posts[("old", True, True)](last_id=i, limit=21),
+        statements.sorted_posts[("most_liked", True, True)](last_likes=3, last_id=i, limit=21),
+        statements.post_with_comments[True](post_id=i, last_comment_id=i, limit=21),
+        statements.find_post(post_id=i),
+        statements.delete_like(**like_key),
+        statements.insert_like(**like_key),
+        statements.update_like_count(post_id=i, delta=1),
+    ]
+
+
+def run(request_mix, connection, requests: int):
+    for i in range(requests):
+        for query in request_mix(i):
+            connection._compile(query)
+
+
+def main(args):
+    connection = SQLiteBackend("sqlite:///:memory:").connection()
+    # both paths must hand the driver the same SQL and arguments
+    for built, bound in zip(built_request_mix(7), registry_request_mix(7)):
+        built_sql, built_args, *_ = connection._compile(built)
+        bound_sql, bound_args, *_ = connection._compile(bound)
+        assert " ".join(built_sql.split()) == " ".join(bound_sql.split()), (built_sql, bound_sql)
+        assert built_args == bound_args, (built_args, bound_args)
+
+    statements_per_request = len(registry_request_mix(0))
+    print(f"{statements_per_request} statements per request mix, {args.requests} mixes")
+    print(f"{'path':<9} {'us/mix':>9} {'calls/mix':>10}")
+    for name, request_mix in (("built", built_request_mix), ("registry", registry_request_mix)):
+        run(request_mix, connection, 50)  # warm up
+        started = time.perf_counter()
+        run(request_mix, connection, args.requests)
+        elapsed = time.perf_counter() - started
+
+        profiler = cProfile.Profile()
+        profiler.runcall(run, request_mix, connection, args.requests)
+        stats = pstats.Stats(profiler)
+        print(f"{name:<9} {elapsed / args.requests * 1e6:>9.1f} {stats.total_calls / args.requests:>10.0f}")
+        if args.top:
+            stats.sort_stats("cumulative").print_stats(args.top)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--top", type=int, default=0)
+    main(parser.parse_args())